@@ -32,7 +32,7 @@ from pathlib import Path
 
 import stripe
 from flask import Flask, current_app, render_template, request, session
-from flask_login import AnonymousUserMixin, current_user, LoginManager
+from flask_login import AnonymousUserMixin, LoginManager
 from flask_mail import Mail
 from flask_sqlalchemy import SQLAlchemy
 from inflection import pluralize
@@ -40,7 +40,9 @@ from slugify import slugify
 from sqlalchemy_searchable import make_searchable
 
 from config import CONFIG
+from .page_cache import PageCache
 from .pending import Pending
+from .query_stats import QueryStats
 from .redirects import RedirectsFile
 
 
@@ -95,18 +97,48 @@ def list_to_english(items, last_delimiter=', and '):
         return items.pop()
 
 
+# Parsed nav data for each nav data file, formatted:
+#   {<path>: (<version of file>, <nav data>), ...}
+_nav_data_cache = {}
+
+
 def load_nav_data(json_file=None):
+    """Load the navigation data saved by `save_nav_data`.
+
+    The parsed data is kept for the life of the process, and the file is only
+    read again once its version changes. The version is taken from the file's
+    inode, size, and modification time, so replacing the file or writing to
+    it both cause it to be reloaded.
+
+    Args:
+        json_file: Optional path to the nav data file. Defaults to
+            `nav_data.json` in `DATA_FOLDER`.
+
+    Returns:
+        list: The navigation data, or an empty list if there is no file.
+    """
     if not json_file:
         json_file = Path(
             current_app.config.get('DATA_FOLDER'), 'nav_data.json'
         )
     else:
         json_file = Path(json_file)
+    key = str(json_file)
+    try:
+        st = json_file.stat()
+    except FileNotFoundError:
+        _nav_data_cache.pop(key, None)
+        return []
+    version = (st.st_ino, st.st_size, st.st_mtime_ns)
+    cached = _nav_data_cache.get(key)
+    if cached and cached[0] == version:
+        return cached[1]
     try:
         with json_file.open('r', encoding='utf-8') as ifile:
             items = json.loads(ifile.read())
     except FileNotFoundError:
-        items = []
+        return []
+    _nav_data_cache[key] = (version, items)
     return items
 
 
@@ -188,6 +220,8 @@ class Anonymous(AnonymousUserMixin):
 db = SQLAlchemy()
 make_searchable(options={'remove_symbols': '@"<>-'})
 mail = Mail()
+page_cache = PageCache()
+query_stats = QueryStats()
 
 
 login_manager = LoginManager()
@@ -215,16 +249,22 @@ def create_app(config_name):
     db.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)
+    page_cache.init_app(app)
+    query_stats.init_app(app)
 
     from .auth import auth as auth_blueprint
+    from .server_session import ServerSessionInterface
     from .seeds import seeds as seeds_blueprint
     from .shop import shop as shop_blueprint
-    from .shop.models import Order
+    from .shop.models import cart_summary
 
     app.register_blueprint(auth_blueprint, url_prefix='/auth')
     app.register_blueprint(seeds_blueprint)
     app.register_blueprint(shop_blueprint, url_prefix='/shop')
 
+    if app.config.get('SERVER_SESSIONS'):
+        app.session_interface = ServerSessionInterface()
+
     stripe.api_key = app.config.get('STRIPE_SECRET_KEY')
 
     ship_date = format_ship_date(get_ship_date())
@@ -242,11 +282,7 @@ def create_app(config_name):
         pending.save()
 
     def sum_cart_items():
-        o = Order.load(current_user)
-        try:
-            return o.number_of_items
-        except:
-            return 0
+        return cart_summary()['items']
 
     # Make things available to Jinja
     app.add_template_global(ship_date, 'ship_date')
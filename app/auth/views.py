@@ -32,6 +32,7 @@ from flask_login import (
 )
 from app import db, Permission
 from app.decorators import permission_required
+from app.server_session import rotate_session_id
 from . import auth
 from .forms import (
     DeleteUserForm,
@@ -226,6 +227,7 @@ def login():
                 if form.remember_me.data:  # pragma: no cover
                     remember = True
                 if(login_user(user, remember=remember)):
+                    rotate_session_id()
                     flash('You are now logged in, {0}.'.format(user.name))
                     return redirect(request.args.get('origin') or
                                     url_for('main.index'))
@@ -253,6 +255,7 @@ def logout():
                   main.index if no page specified by origin.
     """
     logout_user()
+    rotate_session_id()
     flash('You have been logged out.')
     return redirect(request.values.get('origin') or url_for('main.index'))
 
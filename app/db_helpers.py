@@ -23,9 +23,17 @@ This module contains helper classes and functions for use with database
 models.
 """
 
+import hashlib
+import os
 import re
+import time
+from contextlib import contextmanager
 from decimal import Decimal, ROUND_DOWN
 
+from flask import current_app
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import joinedload, subqueryload
 from titlecase import titlecase
 
 from app import db
@@ -89,6 +97,64 @@ def dbify(string):
         return None
 
 
+def eager_load(model, path):
+    """Create a loader option to eagerly load a chain of relationships.
+
+    Collections are loaded with `subqueryload` and single objects with
+    `joinedload`, so each step of the chain costs at most one query no matter
+    how many rows are loaded.
+
+    Args:
+        model: The model class the chain starts from.
+        path: A dotted path of relationship names, e.g.
+            'cultivars.packets' or 'gw_cultivars.common_name.index'.
+
+    Returns:
+        A loader option to pass to `Query.options`.
+    """
+    option = None
+    for key in path.split('.'):
+        rel = inspect(model).relationships[key]
+        strategy = 'subqueryload' if rel.uselist else 'joinedload'
+        if option is None:
+            option = (subqueryload if rel.uselist else joinedload)(key)
+        else:
+            option = getattr(option, strategy)(key)
+        model = rel.mapper.class_
+    return option
+
+
+def last_modified(*queries):
+    """Find when rows selected by any of `queries` were last changed.
+
+    All queries are sent to the database as a single statement.
+
+    Args:
+        *queries: Queries for models using `TimestampMixin`, such as
+            `Cultivar.query.filter(Cultivar.common_name_id == 1)`.
+
+    Returns:
+        tuple: The latest `updated_on` or `created_on` of the rows, or None
+            if there are no rows, and a hash of the sorted ids of the rows
+            selected by each query. Including the hash means removing a row,
+            or swapping it for another, counts as a change, such as when a
+            row of a many-to-many table is changed.
+    """
+    stmts = []
+    for i, query in enumerate(queries):
+        model = query.column_descriptions[0]['entity']
+        stmts.append(query.with_entities(
+            db.literal_column(str(i)),
+            model.id,
+            db.func.coalesce(model.updated_on, model.created_on)
+        ))
+    rows = stmts[0].union_all(*stmts[1:]).all()
+    changes = [r[2] for r in rows if r[2] is not None]
+    ids = sorted((r[0], r[1]) for r in rows)
+    return (max(changes) if changes else None,
+            hashlib.sha1(repr(ids).encode('utf-8')).hexdigest())
+
+
 def row_exists(col, value):
     """Check to see if a given row exists in a table.
 
@@ -103,6 +169,144 @@ def row_exists(col, value):
     return db.session.query(db.exists().where(col == value)).scalar()
 
 
+@contextmanager
+def keep_loaded_on_commit():
+    """Keep objects in the session loaded after commits made in the block.
+
+    Normally a commit expires every object in the session, so each one is
+    loaded again with its own query the next time it is used. Jobs that
+    commit in batches and keep using the same objects can use this to avoid
+    reloading them.
+    """
+    session = db.session()
+    expire_on_commit = session.expire_on_commit
+    session.expire_on_commit = False
+    try:
+        yield session
+    finally:
+        session.expire_on_commit = expire_on_commit
+
+
+def session_changes(session):
+    """Get the changes made to objects in the current transaction.
+
+    The session is flushed first, so changes that haven't been flushed yet are
+    included.
+
+    Args:
+        session: The session to get changes from.
+
+    Returns:
+        list: A list of tuples formatted (<object>, <operation>, <keys>), where
+            operation is 'insert', 'update', or 'delete', and keys is a set
+            containing the names of the attributes changed.
+    """
+    session.flush()
+    return list(session.info.get('changes', {}).values())
+
+
+def on_commit(key, find, apply):
+    """Act on the changes made by each commit once it has succeeded.
+
+    Changes are found before the commit, as objects are expired and can't be
+    loaded after it, and kept in `session.info` under `key` until the commit
+    succeeds. They are dropped if it fails. Savepoints are ignored.
+
+    Args:
+        key: The key to keep what `find` returns under in `session.info`.
+        find: A function which takes a list of changes as returned by
+            `session_changes`, and returns what to pass to `apply`, or None
+            if there is nothing to do.
+        apply: A function to call with what `find` returned after the
+            commit.
+    """
+    @event.listens_for(SignallingSession, 'before_commit')
+    def find_changes_before_commit(session):
+        if session.transaction.nested:
+            return
+        found = find(session_changes(session))
+        if found is not None:
+            session.info[key] = found
+
+    @event.listens_for(SignallingSession, 'after_commit')
+    def apply_changes_after_commit(session):
+        if not session.transaction.nested and key in session.info:
+            apply(session.info.pop(key))
+
+    @event.listens_for(SignallingSession, 'after_rollback')
+    def forget_changes_after_rollback(session):
+        if not session.transaction.nested:
+            session.info.pop(key, None)
+
+
+class StampFile(object):
+    """A file in `DATA_FOLDER` used to mark data kept by each process stale.
+
+    Each process keeps its own copy of the data. The process that changes it
+    writes to the stamp file, and other processes load their copy again when
+    they see the file's modification time has changed.
+
+    Attributes:
+        filename (str): The name of the file in `DATA_FOLDER`.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__, self.filename)
+
+    @property
+    def path(self):
+        return os.path.join(current_app.config.get('DATA_FOLDER'),
+                            self.filename)
+
+    def version(self):
+        """Get the version of the file, or None if it doesn't exist."""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def touch(self):
+        """Mark the data stale in every process."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'w', encoding='utf-8') as ofile:
+            ofile.write(str(time.time()))
+
+
+class StampedCache(object):
+    """Data kept for the life of the process, until a `StampFile` changes.
+
+    Attributes:
+        stamp (StampFile): The file marking the data stale.
+        load: A function which loads the data.
+        data: The loaded data, or None if it needs to be loaded.
+        version: The version of the stamp file it was loaded with.
+    """
+    def __init__(self, filename, load):
+        self.stamp = StampFile(filename)
+        self.load = load
+        self.data = None
+        self.version = None
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__,
+                                  self.stamp.filename)
+
+    def get(self):
+        """Get the current data, loading it if needed."""
+        version = self.stamp.version()
+        if self.data is None or version != self.version:
+            self.data = self.load()
+            self.version = version
+        return self.data
+
+    def touch(self):
+        """Drop the loaded data in every process."""
+        self.data = None
+        self.stamp.touch()
+
+
 class TimestampMixin(object):
     """A mixin for classes that would benefit from tracking modifications.
 
@@ -311,3 +515,32 @@ class USDollar(db.TypeDecorator):
             250
         """
         return (int(USDollar.usd_to_decimal(usd) * 100))
+
+
+@event.listens_for(SignallingSession, 'after_flush')
+def record_changes_after_flush(session, flush_context):
+    """Record objects changed by a flush so they can be used on commit."""
+    changes = session.info.setdefault('changes', {})
+    for operation, objs in (('insert', session.new),
+                            ('update', session.dirty),
+                            ('delete', session.deleted)):
+        for obj in objs:
+            if operation == 'update' and not session.is_modified(obj):
+                continue
+            keys = set(
+                a.key for a in inspect(obj).attrs if a.history.has_changes()
+            )
+            if id(obj) in changes:
+                prev_op, prev_keys = changes[id(obj)][1:]
+                if prev_op != 'update':
+                    operation = prev_op if operation != 'delete' else operation
+                keys |= prev_keys
+            changes[id(obj)] = (obj, operation, keys)
+
+
+@event.listens_for(SignallingSession, 'after_commit')
+@event.listens_for(SignallingSession, 'after_rollback')
+def clear_changes_after_transaction(session):
+    """Forget recorded changes once the outermost transaction ends."""
+    if session.transaction is None or not session.transaction.nested:
+        session.info.pop('changes', None)
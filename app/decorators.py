@@ -16,9 +16,15 @@
 # Copyright Swallowtail Garden Seeds, Inc
 
 
+import datetime
+import hashlib
+import os
 from functools import wraps
-from flask import abort, current_app
+from flask import abort, current_app, make_response, request, session
 from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+from app.page_cache import page_key
 
 
 def permission_required(permission):
@@ -38,3 +44,115 @@ def permission_required(permission):
             return f(*args, **kwargs)
         return decorated_function
     return decorator
+
+
+def auth_state():
+    """str: Who the current user is and what they are allowed to do."""
+    if current_user.is_anonymous:
+        return 'anonymous'
+    return '{0}:{1}:{2}'.format(current_user.id,
+                                current_user.name,
+                                current_user.permissions)
+
+
+_site_seen = {}
+
+
+def site_version():
+    """Get the version of the nav data and ship date, shown on every page.
+
+    Returns:
+        tuple: A string which changes when the nav data or ship date change,
+            and the time in UTC this process first saw that version.
+    """
+    nav_file = os.path.join(current_app.config.get('DATA_FOLDER'),
+                            'nav_data.json')
+    try:
+        nav_version = os.stat(nav_file).st_mtime_ns
+    except OSError:
+        nav_version = None
+    version = '{0}|{1}'.format(nav_version,
+                               current_app.jinja_env.globals.get('ship_date'))
+    if version not in _site_seen:
+        _site_seen.clear()
+        _site_seen[version] = datetime.datetime.utcnow().replace(
+            microsecond=0
+        )
+    return version, _site_seen[version]
+
+
+def conditional(validator, cache=None):
+    """Answer conditional GET requests without rendering unchanged pages.
+
+    Pages get `ETag` and `Last-Modified` headers derived from `validator`,
+    and a 304 response is sent if the client's copy is still current. The
+    `ETag` also covers the nav data and ship date, as they are shown on every
+    page, and who is logged in and what they are allowed to do, as pages show
+    admin controls and login state. `Last-Modified` covers the nav data and
+    ship date too, but can't cover logging in or out, so it is not used for
+    logged in users. Pages are marked private and vary by cookie, so shared
+    caches don't store them and browsers don't reuse them after logging in
+    or out.
+
+    Args:
+        validator: A function which takes the arguments of the view and
+            returns a tuple of the time the data shown on the page was last
+            changed and a hash of the rows it was taken from, as returned by
+            `app.db_helpers.last_modified`.
+        cache: Optional `PageCache` the view is cached in. The result of
+            `validator` is stored with each cached page, so `validator` is
+            only run when the page isn't cached.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET' or session.get('_flashes'):
+                response = make_response(f(*args, **kwargs))
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response
+            key = None
+            validators = None
+            if cache is not None and cache.cacheable():
+                cache.sync()
+                key = page_key(request.endpoint, **kwargs)
+                validators = cache.get_validators(key)
+                generation = cache.generation
+            if validators is None:
+                validators = validator(*args, **kwargs)
+            else:
+                key = None
+            changed, rows = validators
+            if changed is None:
+                return f(*args, **kwargs)
+            site, site_changed = site_version()
+            etag = hashlib.sha1('{0}|{1}|{2}|{3}'.format(
+                changed.isoformat(),
+                rows,
+                site,
+                auth_state()
+            ).encode('utf-8')).hexdigest()
+            if current_user.is_authenticated:
+                changed = None
+            else:
+                changed = max(changed, site_changed)
+            if is_resource_modified(request.environ,
+                                    etag=etag,
+                                    last_modified=changed):
+                response = make_response(f(*args, **kwargs))
+                # Skip storing if pages were dropped while rendering, as the
+                # cached page may be newer than the validators.
+                if key is not None and cache.generation == generation:
+                    cache.set_validators(key, validators)
+            else:
+                response = current_app.response_class(status=304)
+            response.set_etag(etag)
+            if changed is not None:
+                response.last_modified = changed
+            response.cache_control.private = True
+            response.vary.add('Cookie')
+            response.cache_control.max_age = \
+                current_app.config.get('PAGE_MAX_AGE')
+            return response
+        return decorated_function
+    return decorator
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.page_cache
+
+This module contains a cache for fully rendered pages, so pages that rarely
+change don't need to be rebuilt from the database on every request.
+"""
+
+import json
+import os
+from functools import wraps
+
+from flask import current_app, request, session
+from flask_login import current_user
+
+
+def page_key(endpoint, **kwargs):
+    """Return a hashable key for a page.
+
+    A key made with only some of the arguments of an endpoint matches every
+    page at that endpoint with those arguments, e.g.
+    `page_key('seeds.cultivar', idx_slug='annual', cn_slug='zinnia')` matches
+    the pages of all cultivars under Annual Zinnia.
+
+    Args:
+        endpoint: The endpoint of the view that renders the page.
+        **kwargs: The view arguments used to render the page.
+    """
+    return (endpoint, tuple(sorted(kwargs.items())))
+
+
+class PageCache(object):
+    """Store rendered pages in memory and drop them when their data changes.
+
+    Each worker process has its own `PageCache`, so invalidations are also
+    appended to a log file shared by all workers, and each worker replays any
+    new lines in the log before serving a page from its cache.
+
+    Attributes:
+        generation (int): A count of invalidations applied in this process,
+            used to tell if a page may have been dropped while rendering.
+        log_file (str): The file invalidations are shared through.
+        max_log_size (int): Size in bytes after which the log is emptied.
+        pages (dict): Rendered pages, formatted:
+            {<page key>: {<variant>: {'html': <html>,
+                                      'validators': <validators>}, ...}, ...}
+            where validators are set by `app.decorators.conditional`.
+    """
+    def __init__(self, app=None):
+        self.generation = 0
+        self.log_file = None
+        self.max_log_size = 1024 * 1024
+        self.pages = {}
+        self._log_offset = 0
+        if app is not None:
+            self.init_app(app)
+
+    def __repr__(self):
+        return '<{0} with {1} pages>'.format(self.__class__.__name__,
+                                             len(self.pages))
+
+    @property
+    def enabled(self):
+        """bool: Whether or not `CACHE_PAGES` is set in the app config."""
+        return bool(current_app.config.get('CACHE_PAGES'))
+
+    @staticmethod
+    def variant():
+        """Return the version of the current page the current user sees.
+
+        Only pages for anonymous users are cached, as pages show the name
+        and login state of logged in users, so pages only vary by host.
+        """
+        return request.host
+
+    def cacheable(self):
+        """Return whether the page for the current request may be cached.
+
+        Pages are not cached for requests with query strings, when there
+        are flashed messages waiting to be shown, or for logged in users,
+        whose pages show their name and admin controls.
+        """
+        return (self.enabled and request.method == 'GET' and
+                not request.args and not session.get('_flashes') and
+                not current_user.is_authenticated)
+
+    def init_app(self, app):
+        """Set up the log file using the data folder of `app`."""
+        self.log_file = os.path.join(
+            app.config.get('DATA_FOLDER'), 'page_cache.log'
+        )
+        self.pages = {}
+        self._log_offset = self._log_size()
+
+    def _log_size(self):
+        try:
+            return os.path.getsize(self.log_file)
+        except (OSError, TypeError):
+            return 0
+
+    def _drop(self, keys):
+        """Remove pages matching any of `keys` from this process."""
+        self.generation += 1
+        for endpoint, args in keys:
+            args = set(args)
+            for key in list(self.pages):
+                if key[0] == endpoint and args.issubset(key[1]):
+                    del self.pages[key]
+
+    def _write_log(self, entry):
+        """Append `entry` to the log so other processes can apply it."""
+        if not self.log_file:
+            return
+        if self._log_size() > self.max_log_size:
+            # Other processes will see the log shrink and clear their caches.
+            open(self.log_file, 'w').close()
+        else:
+            os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+            with open(self.log_file, 'a', encoding='utf-8') as ofile:
+                ofile.write(json.dumps(entry) + '\n')
+
+    def sync(self):
+        """Apply invalidations logged by other processes since last sync."""
+        size = self._log_size()
+        if size < self._log_offset:
+            self.pages.clear()
+            self.generation += 1
+            self._log_offset = size
+        elif size > self._log_offset:
+            with open(self.log_file, 'r', encoding='utf-8') as ifile:
+                ifile.seek(self._log_offset)
+                data = ifile.read(size - self._log_offset)
+            # Only use complete lines, a write may still be in progress.
+            data = data[:data.rfind('\n') + 1]
+            self._log_offset += len(data.encode('utf-8'))
+            for line in data.splitlines():
+                entry = json.loads(line)
+                if entry == '*':
+                    self.pages.clear()
+                    self.generation += 1
+                else:
+                    self._drop(
+                        (e, tuple(tuple(a) for a in args))
+                        for e, args in entry
+                    )
+
+    def _entry(self, key):
+        return self.pages.get(key, {}).get(self.variant())
+
+    def get(self, key):
+        """Return the cached html of page `key` for the current user."""
+        entry = self._entry(key)
+        return entry['html'] if entry else None
+
+    def set(self, key, html):
+        """Cache `html` as page `key` for the current user."""
+        self.pages.setdefault(key, {})[self.variant()] = {'html': html,
+                                                          'validators': None}
+
+    def get_validators(self, key):
+        """Return the validators stored with page `key`, if any."""
+        entry = self._entry(key)
+        return entry['validators'] if entry else None
+
+    def set_validators(self, key, validators):
+        """Store `validators` with page `key` if it is cached.
+
+        Args:
+            key: The key of a page cached with `set`.
+            validators: The result of the validator used to render the page,
+                so it doesn't need to be run again while the page is cached.
+        """
+        entry = self._entry(key)
+        if entry:
+            entry['validators'] = validators
+
+    def invalidate(self, keys):
+        """Drop all pages matching `keys` in all processes.
+
+        Args:
+            keys: An iterable of keys generated by `page_key`.
+        """
+        keys = list(keys)
+        if keys and self.enabled:
+            self._drop(keys)
+            self._write_log(keys)
+
+    def clear(self):
+        """Drop all cached pages in all processes."""
+        if self.enabled:
+            self.pages.clear()
+            self.generation += 1
+            self._write_log('*')
+
+    def cached(self, view):
+        """Decorate a view so the pages it renders are cached.
+
+        See `cacheable` for which pages are cached.
+        """
+        @wraps(view)
+        def decorated_view(**kwargs):
+            if not self.cacheable():
+                return view(**kwargs)
+            self.sync()
+            key = page_key(request.endpoint, **kwargs)
+            html = self.get(key)
+            if html is None:
+                html = view(**kwargs)
+                if isinstance(html, str):
+                    self.set(key, html)
+            return html
+        return decorated_view
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.query_stats
+
+This module contains tools for measuring the SQL queries run while handling
+each request, so slow pages and N+1 query patterns can be found.
+"""
+
+import json
+import re
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+def statement_shape(statement):
+    """Get the shape of a SQL statement, ignoring whitespace and literals.
+
+    Statements run by the ORM use bound parameters, so statements that only
+    differ in their parameters, such as lazy loads of the same relationship
+    for different rows, have the same shape.
+    """
+    shape = re.sub(r'\s+', ' ', statement).strip()
+    shape = re.sub(r"'[^']*'", '?', shape)
+    return re.sub(r'\b\d+\b', '?', shape)
+
+
+class RequestQueries(object):
+    """Queries run during a single request.
+
+    Attributes:
+        count (int): The number of queries run.
+        duration (float): Total time spent running queries, in seconds.
+        shapes (Counter): Number of times each statement shape was run.
+    """
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __repr__(self):
+        return '<{0} count: {1}, time: {2:.1f}ms>'.format(
+            self.__class__.__name__, self.count, self.duration * 1000
+        )
+
+    def add(self, statement, duration):
+        """Record a query taking `duration` seconds to run."""
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold):
+        """Get statement shapes run at least `threshold` times.
+
+        Returns:
+            list: Tuples formatted (<shape>, <times run>), most run first.
+        """
+        return [(s, n) for s, n in self.shapes.most_common() if n >= threshold]
+
+
+class QueryStats(object):
+    """Count SQL queries per request and report them.
+
+    When `QUERY_STATS` is set in the app config, each response gets an
+    `X-Query-Stats` header, and a JSON log line is written with the endpoint,
+    query count, time spent in the database, and any statements repeated at
+    least `QUERY_STATS_REPEAT_THRESHOLD` times, which usually means a
+    relationship is being lazy loaded in a loop. Each likely N+1 pattern is
+    also logged as a warning the first time it is seen for an endpoint.
+
+    Attributes:
+        flagged (dict): Statement shapes already reported as likely N+1
+            patterns, formatted: {<endpoint>: {<shape>, ...}, ...}
+    """
+    def __init__(self, app=None):
+        self.flagged = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Register request hooks on `app`."""
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    @staticmethod
+    def start_request():
+        if current_app.config.get('QUERY_STATS'):
+            g.queries = RequestQueries()
+
+    def finish_request(self, response):
+        queries = g.pop('queries', None)
+        if queries is None:
+            return response
+        threshold = current_app.config.get('QUERY_STATS_REPEAT_THRESHOLD')
+        repeated = queries.repeated(threshold)
+        stats = 'count={0}; time={1:.1f}ms; repeated={2}'.format(
+            queries.count, queries.duration * 1000, len(repeated)
+        )
+        response.headers['X-Query-Stats'] = stats
+        current_app.logger.info(json.dumps({
+            'event': 'query_stats',
+            'endpoint': request.endpoint,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': queries.count,
+            'db_ms': round(queries.duration * 1000, 1),
+            'repeated': [{'statement': s, 'count': n} for s, n in repeated]
+        }))
+        flagged = self.flagged.setdefault(request.endpoint, set())
+        for shape, count in repeated:
+            if shape not in flagged:
+                flagged.add(shape)
+                current_app.logger.warning(
+                    'Possible N+1 query in {0}: statement run {1} times in '
+                    'one request: {2}'.format(request.endpoint, count, shape)
+                )
+        return response
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_query_timer(conn, cursor, statement, parameters, context,
+                      executemany):
+    conn.info.setdefault('query_start_time', []).append(time.time())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_query(conn, cursor, statement, parameters, context, executemany):
+    start = conn.info['query_start_time'].pop()
+    if has_request_context():
+        queries = g.get('queries')
+        if queries is not None:
+            queries.add(statement, time.time() - start)
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.seeds.benchmark
+
+This module contains a benchmark of exporting rows to spreadsheets, which
+shows how export time grows with the size of the catalog.
+"""
+
+import io
+import time
+
+import openpyxl
+
+from app.seeds.excel import IndexesWorksheet
+from app.seeds.models import Index
+
+
+def time_export(sizes=(1000, 2000, 4000, 8000), write_only=False):
+    """Time adding synthetic rows to an `IndexesWorksheet`.
+
+    The objects added are not saved to the database, so this can be run
+    without one.
+
+    Args:
+        sizes: The numbers of rows to time adding.
+        write_only: Whether to use a write-only workbook.
+
+    Returns:
+        list: Tuples formatted (<rows>, <seconds>, <microseconds per row>).
+    """
+    results = []
+    for size in sizes:
+        indexes = [Index(name='Index {0}'.format(i),
+                         description='Description of index {0}.'.format(i))
+                   for i in range(size)]
+        wb = openpyxl.Workbook(write_only=write_only)
+        ws = IndexesWorksheet(wb.create_sheet(title='Indexes'),
+                              write_only=write_only)
+        ws.setup()
+        start = time.perf_counter()
+        ws.add(indexes, stream=io.StringIO())
+        elapsed = time.perf_counter() - start
+        results.append((size, elapsed, elapsed / size * 1000000))
+    return results
@@ -27,13 +27,17 @@
 
 import datetime
 import json
+import os
 import sys
 import warnings
+from collections import OrderedDict
+from decimal import Decimal
 
 import openpyxl
+from openpyxl.utils import get_column_letter
 
 from app import db
-from app.db_helpers import dbify
+from app.db_helpers import dbify, keep_loaded_on_commit
 from app.seeds.models import (
     Section,
     CommonName,
@@ -74,15 +78,529 @@ def queryable_dicts_to_json(objects):
                         '\'queryable_dict\'!')
 
 
+def cell_to_bool(value):
+    """bool: Whether or not a cell value such as 'True' or 'False' is true."""
+    return bool(value) and 'true' in str(value).lower()
+
+
+class BufferedCell(object):
+    """A cell of a row waiting to be appended to a write-only worksheet.
+
+    Write-only worksheets can only have whole rows appended to them, so
+    `SeedsWorksheet.cell` returns these for rows which haven't been written
+    yet.
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def __repr__(self):
+        return '<{0}: {1!r}>'.format(self.__class__.__name__, self.value)
+
+
+class ImportContext(object):
+    """Objects saved from worksheets, looked up by their natural keys.
+
+    A loaded context holds every `Index`, `CommonName`, `Section`,
+    `Cultivar`, `Packet` and `Image` in the database, so rows can be matched
+    to existing objects without querying for each row. Objects created while
+    saving rows are added to it, so later rows can find them too.
+
+    An unloaded context queries for each key the first time it is asked for
+    it instead, which is cheaper when only a few rows are being saved.
+
+    Attributes:
+        loaded (bool): Whether or not the tables have been loaded, so keys
+            not in the context don't exist in the database.
+        indexes (dict): `Index` instances by name.
+        common_names (dict): `CommonName` instances by (<index name>,
+            <common name>).
+        sections (dict): `Section` instances by (<index name>, <common name>,
+            <section name>).
+        cultivars (dict): `Cultivar` instances by (<index name>, <common
+            name>, <cultivar name>).
+        packets (dict): `Packet` instances by SKU.
+        images (dict): `Image` instances by filename.
+    """
+    def __init__(self):
+        self.clear()
+
+    def __repr__(self):
+        return '<{0} loaded: {1}>'.format(self.__class__.__name__,
+                                          self.loaded)
+
+    def clear(self):
+        """Forget all objects, such as after the session is rolled back."""
+        self.loaded = False
+        self.indexes = {}
+        self.common_names = {}
+        self.sections = {}
+        self.cultivars = {}
+        self.packets = {}
+        self.images = {}
+
+    def discard_rolled_back(self):
+        """Forget objects which are no longer in the session.
+
+        Objects created in a savepoint are removed from the session when it
+        is rolled back, so they must not be found by later rows.
+        """
+        for objects in (self.indexes,
+                        self.common_names,
+                        self.sections,
+                        self.cultivars,
+                        self.packets,
+                        self.images):
+            for key, obj in list(objects.items()):
+                if obj not in db.session:
+                    del objects[key]
+
+    def load(self):
+        """Load every object that can be looked up from the database.
+
+        Parents are loaded before their children, so building the keys of
+        children gets their parents from the session instead of querying.
+        Loading again refreshes objects expired by a commit in a few queries,
+        instead of one query per object as they are used.
+        """
+        self.clear()
+        for idx in Index.query:
+            self.indexes[idx.name] = idx
+        for cn in CommonName.query:
+            self.common_names[self._cn_key(cn)] = cn
+        for sec in Section.query:
+            key = self._cn_key(sec.common_name) + (sec.name,)
+            self.sections[key] = sec
+        for cv in Cultivar.query:
+            self.cultivars[self.cultivar_key(cv)] = cv
+        for pkt in Packet.query:
+            self.packets[pkt.sku] = pkt
+        for img in Image.query:
+            self.images[img.filename] = img
+        self.loaded = True
+
+    @staticmethod
+    def _cn_key(cn):
+        """tuple: The key of `CommonName` `cn`, or of no common name."""
+        if cn is None:
+            return (None, None)
+        return (cn.index.name if cn.index else None, cn.name)
+
+    @classmethod
+    def cultivar_key(cls, cv):
+        """tuple: The key of `Cultivar` `cv` in `cultivars`."""
+        return cls._cn_key(cv.common_name) + (cv.name,)
+
+    def _get_or_create(self, objects, key, label, name, query, create,
+                       stream):
+        """Get the object at `key` in `objects`, or create and add it.
+
+        Args:
+            objects: The dict of the context to look in.
+            key: The natural key of the object.
+            label: What to call the object in messages, e.g. 'Index'.
+            name: The name to give the object in messages.
+            query: A function returning a query for the object, used if the
+                context is not loaded, or None if it can't be in the database
+                yet because its parent is new.
+            create: A function returning a new instance of the object.
+            stream: Optional IO stream to print messages to.
+        """
+        obj = objects.get(key)
+        if obj is None and not self.loaded and query is not None:
+            obj = query().one_or_none()
+        if obj is not None:
+            obj.created = False
+            print('The {0} \'{1}\' has been loaded from the database.'
+                  .format(label, name), file=stream)
+        else:
+            obj = create()
+            obj.created = True
+            print('The {0} \'{1}\' does not yet exist in the database, so '
+                  'it has been created.'.format(label, name), file=stream)
+        objects[key] = obj
+        return obj
+
+    def index(self, name, stream=sys.stdout):
+        """Get or create the `Index` named `name`."""
+        return self._get_or_create(
+            self.indexes, name, 'Index', name,
+            lambda: Index.query.filter(Index.name == name),
+            lambda: Index(name=name),
+            stream
+        )
+
+    def common_name(self, index, name, stream=sys.stdout):
+        """Get or create the `CommonName` `name` in the index `index`."""
+        key = (index, name)
+        idx = query = None
+        if key not in self.common_names:
+            idx = self.index(index, stream=stream)
+            if idx.id is not None:
+                def query():
+                    return CommonName.query.filter(
+                        CommonName.index_id == idx.id,
+                        CommonName.name == name
+                    )
+        return self._get_or_create(
+            self.common_names, key, 'CommonName', name, query,
+            lambda: CommonName(name=name, index=idx),
+            stream
+        )
+
+    def section(self, index, common_name, name, stream=sys.stdout):
+        """Get or create the `Section` `name` of a common name."""
+        key = (index, common_name, name)
+        cn = query = None
+        if key not in self.sections:
+            cn = self.common_name(index, common_name, stream=stream)
+            if cn.id is not None:
+                def query():
+                    return Section.query.filter(
+                        Section.common_name_id == cn.id,
+                        Section.name == name
+                    )
+        return self._get_or_create(
+            self.sections, key, 'Section', name, query,
+            lambda: Section(name=name, common_name=cn),
+            stream
+        )
+
+    def cultivar(self, index, common_name, name, stream=sys.stdout):
+        """Get or create the `Cultivar` `name` of a common name."""
+        key = (index, common_name, name)
+        cn = query = None
+        if key not in self.cultivars:
+            cn = self.common_name(index, common_name, stream=stream)
+            if cn.id is not None:
+                def query():
+                    return Cultivar.query.filter(
+                        Cultivar.common_name_id == cn.id,
+                        Cultivar.name == name
+                    )
+        return self._get_or_create(
+            self.cultivars, key, 'Cultivar', name, query,
+            lambda: Cultivar(name=name, common_name=cn),
+            stream
+        )
+
+    def packet(self, sku, stream=sys.stdout):
+        """Get or create the `Packet` with the SKU `sku`."""
+        return self._get_or_create(
+            self.packets, sku, 'Packet with SKU', sku,
+            lambda: Packet.query.filter(Packet.sku == sku),
+            lambda: Packet(sku=sku),
+            stream
+        )
+
+    def image(self, filename, stream=sys.stdout):
+        """Get or create the `Image` with the filename `filename`."""
+        return self._get_or_create(
+            self.images, filename, 'Image with the filename', filename,
+            lambda: Image.query.filter(Image.filename == filename),
+            lambda: Image(filename=filename),
+            stream
+        )
+
+
+class ImportReport(object):
+    """What happened to the rows of a chunked import.
+
+    Attributes:
+        saved (int): The number of rows saved.
+        skipped (int): The number of rows skipped because a previous import
+            already saved them.
+        errors (list): Rows that could not be saved, formatted:
+            [(<sheet title>, <row number>, <error message>), ...]
+    """
+    def __init__(self):
+        self.saved = 0
+        self.skipped = 0
+        self.errors = []
+
+    def __repr__(self):
+        return '<{0} saved: {1} errors: {2}>'.format(self.__class__.__name__,
+                                                     self.saved,
+                                                     len(self.errors))
+
+    def add_error(self, sheet, row, exception):
+        """Record that row #`row` of `sheet` raised `exception`."""
+        self.errors.append((sheet,
+                            row,
+                            '{0}: {1}'.format(exception.__class__.__name__,
+                                              exception)))
+
+    def summary(self):
+        """str: The numbers of rows saved and skipped, and each error."""
+        lines = ['{0} rows saved, {1} rows skipped as already saved, {2} '
+                 'rows could not be saved.'.format(self.saved,
+                                                   self.skipped,
+                                                   len(self.errors))]
+        for sheet, row, message in self.errors:
+            lines.append('{0} row #{1}: {2}'.format(sheet, row, message))
+        return '\n'.join(lines)
+
+
+class ImportCheckpoint(object):
+    """The last committed row of each sheet of a chunked import.
+
+    The checkpoint is kept in a JSON file, so an import that was stopped can
+    be resumed from where it left off. It is only used if the workbook has
+    not been modified since the checkpoint was written.
+
+    Attributes:
+        filename (str): The file the checkpoint is kept in.
+        source (str): The workbook being imported.
+        rows (dict): The last committed row number by sheet title.
+        done (set): Titles of sheets which have been completely saved.
+        errors (list): Committed rows that could not be saved, formatted like
+            `ImportReport.errors`, so a resumed import can report them.
+    """
+    def __init__(self, filename, source):
+        self.filename = filename
+        self.source = source
+        self.rows = {}
+        self.done = set()
+        self.errors = []
+
+    def __repr__(self):
+        return '<{0} {1}>'.format(self.__class__.__name__, self.filename)
+
+    @classmethod
+    def for_workbook(cls, source):
+        """Get the checkpoint of the workbook file `source`, if it has one.
+
+        Returns:
+            ImportCheckpoint: The checkpoint, loaded from '<source>.checkpoint'
+                if it exists and matches the current version of `source`.
+        """
+        checkpoint = cls(source + '.checkpoint', source)
+        checkpoint.load()
+        return checkpoint
+
+    def signature(self):
+        """list: The size and modification time of the workbook file."""
+        stat = os.stat(self.source)
+        return [stat.st_size, stat.st_mtime]
+
+    @property
+    def resuming(self):
+        """bool: Whether a previous import has saved any rows."""
+        return bool(self.rows or self.done)
+
+    def load(self):
+        """Load the checkpoint file if it is for the current workbook."""
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError):
+            return
+        if data.get('signature') == self.signature():
+            self.rows = data.get('rows', {})
+            self.done = set(data.get('done', []))
+            self.errors = [tuple(e) for e in data.get('errors', [])]
+
+    def last_row(self, sheet):
+        """int: The last row of `sheet` that has been committed."""
+        return self.rows.get(sheet, 1)
+
+    def sheet_errors(self, sheet):
+        """list: The errors recorded for rows of `sheet`."""
+        return [e for e in self.errors if e[0] == sheet]
+
+    def save(self, sheet, row, done=False, errors=None):
+        """Record that `sheet` has been committed up to row #`row`.
+
+        Args:
+            sheet: The title of the sheet.
+            row: The last committed row.
+            done: Whether or not the whole sheet has been saved.
+            errors: Optional list of all errors in `sheet` so far, which
+                replaces the ones previously recorded for it.
+        """
+        self.rows[sheet] = row
+        if done:
+            self.done.add(sheet)
+        if errors is not None:
+            self.errors = [e for e in self.errors if e[0] != sheet]
+            self.errors.extend(errors)
+        tmp = self.filename + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'signature': self.signature(),
+                                'rows': self.rows,
+                                'done': sorted(self.done),
+                                'errors': self.errors}))
+        os.replace(tmp, self.filename)
+
+    def remove(self):
+        """Delete the checkpoint file once the import is finished."""
+        self.rows = {}
+        self.done = set()
+        self.errors = []
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+
+class RowDiff(object):
+    """How saving a row of a worksheet would change the database.
+
+    Attributes:
+        sheet (SeedsWorksheet): The worksheet the row is in.
+        row (int): The number of the row.
+        key: The natural key of the object the row is for.
+        obj: The existing object the row is for, or None if it would be
+            created.
+        changes (OrderedDict): Changed fields, formatted:
+            {<field>: (<value in database>, <value in row>), ...}
+    """
+    def __init__(self, sheet, row, key, obj, changes):
+        self.sheet = sheet
+        self.row = row
+        self.key = key
+        self.obj = obj
+        self.changes = changes
+
+    def __repr__(self):
+        return '<{0} {1} row #{2}: {3}>'.format(self.__class__.__name__,
+                                                self.sheet.title,
+                                                self.row,
+                                                self.status)
+
+    @property
+    def status(self):
+        """str: 'created', 'updated' or 'unchanged'."""
+        if self.obj is None:
+            return 'created'
+        return 'updated' if self.changes else 'unchanged'
+
+
+class ChangeSet(object):
+    """The differences between a `SeedsWorkbook` and the database.
+
+    Attributes:
+        context (ImportContext): The loaded context rows were compared to,
+            which changes are applied through.
+        rows (list): A `RowDiff` for each row compared.
+        errors (list): Rows that could not be compared, formatted:
+            [(<sheet title>, <row number>, <error message>), ...]
+    """
+    STATUSES = ('created', 'updated', 'unchanged')
+
+    def __init__(self, context):
+        self.context = context
+        self.rows = []
+        self.errors = []
+
+    def __repr__(self):
+        return '<{0}: {1} rows changed>'.format(self.__class__.__name__,
+                                                len(self.changed))
+
+    @property
+    def changed(self):
+        """list: The `RowDiff` of each row that would change the database."""
+        return [d for d in self.rows if d.status != 'unchanged']
+
+    def counts(self):
+        """OrderedDict: Number of rows of each status by sheet title."""
+        counts = OrderedDict()
+        for diff in self.rows:
+            sheet = counts.setdefault(
+                diff.sheet.title,
+                OrderedDict((s, 0) for s in self.STATUSES)
+            )
+            sheet[diff.status] += 1
+        return counts
+
+    def summary(self, fields=True):
+        """Describe the changes.
+
+        Args:
+            fields: Whether or not to list the changed fields of each row.
+
+        Returns:
+            str: Counts for each sheet, then each changed row and error.
+        """
+        lines = []
+        for title, counts in self.counts().items():
+            lines.append('{0}: {1}'.format(
+                title,
+                ', '.join('{0} {1}'.format(n, s) for s, n in counts.items())
+            ))
+        if fields:
+            for diff in self.changed:
+                lines.append('{0} row #{1}: {2} {3}'.format(diff.sheet.title,
+                                                            diff.row,
+                                                            diff.status,
+                                                            diff.key))
+                for field, (old, new) in diff.changes.items():
+                    lines.append('    {0}: {1!r} -> {2!r}'.format(field,
+                                                                  old,
+                                                                  new))
+        for sheet, row, message in self.errors:
+            lines.append('{0} row #{1} could not be compared: {2}'
+                         .format(sheet, row, message))
+        return '\n'.join(lines)
+
+    def apply(self, stream=sys.stdout):
+        """Save the changed rows to the database and commit them.
+
+        Only objects with changes are touched, so the flush only emits
+        INSERT and UPDATE statements for them, which SQLAlchemy batches by
+        table and changed columns.
+
+        Returns:
+            int: The number of rows saved.
+        """
+        changed = self.changed
+        for diff in changed:
+            diff.sheet.apply_diff(diff, stream=stream)
+        db.session.commit()
+        print('{0} changed rows have been committed to the database.'
+              .format(len(changed)), file=stream)
+        return len(changed)
+
+
 class SeedsWorksheet(object):
     """A container for an `openpyxl` worksheet.
 
     Since extending openpyxl's classes seems to be an exercise in futility, it
     is easier to just encapsulate them and create an interface that's specific
     to how we want our worksheet data formatted.
+
+    Worksheets from workbooks opened in openpyxl's read-only or write-only
+    modes are streamed instead of being held in memory, so they can only be
+    read or written one row at a time, in order.
+
+    Attributes:
+        read_only (bool): Whether `sheet` is from a read-only workbook.
+        write_only (bool): Whether `sheet` is from a write-only workbook.
+        context (ImportContext): Objects rows are saved to, by natural key.
+            `SeedsWorkbook` shares one loaded context between its sheets.
+        COLUMN_WIDTH (int): The default width of columns. Write-only sheets
+            get it before their titles are written, as column widths can't
+            be set once rows have been written.
     """
-    def __init__(self, sheet):
+    COLUMN_WIDTH = 32
+
+    def __init__(self, sheet, read_only=False, write_only=False):
         self._ws = sheet
+        self.read_only = read_only
+        self.write_only = write_only
+        self.context = ImportContext()
+        # The row being saved from a read-only sheet: (<number>, <cells>)
+        self._current_row = None
+        # Rows not yet appended to a write-only sheet, formatted:
+        # {<row number>: {<column number>: <BufferedCell>, ...}, ...}
+        self._buffer = {}
+        self._appended = 0
+        self._titles = ()
+        # Rows of cells in the sheet, kept up to date as cells are added
+        # with `cell`. It is rebuilt if the sheet is edited some other way,
+        # which is noticed by the sheet's number of cells changing.
+        self._row_cache = None
+        self._row_cache_cells = 0
+        self._row_cache_width = 0
 
     def __getitem__(self, x):
         """Allow direct access to keys present in worksheet."""
@@ -106,23 +624,64 @@ class SeedsWorksheet(object):
         least one cell is given a value.
         """
         # TODO: Forward _ws.rows once rows is fixed in openpyxl.
-        if self._ws._cells:
-            return tuple(self._ws.iter_rows())
-        else:
-            return ((),)
+        if self.read_only:
+            return tuple(self._ws.iter_rows()) or ((),)
+        return tuple(self._cached_rows()) or ((),)
+
+    def _cached_rows(self):
+        """list: The cached rows of the sheet, rebuilt if they are stale.
+
+        `Worksheet.iter_rows` fills in missing cells to make a grid, so every
+        cell in the grid is in the cache, and new cells can only be added
+        outside of it.
+        """
+        cells = self._ws._cells
+        if not cells:
+            return []
+        if self._row_cache is None or len(cells) != self._row_cache_cells:
+            self._row_cache = list(self._ws.iter_rows())
+            self._row_cache_width = len(self._row_cache[0])
+            self._row_cache_cells = len(cells)
+        return self._row_cache
+
+    def _extend_row_cache(self, row, column):
+        """Add rows up to `row` to the cache after `cell` creates a cell.
+
+        Cells are added to the new rows to fill the grid, as
+        `Worksheet.iter_rows` would. A new column can't be added to the cache
+        in place, so it is dropped instead.
+        """
+        if column > self._row_cache_width:
+            self._row_cache = None
+            return
+        for r in range(len(self._row_cache) + 1, row + 1):
+            self._row_cache.append(tuple(
+                self._ws.cell(row=r, column=c)
+                for c in range(1, self._row_cache_width + 1)
+            ))
+        self._row_cache_cells = len(self._ws._cells)
 
     @property
     def active_row(self):
-        """int: The first empty or nonexistant row in the sheet."""
-        if any(cell.value for cell in self.rows[self._ws.max_row - 1]):
-            return self._ws.max_row + 1
+        """int: The first empty or nonexistant row in the sheet.
+
+        Only the last row is checked, so this doesn't depend on the number of
+        rows in the sheet.
+        """
+        if self.write_only:
+            return max([self._appended] + list(self._buffer)) + 1
+        rows = self._cached_rows()
+        if not rows:
+            return 1
+        if any(cell.value for cell in rows[-1]):
+            return len(rows) + 1
         else:
-            return self._ws.max_row
+            return len(rows)
 
     @property
     def data_rows(self):
         """tuple: All used rows except the titles (first) row."""
-        return self.rows[1:]
+        return tuple(self._cached_rows()[1:])
 
     def has_data(self):
         """Return `True` if there is already data in the worksheet.
@@ -131,8 +690,32 @@ class SeedsWorksheet(object):
         because there should always be data in cell A1 in sheet that has been
         set up.
         """
+        if self.write_only:
+            return bool(self._appended or 1 in self._buffer)
+        if self.read_only:
+            first = next(iter(self._ws.iter_rows()), ())
+            return bool(first) and first[0].value is not None
         return True if self._ws['A1'].value is not None else False
 
+    def data_row_numbers(self):
+        """Generate the number of each row after the titles row.
+
+        Rows of read-only sheets are read as they are generated, and `cell`
+        gets cells in the current row without searching the sheet for them.
+        """
+        if self.read_only:
+            rows = iter(self._ws.iter_rows())
+            next(rows, None)
+            try:
+                for r, cells in enumerate(rows, start=2):
+                    self._current_row = (r, cells)
+                    yield r
+            finally:
+                self._current_row = None
+        else:
+            for r in range(2, self.active_row):
+                yield r
+
     def cell(self, row, column):
         """cell: The cell of the worksheet represented by (row, column).
 
@@ -144,7 +727,41 @@ class SeedsWorksheet(object):
             row: Row of cell.
             column: Column of cell.
         """
-        return self._ws.cell(row=row, column=column)
+        if self.write_only:
+            if row <= self._appended:
+                raise ValueError('Row #{0} of the worksheet \'{1}\' has '
+                                 'already been written, and write-only '
+                                 'worksheets can\'t be edited.'
+                                 .format(row, self._ws.title))
+            return self._buffer.setdefault(row, {}).setdefault(
+                column, BufferedCell()
+            )
+        if self.read_only and self._current_row and \
+                self._current_row[0] == row:
+            cells = self._current_row[1]
+            if column <= len(cells):
+                return cells[column - 1]
+            return BufferedCell()
+        if self.read_only:
+            return self._ws.cell(row=row, column=column)
+        in_sync = (self._row_cache is not None and
+                   len(self._ws._cells) == self._row_cache_cells)
+        cell = self._ws.cell(row=row, column=column)
+        if in_sync and len(self._ws._cells) != self._row_cache_cells:
+            self._extend_row_cache(row, column)
+        return cell
+
+    def flush_rows(self):
+        """Append rows set with `cell` to a write-only worksheet."""
+        for r in sorted(self._buffer):
+            while self._appended < r - 1:
+                self._ws.append([])
+                self._appended += 1
+            cells = self._buffer[r]
+            self._ws.append([cells[c].value if c in cells else None
+                             for c in range(1, max(cells, default=0) + 1)])
+            self._appended += 1
+        self._buffer = {}
 
     def set_column_titles(self, titles):
         """Populate the first row of a worksheet with column titles.
@@ -155,17 +772,31 @@ class SeedsWorksheet(object):
         if not self.has_data():
             for c, title in enumerate(titles, start=1):
                 self.cell(1, c).value = title
+            self._titles = tuple(titles)
+            if self.write_only:
+                self.set_column_widths(self.COLUMN_WIDTH)
+                self.flush_rows()
         else:
             raise ValueError('The worksheet \'{0}\' already has data in its '
                              'top row!'.format(self._ws.title))
 
+    def set_column_widths(self, width):
+        """Set the width of each titled column to `width`."""
+        for c in range(1, len(self._titles) + 1):
+            self._ws.column_dimensions[get_column_letter(c)].width = width
+
     def populate_cols_dict(self):
         """Attach a dictionary 'cols' to the sheet for lookup by title.
 
         The resulting `dict` is formatted: {<title>: <column number>, ...}
         """
-        row = self.rows[0]
-        d = {cell.value: cell.col_idx for cell in row}
+        if self.write_only:
+            titles = self._titles
+        elif self.read_only:
+            titles = [c.value for c in next(iter(self._ws.iter_rows()), ())]
+        else:
+            titles = [c.value for c in self.rows[0]]
+        d = {title: c for c, title in enumerate(titles, start=1)}
         if d and all(d.keys()):
             self.cols = d
         else:
@@ -238,6 +869,8 @@ class SeedsWorksheet(object):
                 self.add_one(obj, stream=stream)
             except TypeError as e:
                 warnings.warn(e.args[0], UserWarning)
+            if self.write_only:
+                self.flush_rows()
         print('-- END adding data to {0}. --'
               .format(self.__class__.__name__), file=stream)
 
@@ -266,12 +899,13 @@ class SeedsWorksheet(object):
         edited = False
         print('-- BEGIN saving all rows from {0} to database. --'
               .format(self.__class__.__name__), file=stream)
-        for r in range(2, self.active_row):
+        for r in self.data_row_numbers():
             try:
                 if self.save_row_to_db(row=r, stream=stream):
                     edited = True
             except Exception as e:
                 db.session.rollback()
+                self.context.clear()
                 raise RuntimeError('An exception occurred while saving row '
                                    '#{0} to the database, so the database '
                                    'has been rolled back. The exception that '
@@ -284,20 +918,195 @@ class SeedsWorksheet(object):
         print('-- END saving all rows from {0} to database. --'
               .format(self.__class__.__name__), file=stream)
 
-    def beautify(self, width=32, height=42):
+    def save_to_db_in_chunks(self,
+                             chunk_size=500,
+                             report=None,
+                             checkpoint=None,
+                             stream=sys.stdout):
+        """Save all rows of the worksheet, committing every `chunk_size` rows.
+
+        Each row is saved inside a SAVEPOINT, so a row that raises an
+        exception is rolled back and recorded in `report` without losing the
+        other rows of its chunk. Objects are kept loaded after each commit,
+        so `context` stays usable without reloading it.
+
+        Args:
+            chunk_size: The number of rows to save per commit.
+            report: Optional `ImportReport` to record rows in.
+            checkpoint: Optional `ImportCheckpoint` to skip rows already
+                committed by a previous import, and to record committed rows
+                and errors in. Errors it recorded are added to `report`.
+            stream: Optional IO stream to write messages to.
+
+        Returns:
+            ImportReport: `report`, or a new one if none was given.
+        """
+        if report is None:
+            report = ImportReport()
+        title = self.title
+        if checkpoint:
+            report.errors.extend(checkpoint.sheet_errors(title))
+        if checkpoint and title in checkpoint.done:
+            print('-- SKIPPING {0}, which has already been saved. --'
+                  .format(self.__class__.__name__), file=stream)
+            return report
+        start = checkpoint.last_row(title) if checkpoint else 1
+        print('-- BEGIN saving rows from {0} to database in chunks of {1}. --'
+              .format(self.__class__.__name__, chunk_size), file=stream)
+        if start > 1:
+            print('Resuming after row #{0}, which was committed by a previous '
+                  'import.'.format(start), file=stream)
+        pending = 0
+        last = start
+        with keep_loaded_on_commit():
+            for r in self.data_row_numbers():
+                if r <= start:
+                    report.skipped += 1
+                    continue
+                try:
+                    with db.session.begin_nested():
+                        self.save_row_to_db(row=r, stream=stream)
+                except Exception as e:
+                    self.context.discard_rolled_back()
+                    report.add_error(title, r, e)
+                    print('Row #{0} could not be saved, so it has been '
+                          'rolled back. The exception that was raised: {1}: '
+                          '{2}'.format(r, e.__class__.__name__, e),
+                          file=stream)
+                else:
+                    report.saved += 1
+                pending += 1
+                last = r
+                if pending >= chunk_size:
+                    self._commit_chunk(last, checkpoint, report,
+                                       stream=stream)
+                    pending = 0
+            self._commit_chunk(last, checkpoint, report, done=True,
+                               stream=stream)
+        print('-- END saving rows from {0} to database. --'
+              .format(self.__class__.__name__), file=stream)
+        return report
+
+    def _commit_chunk(self,
+                      row,
+                      checkpoint,
+                      report,
+                      done=False,
+                      stream=sys.stdout):
+        """Commit saved rows up to `row`, and record them in `checkpoint`."""
+        db.session.commit()
+        if checkpoint:
+            checkpoint.save(self.title,
+                            row,
+                            done=done,
+                            errors=[e for e in report.errors
+                                    if e[0] == self.title])
+        print('Rows up to #{0} have been committed to the database.'
+              .format(row), file=stream)
+
+    def row_fields(self, row):
+        """Get the natural key of a row and the values of its fields.
+
+        This should be implemented by child classes that can be compared to
+        the database with `diff_row`.
+
+        Returns:
+            tuple: (<key>, <OrderedDict of {<field>: <value>, ...}>). Fields
+                with no value in the row, which `save_row_to_db` would leave
+                alone, should be left out.
+        """
+        raise NotImplementedError('This method needs to be implemented by a '
+                                  'class derived from SeedsWorksheet.')
+
+    def lookup(self, key):
+        """Get the object with the natural key `key` from `context`.
+
+        Returns:
+            The object, or None if it doesn't exist yet.
+        """
+        raise NotImplementedError('This method needs to be implemented by a '
+                                  'class derived from SeedsWorksheet.')
+
+    def get_or_create(self, key, stream=sys.stdout):
+        """Get or create the object with natural key `key` with `context`."""
+        raise NotImplementedError('This method needs to be implemented by a '
+                                  'class derived from SeedsWorksheet.')
+
+    def field_value(self, obj, field):
+        """Get the value of `field` of `obj` to compare to a row's value."""
+        return getattr(obj, field)
+
+    def set_field(self, obj, field, value, stream=sys.stdout):
+        """Set `field` of `obj` to a value from a row."""
+        setattr(obj, field, value)
+
+    def diff_row(self, row):
+        """Compare a row to the database without changing anything.
+
+        Note:
+            `context` should be loaded, as objects not in it are assumed not
+            to exist yet.
+
+        Args:
+            row: The number of the row to compare.
+
+        Returns:
+            RowDiff: The changes saving the row would make.
+        """
+        key, fields = self.row_fields(row)
+        obj = self.lookup(key)
+        changes = OrderedDict()
+        for field, value in fields.items():
+            if obj is None:
+                if value is not None:
+                    changes[field] = (None, value)
+            else:
+                old = self.field_value(obj, field)
+                if old != value:
+                    changes[field] = (old, value)
+        return RowDiff(self, row, key, obj, changes)
+
+    def apply_diff(self, diff, stream=sys.stdout):
+        """Make the changes in `diff` to its object, creating it if needed.
+
+        Returns:
+            The object changed.
+        """
+        obj = self.get_or_create(diff.key, stream=stream)
+        if obj.created:
+            db.session.add(obj)
+        for field, (old, new) in diff.changes.items():
+            self.set_field(obj, field, new, stream=stream)
+        return obj
+
+    def beautify(self, width=COLUMN_WIDTH, height=42):
         """Format a worksheet to be more human readable.
 
+        Rows of write-only worksheets have already been written, and their
+        columns were given `COLUMN_WIDTH` before the titles were, so they are
+        left alone.
+
         Args:
             width: Optional width to set column dimensions to.
             height: Optional height to set row dimensions to.
         """
+        if self.write_only:
+            if width != self.COLUMN_WIDTH:
+                warnings.warn(
+                    'Rows of the write-only worksheet \'{0}\' have already '
+                    'been written, so its columns keep the width {1}.'
+                    .format(self._ws.title, self.COLUMN_WIDTH),
+                    UserWarning
+                )
+            return
         self._ws.freeze_panes = self._ws['A2']
-        for cell in self.rows[0]:
+        rows = self.rows
+        for cell in rows[0]:
             self._ws.column_dimensions[cell.column].width = width
         a = openpyxl.styles.Alignment(wrap_text=True, vertical='top')
         for cell in self._ws.get_cell_collection():
             cell.alignment = a
-        for i in range(2, len(self.rows) + 1):
+        for i in range(2, len(rows) + 1):
             self._ws.row_dimensions[i].height = height
 
 
@@ -344,7 +1153,7 @@ class IndexesWorksheet(SeedsWorksheet):
         print('-- BEGIN editing/creating Index \'{0}\' from row #{1}. --'
               .format(name, row), file=stream)
         edited = False
-        idx = Index.get_or_create(name=name, stream=stream)
+        idx = self.context.index(name, stream=stream)
         if idx.created:
             edited = True
             db.session.add(idx)
@@ -359,7 +1168,7 @@ class IndexesWorksheet(SeedsWorksheet):
                 print('Description for the Index \'{0}\' has been cleared.'
                       .format(idx.name), file=stream)
         if edited:
-            db.session.commit()
+            db.session.flush()
             print('Changes to Index \'{0}\' have been flushed to the database.'
                   .format(idx.name), file=stream)
         else:
@@ -369,6 +1178,20 @@ class IndexesWorksheet(SeedsWorksheet):
               .format(idx.name, row), file=stream)
         return edited
 
+    def row_fields(self, row):
+        name = dbify(self.cell(row, self.cols['Index']).value)
+        fields = OrderedDict([
+            ('description',
+             self.cell(row, self.cols['Description']).value or None)
+        ])
+        return name, fields
+
+    def lookup(self, key):
+        return self.context.indexes.get(key)
+
+    def get_or_create(self, key, stream=sys.stdout):
+        return self.context.index(key, stream=stream)
+
 
 class CommonNamesWorksheet(SeedsWorksheet):
     """Class extending SeedsWorksheet to have Common Names-specific methods."""
@@ -441,7 +1264,7 @@ class CommonNamesWorksheet(SeedsWorksheet):
         print('-- BEGIN editing/creating CommonName \'{0}\' from row #{1}. --'
               .format(name, row), file=stream)
         edited = False
-        cn = CommonName.get_or_create(name=name, index=index, stream=stream)
+        cn = self.context.common_name(index, name, stream=stream)
         if cn.created:
             edited = True
             db.session.add(cn)
@@ -494,6 +1317,25 @@ class CommonNamesWorksheet(SeedsWorksheet):
               .format(cn.name, row), file=stream)
         return edited
 
+    def row_fields(self, row):
+        key = (dbify(self.cell(row, self.cols['Index']).value),
+               dbify(self.cell(row, self.cols['Common Name']).value))
+        fields = OrderedDict([
+            ('description',
+             self.cell(row, self.cols['Description']).value or None),
+            ('instructions',
+             self.cell(row, self.cols['Planting Instructions']).value or None),
+            ('visible',
+             cell_to_bool(self.cell(row, self.cols['Visible']).value))
+        ])
+        return key, fields
+
+    def lookup(self, key):
+        return self.context.common_names.get(key)
+
+    def get_or_create(self, key, stream=sys.stdout):
+        return self.context.common_name(*key, stream=stream)
+
 
 class BotanicalNamesWorksheet(SeedsWorksheet):
     """Class extending SeedsWorksheet with Botanical Names-specific methods."""
@@ -568,11 +1410,10 @@ class BotanicalNamesWorksheet(SeedsWorksheet):
             print('The BotanicalName \'{0}\' does not yet exist in the '
                   'database, so it has been created.'.format(bn.name),
                   file=stream)
-        cns = tuple(CommonName.get_or_create(
-            name=dbify(d['Common Name']),
-            index=dbify(d['Index']),
-            stream=stream
-        ) for d in cn_dicts)
+        cns = tuple(self.context.common_name(dbify(d['Index']),
+                                             dbify(d['Common Name']),
+                                             stream=stream)
+                    for d in cn_dicts)
         for cn in cns:
             if cn not in bn.common_names:
                 edited = True
@@ -659,26 +1500,15 @@ class SectionsWorksheet(SeedsWorksheet):
         print('-- BEGIN editing/creating Section \'{0}\' from row #{1}. '
               '--'.format(section, row), file=stream)
         edited = False
-        cn = CommonName.get_or_create(name=dbify(cn_dict['Common Name']),
-                                      index=dbify(cn_dict['Index']),
-                                      stream=stream)
-        sec = None
-        if not cn.created:
-            sec = Section.query\
-                .filter(Section.name == section, Section.common_name_id == cn.id)\
-                .one_or_none()
-        if sec:
-            print('The Section \'{0}\' has been loaded from the database.'
-                  .format(sec.name), file=stream)
-        else:
+        sec = self.context.section(dbify(cn_dict['Index']),
+                                   dbify(cn_dict['Common Name']),
+                                   section,
+                                   stream=stream)
+        if sec.created:
             edited = True
-            sec = Section(name=section)
-            sec.common_name = cn
             print('CommonName for the Section \'{0}\' set to: {1}'
-                  .format(sec.name, cn.name), file=stream)
+                  .format(sec.name, sec.common_name.name), file=stream)
             db.session.add(sec)
-            print('The Section \'{0}\' does not yet exist in the database, '
-                  'so it has been created.'.format(sec.name), file=stream)
         if description != sec.description:
             edited = True
             if description:
@@ -700,6 +1530,25 @@ class SectionsWorksheet(SeedsWorksheet):
               '--'.format(sec.name, row), file=stream)
         return edited
 
+    def row_fields(self, row):
+        cn_dict = json.loads(
+            self.cell(row, self.cols['Common Name (JSON)']).value
+        )
+        key = (dbify(cn_dict['Index']),
+               dbify(cn_dict['Common Name']),
+               dbify(self.cell(row, self.cols['Section']).value))
+        fields = OrderedDict([
+            ('description',
+             self.cell(row, self.cols['Description']).value or None)
+        ])
+        return key, fields
+
+    def lookup(self, key):
+        return self.context.sections.get(key)
+
+    def get_or_create(self, key, stream=sys.stdout):
+        return self.context.section(*key, stream=stream)
+
 
 class CultivarsWorksheet(SeedsWorksheet):
     """Class extending SeedsWorksheet with Cultivars-specific methods."""
@@ -811,29 +1660,18 @@ class CultivarsWorksheet(SeedsWorksheet):
         print('-- BEGIN editing/creating Cultivar \'{0}\' from row #{1}. '
               '--'.format(cultivar + ' ' + common_name, row), file=stream)
         edited = False
-        cv = Cultivar.get_or_create(name=cultivar,
-                                    index=index,
-                                    common_name=common_name,
-                                    stream=stream)
+        cv = self.context.cultivar(index,
+                                   common_name,
+                                   cultivar,
+                                   stream=stream)
         if cv.created:
             edited = True
             db.session.add(cv)
             if section:  # Section already exists if cv was not created.
-                sec = Section.query\
-                    .join(CommonName, CommonName.id == Section.common_name_id)\
-                    .join(Index, Index.id == CommonName.index_id)\
-                    .filter(Section.name == section,
-                            CommonName.name == common_name,
-                            Index.name == index)\
-                    .one_or_none()
-                if sec:
-                    print('The Section \'{0}\' has been loaded from the '
-                          'database.'.format(sec.name), file=stream)
-                else:
-                    sec = Section(name=section)
-                    sec.common_name = cv.common_name
-                    print('The Section \'{0}\' does not yet exist, so it has '
-                          'been created.'.format(sec.name), file=stream)
+                sec = self.context.section(index,
+                                           common_name,
+                                           section,
+                                           stream=stream)
                 cv.section = sec
                 print('Section for the Cultivar \'{0}\' set to: {1}'
                       .format(cv.fullname, sec.name), file=stream)
@@ -866,18 +1704,7 @@ class CultivarsWorksheet(SeedsWorksheet):
         if thumbnail:
             if not cv.thumbnail or cv.thumbnail.filename != thumbnail:
                 edited = True
-                tn = Image.query\
-                    .filter(Image.filename == thumbnail)\
-                    .one_or_none()
-                if tn:
-                    print('The Image with the filename \'{0}\' has been '
-                          'loaded from the database.'.format(tn.filename),
-                          file=stream)
-                else:
-                    tn = Image(filename=thumbnail)
-                    print('The Image with the filename \'{0}\' does not yet '
-                          'exist in the database, so it has been created.'
-                          .format(tn.filename), file=stream)
+                tn = self.context.image(thumbnail, stream=stream)
                 cv.thumbnail = tn
                 print('The Image with the filename \'{0}\' has been set as '
                       'the thumbnail for the Cultivar \'{1}\'.'
@@ -957,6 +1784,49 @@ class CultivarsWorksheet(SeedsWorksheet):
               '--'.format(cv.fullname, row), file=stream)
         return edited
 
+    def row_fields(self, row):
+        """Get the key and fields of a row of the Cultivars sheet.
+
+        Botanical names and thumbnails are only compared if the row has one,
+        as `save_row_to_db` doesn't clear them.
+        """
+        key = (dbify(self.cell(row, self.cols['Index']).value),
+               dbify(self.cell(row, self.cols['Common Name']).value),
+               dbify(self.cell(row, self.cols['Cultivar Name']).value))
+        fields = OrderedDict()
+        botanical_name = self.cell(row, self.cols['Botanical Name']).value
+        if botanical_name:
+            fields['botanical_name'] = botanical_name
+        thumbnail = self.cell(row, self.cols['Thumbnail Filename']).value
+        if thumbnail:
+            fields['thumbnail'] = thumbnail
+        fields['description'] = self.cell(
+            row, self.cols['Description']
+        ).value or None
+        for field, title in (('in_stock', 'In Stock'),
+                             ('active', 'Active'),
+                             ('visible', 'Visible')):
+            value = self.cell(row, self.cols[title]).value
+            fields[field] = cell_to_bool(value)
+        return key, fields
+
+    def lookup(self, key):
+        return self.context.cultivars.get(key)
+
+    def get_or_create(self, key, stream=sys.stdout):
+        return self.context.cultivar(*key, stream=stream)
+
+    def field_value(self, obj, field):
+        if field == 'thumbnail':
+            return obj.thumbnail.filename if obj.thumbnail else None
+        return getattr(obj, field)
+
+    def set_field(self, obj, field, value, stream=sys.stdout):
+        if field == 'thumbnail':
+            obj.thumbnail = self.context.image(value, stream=stream)
+        else:
+            setattr(obj, field, value)
+
 
 class PacketsWorksheet(SeedsWorksheet):
     """Class extending SeedsWorksheet with Packets-specific methods."""
@@ -1014,25 +1884,21 @@ class PacketsWorksheet(SeedsWorksheet):
         print('-- BEGIN editing/creating Packet with the SKU \'{0}\' from row '
               '#{1}. --'.format(sku, row), file=stream)
         edited = False
-        pkt = Packet.query.filter(Packet.sku == sku).one_or_none()
-        if pkt:
-            print('The Packet with SKU \'{0}\' has been loaded from the '
-                  'database.'.format(pkt.sku), file=stream)
-        else:
+        pkt = self.context.packet(sku, stream=stream)
+        if pkt.created:
             edited = True
             qty = Quantity.from_queryable_values(value=quantity, units=units)
             if not qty:
                 qty = Quantity(value=quantity, units=units)
-            pkt = Packet(sku=sku, price=price, quantity=qty)
+            pkt.price = price
+            pkt.quantity = qty
             db.session.add(pkt)
-            pkt.cultivar = Cultivar.get_or_create(
-                name=dbify(cv_dict['Cultivar Name']),
-                common_name=dbify(cv_dict['Common Name']),
-                index=dbify(cv_dict['Index']),
+            pkt.cultivar = self.context.cultivar(
+                dbify(cv_dict['Index']),
+                dbify(cv_dict['Common Name']),
+                dbify(cv_dict['Cultivar Name']),
                 stream=stream
             )
-            print('The Packet with SKU \'{0}\' does not yet exist, so it has '
-                  'been created.'.format(pkt.sku), file=stream)
         if price != str(pkt.price):
             edited = True
             pkt.price = price
@@ -1057,11 +1923,60 @@ class PacketsWorksheet(SeedsWorksheet):
               '--'.format(pkt.sku, row), file=stream)
         return edited
 
+    def row_fields(self, row):
+        """Get the key and fields of a row of the Packets sheet.
+
+        The cultivar is compared by its natural key.
+        """
+        cv_dict = json.loads(
+            self.cell(row, self.cols['Cultivar (JSON)']).value
+        )
+        sku = self.cell(row, self.cols['SKU']).value
+        price = self.cell(row, self.cols['Price']).value
+        fields = OrderedDict([
+            ('cultivar', (dbify(cv_dict['Index']),
+                          dbify(cv_dict['Common Name']),
+                          dbify(cv_dict['Cultivar Name']))),
+            ('price', Decimal(str(price)).quantize(Decimal('0.01'))
+             if price is not None else None)
+        ])
+        return sku, fields
+
+    def lookup(self, key):
+        return self.context.packets.get(key)
+
+    def get_or_create(self, key, stream=sys.stdout):
+        return self.context.packet(key, stream=stream)
+
+    def field_value(self, obj, field):
+        if field == 'cultivar':
+            return (ImportContext.cultivar_key(obj.cultivar)
+                    if obj.cultivar else None)
+        return getattr(obj, field)
+
+    def set_field(self, obj, field, value, stream=sys.stdout):
+        if field == 'cultivar':
+            obj.cultivar = self.context.cultivar(*value, stream=stream)
+        else:
+            setattr(obj, field, value)
+
 
 class SeedsWorkbook(object):
-    """A container for an `openpyxl` workbook."""
-    def __init__(self):
-        self._wb = openpyxl.Workbook()
+    """A container for an `openpyxl` workbook.
+
+    Args:
+        write_only: Stream rows to the file when saving instead of keeping
+            every cell in memory. Rows can't be read or edited once added to
+            a write-only workbook, and it can only be saved once.
+
+    Attributes:
+        read_only (bool): Whether the workbook was loaded in read-only mode.
+        write_only (bool): Whether the workbook is write-only.
+    """
+    def __init__(self, write_only=False):
+        self.read_only = False
+        self.write_only = write_only
+        self._wb = openpyxl.Workbook(write_only=write_only)
         self.create_all_sheets()
 
     def __getitem__(self, x):
@@ -1079,42 +1994,58 @@ class SeedsWorkbook(object):
     def create_all_sheets(self):
         """Create all of the worksheets in the `SeedsWorkbook`."""
         self.remove_all_sheets()
-        self.indexes = IndexesWorksheet(self._wb.create_sheet(title='Indexes'))
+        self.indexes = IndexesWorksheet(
+            self._wb.create_sheet(title='Indexes'),
+            write_only=self.write_only
+        )
         self.indexes.setup()
         self.common_names = CommonNamesWorksheet(
-            self._wb.create_sheet(title='Common Names')
+            self._wb.create_sheet(title='Common Names'),
+            write_only=self.write_only
         )
         self.common_names.setup()
         self.botanical_names = BotanicalNamesWorksheet(
-            self._wb.create_sheet(title='Botanical Names')
+            self._wb.create_sheet(title='Botanical Names'),
+            write_only=self.write_only
         )
         self.botanical_names.setup()
         self.section = SectionsWorksheet(
-            self._wb.create_sheet(title='Section')
+            self._wb.create_sheet(title='Section'),
+            write_only=self.write_only
         )
         self.section.setup()
         self.cultivars = CultivarsWorksheet(
-            self._wb.create_sheet(title='Cultivars')
+            self._wb.create_sheet(title='Cultivars'),
+            write_only=self.write_only
         )
         self.cultivars.setup()
-        self.packets = PacketsWorksheet(self._wb.create_sheet(title='Packets'))
+        self.packets = PacketsWorksheet(
+            self._wb.create_sheet(title='Packets'),
+            write_only=self.write_only
+        )
         self.packets.setup()
 
     def load_all_sheets_from_workbook(self):
         """Set up all SeedsWorksheets with sheets from loaded workbook."""
-        self.indexes = IndexesWorksheet(self._wb['Indexes'])
+        self.indexes = IndexesWorksheet(self._wb['Indexes'],
+                                        read_only=self.read_only)
         self.indexes.setup()
-        self.common_names = CommonNamesWorksheet(self._wb['Common Names'])
+        self.common_names = CommonNamesWorksheet(self._wb['Common Names'],
+                                                 read_only=self.read_only)
         self.common_names.setup()
         self.botanical_names = BotanicalNamesWorksheet(
-            self._wb['Botanical Names']
+            self._wb['Botanical Names'],
+            read_only=self.read_only
         )
         self.botanical_names.setup()
-        self.section = SectionsWorksheet(self._wb['Section'])
+        self.section = SectionsWorksheet(self._wb['Section'],
+                                         read_only=self.read_only)
         self.section.setup()
-        self.cultivars = CultivarsWorksheet(self._wb['Cultivars'])
+        self.cultivars = CultivarsWorksheet(self._wb['Cultivars'],
+                                            read_only=self.read_only)
         self.cultivars.setup()
-        self.packets = PacketsWorksheet(self._wb['Packets'])
+        self.packets = PacketsWorksheet(self._wb['Packets'],
+                                        read_only=self.read_only)
         self.packets.setup()
 
     def add_all_data_to_sheets(self, stream=sys.stdout):
@@ -1130,22 +2061,83 @@ class SeedsWorkbook(object):
         self.cultivars.add(Cultivar.query.all(), stream=stream)
         self.packets.add(Packet.query.all(), stream=stream)
 
-    def save_all_sheets_to_db(self, stream=sys.stdout):
+    def save_all_sheets_to_db(self,
+                              stream=sys.stdout,
+                              chunk_size=None,
+                              checkpoint=None):
         """Save the contents of all worksheets to the database.
 
+        Rows are matched to existing objects with a loaded `ImportContext`
+        shared by all of the worksheets, so the database is only queried a
+        few times instead of for every row. Objects are kept loaded after
+        each commit, so the context is only loaded once.
+
         Args:
             stream: Optional IO stream to print messages to.
+            chunk_size: Optional number of rows to commit at a time. If set,
+                rows which can't be saved are reported instead of rolling
+                back the whole worksheet.
+            checkpoint: Optional `ImportCheckpoint` to resume a chunked import
+                from.
+
+        Returns:
+            ImportReport: The report of a chunked import, or None.
         """
         print('-- BEGIN saving all worksheets to database. --', file=stream)
-        self.indexes.save_to_db(stream=stream)
-        self.common_names.save_to_db(stream=stream)
-        self.botanical_names.save_to_db(stream=stream)
-        self.section.save_to_db(stream=stream)
-        self.cultivars.save_to_db(stream=stream)
-        self.packets.save_to_db(stream=stream)
+        report = ImportReport() if chunk_size else None
+        context = ImportContext()
+        with keep_loaded_on_commit():
+            context.load()
+            for sheet in (self.indexes,
+                          self.common_names,
+                          self.botanical_names,
+                          self.section,
+                          self.cultivars,
+                          self.packets):
+                sheet.context = context
+                if chunk_size:
+                    sheet.save_to_db_in_chunks(chunk_size=chunk_size,
+                                               report=report,
+                                               checkpoint=checkpoint,
+                                               stream=stream)
+                else:
+                    sheet.save_to_db(stream=stream)
         print('-- END saving all worksheets to database. --', file=stream)
+        return report
+
+    def diff_with_db(self):
+        """Compare the worksheets to the database without changing it.
 
-    def beautify_all_sheets(self, width=32, height=42):
+        Botanical names are not compared, as the table they were saved to no
+        longer exists.
+
+        Returns:
+            ChangeSet: The changes saving the workbook would make, which can
+                be saved with `ChangeSet.apply`.
+        """
+        context = ImportContext()
+        context.load()
+        changes = ChangeSet(context)
+        for sheet in (self.indexes,
+                      self.common_names,
+                      self.section,
+                      self.cultivars,
+                      self.packets):
+            sheet.context = context
+            for r in sheet.data_row_numbers():
+                try:
+                    changes.rows.append(sheet.diff_row(r))
+                except Exception as e:
+                    changes.errors.append((
+                        sheet.title,
+                        r,
+                        '{0}: {1}'.format(e.__class__.__name__, e)
+                    ))
+        return changes
+
+    def beautify_all_sheets(self,
+                            width=SeedsWorksheet.COLUMN_WIDTH,
+                            height=42):
         """Run beautify on all worksheets.
 
         Args:
@@ -1159,9 +2151,29 @@ class SeedsWorkbook(object):
         self.cultivars.beautify(width=width, height=height)
         self.packets.beautify(width=width, height=height)
 
-    def load(self, filename):
-        self._wb = openpyxl.load_workbook(filename)
+    def load(self, filename, read_only=False):
+        """Load a workbook from a file.
+
+        Args:
+            filename: The file to load.
+            read_only: Read rows from the file as they are saved to the
+                database instead of loading every cell into memory first.
+        """
+        if read_only:
+            self._wb = openpyxl.load_workbook(filename, read_only=True)
+        else:
+            self._wb = openpyxl.load_workbook(filename)
+        self.read_only = read_only
+        self.write_only = False
         self.load_all_sheets_from_workbook()
 
     def save(self, filename):
+        if self.write_only:
+            for sheet in (self.indexes,
+                          self.common_names,
+                          self.botanical_names,
+                          self.section,
+                          self.cultivars,
+                          self.packets):
+                sheet.flush_rows()
         self._wb.save(filename)
@@ -1563,15 +1563,39 @@ class EditShipDateForm(FlaskForm):
 
 
 class EditRatesForm(FlaskForm):
-    """Form for editing rates and dates."""
+    """Form for editing shipping rates.
+
+    Attributes:
+        RATES: The keys in the rates file for each field, formatted:
+            {<field name>: <rates key>, ...}
+    """
+    RATES = {
+        'free_shipping_threshold': 'free US shipping threshold',
+        'us_shipping': 'US shipping',
+        'international_shipping': 'international shipping'
+    }
     free_shipping_threshold = StrippedStringField(
-        'Free shipping for orders over'
+        'Free shipping for US orders over',
+        validators=[InputRequired(), USDollar()]
     )
-    usps_first_class = StrippedStringField('USPS First-Class (Domestic)')
-    usps_priority = StrippedStringField('USPS Priority (Domestic)')
-    itl_first_class = StrippedStringField(
-            'USPS First-Class (International)'
+    us_shipping = StrippedStringField(
+        'US shipping',
+        validators=[InputRequired(), USDollar()]
+    )
+    international_shipping = StrippedStringField(
+        'International shipping',
+        validators=[InputRequired(), USDollar()]
     )
-    itl_priority = StrippedStringField('USPS Priority (International)')
     submit = SubmitField('Submit')
 
+    def populate(self, rates):
+        """Load fields from a dict of rates."""
+        for field, key in self.RATES.items():
+            self[field].data = str(rates[key])
+
+    @property
+    def rates(self):
+        """dict: Rates from the form, formatted for `ShippingRates.save`."""
+        return {key: USDollar_.usd_to_decimal(self[field].data)
+                for field, key in self.RATES.items()}
+
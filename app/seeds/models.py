@@ -97,22 +97,70 @@ from fractions import Fraction
 from inflection import pluralize
 from PIL import Image as Pimage
 from slugify import slugify
-from sqlalchemy import event, inspect
+from sqlalchemy import case, event, inspect, literal, select, union_all
 from sqlalchemy.ext.hybrid import Comparator, hybrid_property
 from sqlalchemy.ext.orderinglist import ordering_list
+from sqlalchemy.orm import undefer
 from sqlalchemy.sql.expression import and_
 from sqlalchemy_utils.types import TSVectorType
-from sqlalchemy_searchable import SearchQueryMixin
+from sqlalchemy_searchable import (
+    parse_search_query,
+    search_manager,
+    SearchQueryMixin
+)
 from flask_sqlalchemy import BaseQuery, SignallingSession
 from werkzeug.routing import BuildError
 
-from app import db, html_fractions, list_to_english
+from app import (
+    db,
+    html_fractions,
+    list_to_english,
+    load_nav_data,
+    page_cache
+)
 from app.db_helpers import (
+    eager_load,
+    on_commit,
     OrderingListMixin,
     row_exists,
+    session_changes,
     TimestampMixin,
     USDollar
 )
+from app.page_cache import page_key
+
+
+# Changes which may make every cached page stale, so the cache is cleared.
+ALL_PAGES = 'all pages'
+
+# Attributes which, when changed, change the navigation shown on every page.
+NAV_ATTRIBUTES = frozenset((
+    'index',
+    'index_id',
+    'idx_pos',
+    'list_as',
+    'name',
+    'position',
+    'slug',
+    'thumbnail',
+    'thumbnail_id'
+))
+
+# Attributes which, when changed, move an object to a different page.
+STRUCTURAL_ATTRIBUTES = frozenset((
+    'category',
+    'category_id',
+    'common_name',
+    'common_name_id',
+    'cultivar',
+    'cultivar_id',
+    'index',
+    'index_id',
+    'slug'
+))
+
+# Attributes shown in grows with links on other pages.
+LINK_ATTRIBUTES = frozenset(('name', 'slug', 'thumbnail', 'thumbnail_id'))
 
 
 # Association Tables
@@ -324,42 +372,36 @@ def populate_db_from_json(filename):
 
 # Module-level Functions
 
-def save_nav_data(json_file=None):
-    if not json_file:
-        json_file = Path(
-            current_app.config.get('DATA_FOLDER'), 'nav_data.json'
-        )
-        if not json_file.parent.exists():
-            json_file.parent.mkdir(parents=True)
-    else:
-        json_file = Path(json_file)
-    indexes = Index.query.order_by('position').all()
-    idx_list = []
-    for idx in indexes:
-        d = dict()
-        d['Name'] = idx.name
-        d['Position'] = idx.position
-        d['Header'] = idx.plural  # We were using header, but changed it.
-        d['id'] = idx.name.lower().replace(' ', '-')
-        d['Slug'] = idx.slug
-        d['URL'] = idx.url
+def index_nav_data(idx):
+    """Get the nav data entry for an `Index` and its common names."""
+    d = dict()
+    d['Name'] = idx.name
+    d['Position'] = idx.position
+    d['Header'] = idx.plural  # We were using header, but changed it.
+    d['id'] = idx.name.lower().replace(' ', '-')
+    d['Slug'] = idx.slug
+    d['URL'] = idx.url
+    try:
+        d['Thumbnail'] = idx.thumbnail.url
+    except:
+        d['Thumbnail'] = None
+    d['Common Names'] = list()
+    for cn in idx.common_names:
+        cnd = dict()
+        cnd['Position'] = cn.idx_pos
+        cnd['Name'] = cn.name
+        cnd['List As'] = cn.list_as
+        cnd['URL'] = cn.url
         try:
-            d['Thumbnail'] = idx.thumbnail.url
+            cnd['Thumbnail'] = cn.thumbnail.url
         except:
-            d['Thumbnail'] = None
-        d['Common Names'] = list()
-        for cn in idx.common_names:
-            cnd = dict()
-            cnd['Position'] = cn.idx_pos
-            cnd['Name'] = cn.name
-            cnd['List As'] = cn.list_as
-            cnd['URL'] = cn.url
-            try:
-                cnd['Thumbnail'] = cn.thumbnail.url
-            except:
-                cnd['Thumbnail'] = None
-            d['Common Names'].append(cnd)
-        idx_list.append(d)
+            cnd['Thumbnail'] = None
+        d['Common Names'].append(cnd)
+    return d
+
+
+def bulk_nav_data():
+    """Get the nav data entry for bulk categories."""
     bulk_cats = BulkCategory.query.order_by('list_as').all()
     bulk = dict()
     bulk['Name'] = 'Bulk'
@@ -381,9 +423,214 @@ def save_nav_data(json_file=None):
         catd['URL'] = cat.url
         catd['Thumbnail'] = None
         bulk['Common Names'].append(catd)
-    idx_list.append(bulk)
-    with json_file.open('w', encoding='utf-8') as ofile:
+    return bulk
+
+
+def save_nav_data(json_file=None, indexes=None, bulk=True):
+    """Save the data used to build the site navigation.
+
+    Entries for indexes not in `indexes` are copied from the existing file
+    instead of being loaded from the database again. The file is written to a
+    temporary file first and then moved into place, so it is never read while
+    partly written.
+
+    Args:
+        json_file: Optional path to save nav data to. Defaults to
+            `nav_data.json` in `DATA_FOLDER`.
+        indexes: Optional ids of the `Index` instances whose entries need to
+            be regenerated. If None, all entries are regenerated.
+        bulk: Whether or not to regenerate the entry for bulk categories.
+    """
+    if not json_file:
+        json_file = Path(
+            current_app.config.get('DATA_FOLDER'), 'nav_data.json'
+        )
+        if not json_file.parent.exists():
+            json_file.parent.mkdir(parents=True)
+    else:
+        json_file = Path(json_file)
+    old = dict()
+    if indexes is not None:
+        old = {d['Slug']: d for d in load_nav_data(str(json_file))}
+    idx_list = []
+    for idx in Index.query.order_by('position').all():
+        if idx.slug not in old or idx.id in indexes:
+            idx_list.append(index_nav_data(idx))
+        else:
+            idx_list.append(old[idx.slug])
+    if bulk or 'bulk' not in old:
+        idx_list.append(bulk_nav_data())
+    else:
+        idx_list.append(old['bulk'])
+    tmp_file = json_file.with_name('.{0}.tmp'.format(json_file.name))
+    with tmp_file.open('w', encoding='utf-8') as ofile:
         ofile.write(json.dumps(idx_list, indent=4))
+    os.replace(str(tmp_file), str(json_file))
+
+
+def cached_pages_for(obj, operation, keys):
+    """Get the cached pages that show `obj` and need to be rebuilt.
+
+    Args:
+        obj: An object that was inserted, updated, or deleted.
+        operation: The operation performed on `obj`; 'insert', 'update', or
+            'delete'.
+        keys: The names of attributes of `obj` that were changed.
+
+    Returns:
+        set: Keys of the cached pages affected by the change.
+        None: If the change could affect any page, such as when the
+            navigation data changes.
+    """
+    if type(obj).__module__ != __name__:
+        return set()
+    if operation == 'delete' or keys & STRUCTURAL_ATTRIBUTES:
+        return None
+    if isinstance(obj, Image):
+        return set() if operation == 'insert' else None
+    if isinstance(obj, Packet):
+        obj = obj.cultivar
+        if obj is None:
+            return set()
+        keys = set()
+    pages = set()
+    if isinstance(obj, (CommonName, BulkCategory)) and keys & NAV_ATTRIBUTES:
+        return None
+    elif isinstance(obj, CommonName):
+        idx_slug = obj.index.slug if obj.index else None
+        pages.add(page_key('seeds.index', idx_slug=idx_slug))
+        pages.add(page_key('seeds.common_name',
+                           idx_slug=idx_slug,
+                           cn_slug=obj.slug))
+        pages.add(page_key('seeds.cultivar',
+                           idx_slug=idx_slug,
+                           cn_slug=obj.slug))
+    elif isinstance(obj, (Section, Cultivar)):
+        cn = obj.common_name
+        if cn is None:
+            return set()
+        idx_slug = cn.index.slug if cn.index else None
+        pages.add(page_key('seeds.common_name',
+                           idx_slug=idx_slug,
+                           cn_slug=cn.slug))
+        if isinstance(obj, Cultivar):
+            pages.add(page_key('seeds.cultivar',
+                               idx_slug=idx_slug,
+                               cn_slug=cn.slug,
+                               cv_slug=obj.slug))
+        if operation == 'update' and keys & LINK_ATTRIBUTES:
+            attr = 'gw_cultivars' if isinstance(obj, Cultivar) else \
+                'gw_sections'
+            for model in (CommonName, Cultivar):
+                referrers = model.query.filter(
+                    getattr(model, attr).contains(obj)
+                )
+                for ref in referrers:
+                    pages |= cached_pages_for(ref, 'update', set())
+    elif isinstance(obj, (BulkCategory, BulkSeries, BulkItem)):
+        cat = obj if isinstance(obj, BulkCategory) else obj.category
+        pages.add(page_key('seeds.bulk'))
+        if cat is not None:
+            pages.add(page_key('seeds.bulk_category', slug=cat.slug))
+    elif operation == 'update':
+        # Indexes and anything else shown on many pages.
+        return None
+    return pages
+
+
+def search_catalog(terms, page=1, per_page=20):
+    """Search the catalog with Postgres full text search.
+
+    `Index`, `CommonName`, `Section`, `Cultivar`, and `Image` rows are all
+    searched and ranked in a single query, and only the requested page of
+    results is loaded.
+
+    Args:
+        terms: The text to search for, in the format accepted by
+            `sqlalchemy_searchable.parse_search_query`.
+        page: The page of results to get, starting from 1.
+        per_page: The number of results on each page.
+
+    Returns:
+        tuple: A list of results and the total number of results. Each
+            result is a dict with the keys 'type', 'id', 'name', 'url',
+            'thumbnail', 'rank', and 'snippet', where snippet is an excerpt of
+            the object's text with matching words in <b> tags.
+    """
+    parsed = parse_search_query(terms or '')
+    if not parsed:
+        return [], 0
+    regconfig = search_manager.options['regconfig']
+    tsquery = db.func.to_tsquery(regconfig, parsed)
+
+    def matches(kind, model, text, *criteria):
+        plain = db.func.regexp_replace(
+            db.func.coalesce(text, ''), '<[^>]*>', '', 'g'
+        )
+        return select([
+            literal(kind).label('kind'),
+            model.id.label('id'),
+            db.func.ts_rank_cd(model.search_vector, tsquery).label('rank'),
+            db.func.ts_headline(
+                regconfig, plain, tsquery, 'MaxWords=30, MinWords=10'
+            ).label('snippet')
+        ]).where(and_(model.search_vector.op('@@')(tsquery), *criteria))
+
+    models = {
+        'index': Index,
+        'common name': CommonName,
+        'section': Section,
+        'cultivar': Cultivar,
+        'image': Image
+    }
+    found = union_all(
+        matches('index', Index, Index.description),
+        matches('common name',
+                CommonName,
+                CommonName.description,
+                CommonName.visible.isnot(False)),
+        matches('section', Section, Section.description),
+        matches('cultivar',
+                Cultivar,
+                Cultivar.description,
+                Cultivar.active == True,  # noqa
+                Cultivar.visible == True),  # noqa
+        matches('image', Image, Image.filename)
+    ).alias('found')
+    rows = db.session.execute(
+        select([found, db.func.count().over().label('total')]).order_by(
+            found.c.rank.desc(), found.c.kind, found.c.id
+        ).limit(per_page).offset((max(page, 1) - 1) * per_page)
+    ).fetchall()
+    ids = dict()
+    for row in rows:
+        ids.setdefault(row.kind, []).append(row.id)
+    objs = dict()
+    for kind, kind_ids in ids.items():
+        model = models[kind]
+        for obj in model.query.filter(model.id.in_(kind_ids)):
+            objs[(kind, obj.id)] = obj
+    results = []
+    for row in rows:
+        obj = objs.get((row.kind, row.id))
+        if obj is None:
+            continue
+        if isinstance(obj, Image):
+            name = obj.filename
+            thumbnail = obj.url
+        else:
+            name = obj.fullname if hasattr(obj, 'fullname') else obj.name
+            thumbnail = obj.thumbnail.url if obj.thumbnail else None
+        results.append({
+            'type': row.kind,
+            'id': row.id,
+            'name': name,
+            'url': obj.url,
+            'thumbnail': thumbnail,
+            'rank': float(row.rank),
+            'snippet': row.snippet
+        })
+    return results, rows[0].total if rows else 0
 
 
 # Models
@@ -1001,6 +1248,63 @@ class CommonName(db.Model, OrderingListMixin, SlugMixin, TimestampMixin):
             cls.slug == cn_slug
         ).one_or_none()
 
+    @classmethod
+    def for_page(cls, idx_slug, cn_slug):
+        """Get a `CommonName` with everything shown on its page loaded.
+
+        Every `Cultivar` and `Section` shown on a common name page belongs to
+        the `CommonName`, so loading `cultivars` and `sections` along with the
+        relationships used to display them lets the rest of the page be filled
+        in from the identity map instead of being lazy loaded one row at a
+        time. The number of public cultivars and whether each section has any
+        are counted by the database.
+
+        Args:
+            idx_slug: The slug of the `Index` the `CommonName` belongs to.
+            cn_slug: The slug of the `CommonName` to load.
+
+        Returns:
+            CommonName: The `CommonName` with the given slugs, or None if it
+                doesn't exist.
+        """
+        cv_paths = ('thumbnail',
+                    'packets',
+                    'noship_states',
+                    'gw_common_names.index',
+                    'gw_sections.common_name.index',
+                    'gw_cultivars.common_name.index')
+        sec_paths = ('thumbnail', 'cultivars', 'child_cultivars', 'children')
+        paths = ['index',
+                 'thumbnail',
+                 'noship_states',
+                 'child_cultivars',
+                 'child_sections',
+                 'gw_common_names.index',
+                 'gw_common_names.thumbnail',
+                 'gw_sections.common_name.index',
+                 'gw_sections.thumbnail',
+                 'gw_cultivars.common_name.index',
+                 'gw_cultivars.thumbnail']
+        paths += ['cultivars.' + p for p in cv_paths]
+        paths += ['sections.' + p for p in sec_paths]
+        paths += ['child_sections.children.' + p for p in sec_paths]
+        cn = cls.query.join(
+            Index, Index.id == cls.index_id
+        ).filter(
+            Index.slug == idx_slug,
+            cls.slug == cn_slug
+        ).options(
+            undefer('public_cultivar_count'),
+            *(eager_load(cls, p) for p in paths)
+        ).one_or_none()
+        if cn is not None:
+            sections = list(cn.sections)
+            for sec in cn.child_sections:
+                sections.append(sec)
+                sections += sec.children
+            Section.load_has_public_cultivars(set(sections))
+        return cn
+
     @classmethod
     def get_orphans(cls):
         """Get all`CommonName` instances which don't belong to an `Index`."""
@@ -1130,8 +1434,14 @@ class CommonName(db.Model, OrderingListMixin, SlugMixin, TimestampMixin):
 
     @property
     def has_public_cultivars(self):
-        """bool: Whether or not `CommonName` has any public cultivars."""
-        return self.cultivars and any(cv.public for cv in self.cultivars)
+        """bool: Whether or not `CommonName` has any public cultivars.
+
+        Persisted instances use `public_cultivar_count`, which is counted by
+        the database instead of loading every `Cultivar`.
+        """
+        if self.id is None:
+            return self.cultivars and any(cv.public for cv in self.cultivars)
+        return bool(self.public_cultivar_count)
 
 
 class SectionQuery(BaseQuery, SearchQueryMixin):
@@ -1311,7 +1621,12 @@ class Section(db.Model, OrderingListMixin, SlugMixin, TimestampMixin):
 
     @property
     def has_public_cultivars(self):
-        """bool: Whether or not `Section` has any public cultivars."""
+        """bool: Whether or not `Section` has any public cultivars.
+
+        Uses the value set by `load_has_public_cultivars` if there is one.
+        """
+        if '_has_public_cultivars' in self.__dict__:
+            return self._has_public_cultivars
         rv = False
         if self.cultivars:
             if any(cv.public for cv in self.cultivars):
@@ -1323,6 +1638,62 @@ class Section(db.Model, OrderingListMixin, SlugMixin, TimestampMixin):
                 rv = True
         return rv
 
+    @classmethod
+    def load_has_public_cultivars(cls, sections):
+        """Set `has_public_cultivars` for many sections with one query.
+
+        The number of cultivars, public cultivars, and featured cultivars in
+        each section are counted by the database, and the results are stored
+        on the instances so `has_public_cultivars` doesn't need to load their
+        cultivars.
+
+        Args:
+            sections: `Section` instances to set `has_public_cultivars` for.
+                Child sections should be included, otherwise they will be
+                checked one at a time.
+
+        Returns:
+            dict: `has_public_cultivars` for each section, formatted:
+                {<section id>: <bool>, ...}
+        """
+        sections = [s for s in sections if s.id is not None]
+        if not sections:
+            return {}
+        public = case(
+            [(and_(Cultivar.active == True,  # noqa
+                   Cultivar.visible == True), 1)],  # noqa
+            else_=0
+        )
+        featured = case([(Cultivar.featured == True, 1)], else_=0)  # noqa
+        rows = db.session.query(
+            cultivars_to_sections.c.section_id,
+            db.func.count(Cultivar.id),
+            db.func.sum(public),
+            db.func.sum(featured)
+        ).join(
+            Cultivar, Cultivar.id == cultivars_to_sections.c.cultivar_id
+        ).filter(
+            cultivars_to_sections.c.section_id.in_([s.id for s in sections])
+        ).group_by(cultivars_to_sections.c.section_id)
+        counts = {sid: (total, pub, feat) for sid, total, pub, feat in rows}
+        flags = {}
+        for sec in sections:
+            if sec.id in counts:
+                total, pub, feat = counts[sec.id]
+                rv = bool(pub) and feat < total
+            else:
+                # Sections without cultivars get their value from their
+                # children, once all sections with cultivars are set.
+                rv = None
+            flags[sec.id] = rv
+            if rv is not None:
+                sec._has_public_cultivars = rv
+        for sec in sections:
+            if flags[sec.id] is None:
+                flags[sec.id] = sec.has_public_cultivars
+                sec._has_public_cultivars = flags[sec.id]
+        return flags
+
     @classmethod
     def from_ids(cls, ids):
         """Return a list of `Section` instances with `ids`.
@@ -1868,6 +2239,7 @@ class Packet(db.Model, TimestampMixin):
         price: Price (in US dollars) for this packet.
         amount: The amount of seeds in a packet.
         cultivar: The `Cultivar` a `Packet` belongs to.
+        product: The `Product` with `sku` as its number, if there is one.
     """
     __tablename__ = 'packets'
     id = db.Column(db.Integer, primary_key=True)
@@ -1877,6 +2249,12 @@ class Packet(db.Model, TimestampMixin):
     amount = db.Column(db.UnicodeText)
     cultivar_id = db.Column(db.Integer, db.ForeignKey('cultivars.id'))
     cultivar = db.relationship('Cultivar', back_populates='packets')
+    product = db.relationship(
+        'Product',
+        primaryjoin='foreign(Packet.sku) == Product.number',
+        backref=db.backref('packet', uselist=False, viewonly=True),
+        viewonly=True
+    )
 
     def __repr__(self):
         return '<{0} SKU #{1}>'.format(self.__class__.__name__, self.sku)
@@ -2373,14 +2751,94 @@ class BulkItem(db.Model, OrderingListMixin, SlugMixin, TimestampMixin):
         return item
 
 
+# Aggregates of models defined after the models they are attached to.
+CommonName.public_cultivar_count = db.column_property(
+    select([db.func.count(Cultivar.id)]).where(
+        and_(Cultivar.common_name_id == CommonName.id,
+             Cultivar.active == True,  # noqa
+             Cultivar.visible == True)  # noqa
+    ).correlate_except(Cultivar).label('public_cultivar_count'),
+    deferred=True,
+    doc='int: Number of active and visible cultivars in `CommonName`.'
+)
+
+
+# Full text search indexes. These are not created by sqlalchemy_searchable.
+db.Index('ix_indexes_search_vector',
+         Index.search_vector,
+         postgresql_using='gin')
+db.Index('ix_common_names_search_vector',
+         CommonName.search_vector,
+         postgresql_using='gin')
+db.Index('ix_sections_search_vector',
+         Section.search_vector,
+         postgresql_using='gin')
+db.Index('ix_cultivars_search_vector',
+         Cultivar.search_vector,
+         postgresql_using='gin')
+db.Index('ix_images_search_vector',
+         Image.search_vector,
+         postgresql_using='gin')
+
+
 # Event Listeners
 @event.listens_for(SignallingSession, 'before_commit')
 def save_nav_data_before_commit(session):
-    """Save nav data if a commit would change a nav url."""
-    if (any(isinstance(obj, Index) for obj in db.session) or
-            any(isinstance(obj, CommonName) for obj in db.session) or
-            any(isinstance(obj, BulkCategory) for obj in db.session)):
-        save_nav_data()
+    """Save nav data for indexes with changes that show up in the nav."""
+    if session.transaction.nested:
+        return
+    indexes = set()
+    bulk = False
+    for obj, operation, keys in session_changes(session):
+        if isinstance(obj, Image):
+            if operation != 'insert' and 'filename' in keys:
+                # The image could be the thumbnail of any index.
+                indexes = None
+                break
+        elif operation == 'update' and not keys & NAV_ATTRIBUTES:
+            continue
+        elif isinstance(obj, Index):
+            indexes.add(obj.id)
+        elif isinstance(obj, CommonName):
+            if operation == 'update' and keys & {'index', 'index_id'}:
+                # The old index can't be found after the flush.
+                indexes = None
+                break
+            indexes.add(obj.index_id)
+        elif isinstance(obj, BulkCategory):
+            bulk = True
+    if indexes is None or indexes or bulk:
+        save_nav_data(indexes=indexes, bulk=bulk or indexes is None)
+
+
+def find_stale_pages(changes):
+    """Find cached pages showing objects changed by a commit.
+
+    The pages are dropped from the cache after the commit, so a page can't be
+    rendered and cached again with the old data while the commit is running.
+
+    Returns:
+        set: Keys of the stale pages, `ALL_PAGES`, or None if no pages are
+            stale.
+    """
+    pages = set()
+    for obj, operation, keys in changes:
+        obj_pages = cached_pages_for(obj, operation, keys)
+        if obj_pages is None:
+            return ALL_PAGES
+        pages |= obj_pages
+    return pages or None
+
+
+def drop_stale_pages(pages):
+    """Drop the cached pages found by `find_stale_pages`."""
+    if pages == ALL_PAGES:
+        page_cache.clear()
+    else:
+        page_cache.invalidate(pages)
+
+
+on_commit('stale pages', find_stale_pages, drop_stale_pages)
 
 
 @event.listens_for(SignallingSession, 'before_attach')
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.seeds.suggest
+
+This module contains an in-memory prefix index of catalog names, used to
+suggest completions as customers type in the search box without querying the
+database on each keystroke.
+"""
+
+import re
+from bisect import bisect_left, insort
+
+from sqlalchemy.orm import joinedload
+
+from app.db_helpers import on_commit, StampFile
+from app.seeds.models import CommonName, Cultivar, Index
+
+
+# Changes which may change every suggestion, so the index is rebuilt.
+REBUILD = 'rebuild'
+
+
+def normalize(text):
+    """Lowercase `text`, removing html tags, punctuation and extra spaces."""
+    text = re.sub(r'<[^>]*>', ' ', text or '')
+    return ' '.join(re.sub(r'[^\w\s\'-]', ' ', text.lower()).split())
+
+
+def word_starts(text):
+    """Get `text` starting from each of its words.
+
+    Example:
+        >>> word_starts('Red Spider Zinnia')
+        ['red spider zinnia', 'spider zinnia', 'zinnia']
+    """
+    words = normalize(text).split()
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+class SuggestIndex(object):
+    """A sorted list of catalog names that can be searched by prefix.
+
+    Each process keeps its own index. The process that commits a change to
+    the catalog updates its index in place, and marks a stamp file so other
+    processes know to rebuild theirs the next time they are used.
+
+    Attributes:
+        entries (list): Sorted tuples formatted (<key>, <type>, <id>), where
+            key is a normalized name starting at one of its words.
+        items (dict): Suggestions, formatted:
+            {(<type>, <id>): {'type': <type>, 'name': <name>, 'url': <url>}}
+        keys (dict): The keys of the entries of each suggestion, so they can
+            be found in `entries` without searching all of it, formatted:
+            {(<type>, <id>): [<key>, ...]}
+        stamp (StampFile): The file marking the index stale.
+        version: The version of the stamp file the index was built with.
+    """
+    def __init__(self):
+        self.entries = None
+        self.items = {}
+        self.keys = {}
+        self.stamp = StampFile('suggest_index.dat')
+        self.version = None
+
+    def __repr__(self):
+        return '<{0} with {1} items>'.format(self.__class__.__name__,
+                                             len(self.items))
+
+    @staticmethod
+    def item_for(obj):
+        """Get the suggestion and names to index for a catalog object.
+
+        `CommonName` instances are found by `name`, `list_as`, and
+        `botanical_names`, and `Cultivar` instances by `fullname` and
+        `botanical_name`. Cultivars of hidden common names are not
+        suggested.
+
+        Returns:
+            tuple: The suggestion dict and a list of names.
+            None: If `obj` should not be suggested.
+        """
+        if isinstance(obj, Cultivar):
+            if not obj.public or obj.common_name is None or \
+                    obj.common_name.visible is False:
+                return None
+            item = {'type': 'cultivar', 'name': obj.fullname, 'url': obj.url}
+            names = [obj.fullname, obj.botanical_name]
+        elif isinstance(obj, CommonName):
+            if obj.visible is False or obj.index is None:
+                return None
+            item = {'type': 'common name', 'name': obj.name, 'url': obj.url}
+            names = [obj.name, obj.list_as]
+            names += re.split(r'[,;]', obj.botanical_names or '')
+        else:
+            return None
+        return item, names
+
+    def build(self):
+        """Load all catalog names from the database."""
+        self.version = self.stamp.version()
+        self.entries = []
+        self.items = {}
+        self.keys = {}
+        cns = CommonName.query.options(joinedload('index'))
+        cvs = Cultivar.query.options(
+            joinedload('common_name').joinedload('index')
+        ).filter(Cultivar.active == True,  # noqa
+                 Cultivar.visible == True)  # noqa
+        for obj in list(cns) + list(cvs):
+            self._add(self.item_key(obj), self.item_for(obj))
+        self.entries.sort()
+
+    @staticmethod
+    def item_key(obj):
+        """Get the key of the suggestion for `obj` in `items`."""
+        kind = 'cultivar' if isinstance(obj, Cultivar) else 'common name'
+        return (kind, obj.id)
+
+    def _add(self, item_key, found, keep_sorted=False):
+        if found is None:
+            return
+        item, names = found
+        self.items[item_key] = item
+        keys = set()
+        for name in names:
+            keys.update(word_starts(name))
+        self.keys[item_key] = list(keys)
+        for key in keys:
+            if keep_sorted:
+                insort(self.entries, (key,) + item_key)
+            else:
+                self.entries.append((key,) + item_key)
+
+    def _remove(self, item_key):
+        if self.items.pop(item_key, None) is not None:
+            for key in self.keys.pop(item_key):
+                entry = (key,) + item_key
+                i = bisect_left(self.entries, entry)
+                if i < len(self.entries) and self.entries[i] == entry:
+                    del self.entries[i]
+
+    def update(self, changes):
+        """Update changed entries in this process and mark others stale.
+
+        Args:
+            changes: A list of tuples formatted (<item key>, <item>) where
+                item is the result of `item_for` for a changed object, or None
+                if the object was deleted or should no longer be suggested.
+                `REBUILD` if the index should be built again instead.
+        """
+        if changes != REBUILD and self.entries is not None and \
+                self.version == self.stamp.version():
+            for item_key, found in changes:
+                self._remove(item_key)
+                self._add(item_key, found, keep_sorted=True)
+        else:
+            self.entries = None
+        self.stamp.touch()
+        if self.entries is not None:
+            self.version = self.stamp.version()
+
+    def suggest(self, prefix, limit=10):
+        """Get suggestions for names containing a word starting with `prefix`.
+
+        Args:
+            prefix: The text typed so far.
+            limit: The maximum number of suggestions to return.
+
+        Returns:
+            list: Suggestion dicts, ordered by the matching name.
+        """
+        if self.entries is None or self.version != self.stamp.version():
+            self.build()
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        suggestions = []
+        seen = set()
+        i = bisect_left(self.entries, (prefix,))
+        while i < len(self.entries) and len(suggestions) < limit:
+            key, kind, obj_id = self.entries[i]
+            if not key.startswith(prefix):
+                break
+            if (kind, obj_id) not in seen:
+                seen.add((kind, obj_id))
+                suggestions.append(self.items[(kind, obj_id)])
+            i += 1
+        return suggestions
+
+
+suggestions = SuggestIndex()
+
+
+def find_suggestion_changes(changes):
+    """Get new suggestions for catalog objects changed by a commit.
+
+    Cultivars are suggested by their full name and url, which include their
+    common name, so they are suggested again when their common name is
+    changed or deleted.
+
+    Returns:
+        list: Changes to pass to `SuggestIndex.update`, `REBUILD`, or None
+            if no suggestions changed.
+    """
+    found_changes = []
+    for obj, operation, keys in changes:
+        if isinstance(obj, Index) and operation != 'insert':
+            # Every common name and cultivar in the index has a new url.
+            return REBUILD
+        if isinstance(obj, (CommonName, Cultivar)):
+            found = None if operation == 'delete' else \
+                SuggestIndex.item_for(obj)
+            found_changes.append((SuggestIndex.item_key(obj), found))
+        if isinstance(obj, CommonName) and operation != 'insert':
+            for cv in obj.cultivars:
+                found = None if operation == 'delete' else \
+                    SuggestIndex.item_for(cv)
+                found_changes.append((SuggestIndex.item_key(cv), found))
+    return found_changes or None
+
+
+on_commit('suggestion changes', find_suggestion_changes, suggestions.update)
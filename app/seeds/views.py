@@ -30,26 +30,41 @@ from flask import (
 )
 from flask_login import login_required
 
-from app import db, format_ship_date, list_to_english, Permission
+from app import (
+    db,
+    format_ship_date,
+    list_to_english,
+    page_cache,
+    Permission
+)
 from app.breadcrumbs import Crumbler
-from app.decorators import permission_required
+from app.decorators import conditional, permission_required
 from app.pending import Pending
 from app.redirects import Redirect, RedirectsFile
 from . import seeds
 from ..lastcommit import LastCommit
-from app.db_helpers import dbify
+from app.db_helpers import dbify, last_modified
 from app.seeds.models import (
     BulkCategory,
     BulkItem,
     BulkSeries,
     CommonName,
+    common_names_to_gw_common_names,
+    common_names_to_gw_cultivars,
+    common_names_to_gw_sections,
     Cultivar,
+    cultivars_to_gw_common_names,
+    cultivars_to_gw_cultivars,
+    cultivars_to_gw_sections,
+    cultivars_to_sections,
     Image,
     Index,
     Packet,
+    search_catalog,
     Section,
     USDollar
 )
+from app.seeds.suggest import suggestions
 from app.seeds.forms import (
     AddBulkCategoryForm,
     AddBulkItemForm,
@@ -68,10 +83,12 @@ from app.seeds.forms import (
     EditIndexForm,
     EditPacketForm,
     EditSectionForm,
+    EditRatesForm,
     EditShipDateForm,
     RemoveObjectForm,
     SelectObjectForm
 )
+from app.shop.rates import shipping_rates
 
 
 cblr = Crumbler('seeds')
@@ -481,6 +498,146 @@ def edit_thumbnail(form, obj, messages):
     return edited
 
 
+# Functions for finding when the data shown on a page last changed.
+def bulk_last_modified():
+    """Get last change to data shown on the bulk page."""
+    return last_modified(BulkCategory.query)
+
+
+def bulk_category_last_modified(slug):
+    """Get last change to data shown on a `BulkCategory` page."""
+    return last_modified(
+        BulkCategory.query.filter(BulkCategory.slug == slug),
+        BulkSeries.query.join(
+            BulkCategory, BulkCategory.id == BulkSeries.category_id
+        ).filter(BulkCategory.slug == slug),
+        BulkItem.query.join(
+            BulkCategory, BulkCategory.id == BulkItem.category_id
+        ).filter(BulkCategory.slug == slug)
+    )
+
+
+def index_last_modified(idx_slug):
+    """Get last change to data shown on an `Index` page."""
+    return last_modified(
+        Index.query.filter(Index.slug == idx_slug),
+        CommonName.query.join(
+            Index, Index.id == CommonName.index_id
+        ).filter(Index.slug == idx_slug)
+    )
+
+
+def linked(model, column, owner, owner_column):
+    """Query rows of `model` linked to rows of `owner` by a link table.
+
+    One row is selected per link, so `last_modified` notices links being
+    added and removed even though link tables have no timestamps. `model` is
+    aliased, so `owner` and its parents can be joined to filter the query.
+
+    Args:
+        model: The linked model.
+        column: The column of the link table holding ids of `model`.
+        owner: The model the links belong to.
+        owner_column: The column of the link table holding ids of `owner`.
+    """
+    alias = db.aliased(model)
+    return db.session.query(alias).join(
+        column.table, column == alias.id
+    ).join(owner, owner.id == owner_column)
+
+
+def common_name_links():
+    """list: Queries of rows linked to common names shown on their pages."""
+    return [
+        linked(CommonName,
+               common_names_to_gw_common_names.c.child_id,
+               CommonName,
+               common_names_to_gw_common_names.c.parent_id),
+        linked(Section,
+               common_names_to_gw_sections.c.section_id,
+               CommonName,
+               common_names_to_gw_sections.c.common_name_id),
+        linked(Cultivar,
+               common_names_to_gw_cultivars.c.cultivar_id,
+               CommonName,
+               common_names_to_gw_cultivars.c.common_name_id)
+    ]
+
+
+def cultivar_links():
+    """list: Queries of rows linked to cultivars shown with them."""
+    return [
+        linked(CommonName,
+               cultivars_to_gw_common_names.c.common_name_id,
+               Cultivar,
+               cultivars_to_gw_common_names.c.cultivar_id),
+        linked(Section,
+               cultivars_to_gw_sections.c.section_id,
+               Cultivar,
+               cultivars_to_gw_sections.c.cultivar_id),
+        linked(Cultivar,
+               cultivars_to_gw_cultivars.c.child_id,
+               Cultivar,
+               cultivars_to_gw_cultivars.c.parent_id),
+        linked(Section,
+               cultivars_to_sections.c.section_id,
+               Cultivar,
+               cultivars_to_sections.c.cultivar_id)
+    ]
+
+
+def thumbnail(owner):
+    """Query the `Image` rows used as thumbnails of rows of `owner`."""
+    return Image.query.join(owner, owner.thumbnail_id == Image.id)
+
+
+def common_name_last_modified(idx_slug, cn_slug):
+    """Get last change to data shown on a `CommonName` page."""
+    def in_cn(query, model=Cultivar):
+        if model is not CommonName:
+            query = query.join(CommonName,
+                               CommonName.id == model.common_name_id)
+        return query.join(
+            Index, Index.id == CommonName.index_id
+        ).filter(Index.slug == idx_slug, CommonName.slug == cn_slug)
+
+    return last_modified(
+        Index.query.filter(Index.slug == idx_slug),
+        in_cn(CommonName.query, CommonName),
+        in_cn(Section.query, Section),
+        in_cn(Cultivar.query),
+        in_cn(Packet.query.join(Cultivar, Cultivar.id == Packet.cultivar_id)),
+        in_cn(thumbnail(CommonName), CommonName),
+        in_cn(thumbnail(Section), Section),
+        in_cn(thumbnail(Cultivar)),
+        *([in_cn(q, CommonName) for q in common_name_links()] +
+          [in_cn(q) for q in cultivar_links()])
+    )
+
+
+def cultivar_last_modified(idx_slug, cn_slug, cv_slug):
+    """Get last change to data shown on a `Cultivar` page."""
+    def in_cv(query):
+        return query.join(
+            CommonName, CommonName.id == Cultivar.common_name_id
+        ).join(
+            Index, Index.id == CommonName.index_id
+        ).filter(Index.slug == idx_slug,
+                 CommonName.slug == cn_slug,
+                 Cultivar.slug == cv_slug)
+
+    return last_modified(
+        Index.query.filter(Index.slug == idx_slug),
+        CommonName.query.join(
+            Index, Index.id == CommonName.index_id
+        ).filter(Index.slug == idx_slug, CommonName.slug == cn_slug),
+        in_cv(Cultivar.query),
+        in_cv(Packet.query.join(Cultivar, Cultivar.id == Packet.cultivar_id)),
+        in_cv(thumbnail(Cultivar)),
+        *[in_cv(q) for q in cultivar_links()]
+    )
+
+
 @seeds.route('/')
 def home():
     """Home page."""
@@ -488,6 +645,8 @@ def home():
 
 
 @seeds.route('/bulk/')
+@conditional(bulk_last_modified, cache=page_cache)
+@page_cache.cached
 def bulk():
     categories = BulkCategory.query.all()
     crumbs = (
@@ -502,6 +661,8 @@ def bulk():
 
 
 @seeds.route('/bulk/<slug>.html')
+@conditional(bulk_category_last_modified, cache=page_cache)
+@page_cache.cached
 def bulk_category(slug):
     category = BulkCategory.query.filter(
         BulkCategory.slug == slug
@@ -2004,6 +2165,8 @@ def manage():
 
 
 @seeds.route('/<idx_slug>/')
+@conditional(index_last_modified, cache=page_cache)
+@page_cache.cached
 def index(idx_slug=None):
     """Display an `Index`."""
     index = Index.query.filter_by(slug=idx_slug).one_or_none()
@@ -2020,28 +2183,20 @@ def index(idx_slug=None):
 
 
 @seeds.route('/<idx_slug>/<cn_slug>.html')
+@conditional(common_name_last_modified, cache=page_cache)
+@page_cache.cached
 def common_name(idx_slug=None, cn_slug=None):
     """Display page for a common name."""
-    cn = CommonName.query\
-        .join(Index, Index.id == CommonName.index_id)\
-        .filter(CommonName.slug == cn_slug, Index.slug == idx_slug)\
-        .one_or_none()
+    cn = CommonName.for_page(idx_slug, cn_slug)
     if cn is not None:
         individuals = cn.child_cultivars
-        count = len([cv for cv in cn.cultivars if cv.public])
+        count = cn.public_cultivar_count
         crumbs = (
             cblr.crumble('home', 'Home'),
             cblr.crumble('index', cn.index.header, idx_slug=idx_slug),
             cn.name
         )
         featured = [c for c in cn.cultivars if c.featured]
-        # TMP
-        print(cn.name)
-        print('Total cultivars: {0}'.format(len(cn.cultivars)))
-        print('Active cultivars: {0}'.format(len([(c for c in cn.cultivars
-                                                   if c.active)])))
-        print('In stock cultivars: {0}'.format(len([(c for c in cn.cultivars
-                                                     if c.in_stock)])))
         return render_template('seeds/common_name.html',
                                featured=featured,
                                individuals=individuals,
@@ -2053,6 +2208,8 @@ def common_name(idx_slug=None, cn_slug=None):
 
 
 @seeds.route('/<idx_slug>/<cn_slug>/<cv_slug>.html')
+@conditional(cultivar_last_modified, cache=page_cache)
+@page_cache.cached
 def cultivar(idx_slug=None, cn_slug=None, cv_slug=None):
     """Display a page for a given cultivar."""
     if idx_slug and cn_slug and cv_slug:
@@ -2100,11 +2257,26 @@ def edit_ship_date():
         ship_date = sd.strftime('%m/%d/%Y')
         with open('data/ship_date.dat', 'w', encoding='utf-8') as ofile:
             ofile.write(ship_date)
+        page_cache.clear()
         flash('Ship date set to {}.'.format(ship_date))
         return redirect(request.args.get('origin') or url_for('seeds.manage'))
     return render_template('seeds/edit_ship_date.html', form=form)
 
 
+@seeds.route('/edit_rates/', methods=['GET', 'POST'])
+@permission_required(Permission.MANAGE_SEEDS)
+def edit_rates():
+    """Edit shipping rates."""
+    form = EditRatesForm()
+    if form.validate_on_submit():
+        shipping_rates.save(form.rates)
+        flash('Shipping rates saved.')
+        return redirect(request.args.get('origin') or url_for('seeds.manage'))
+    if not form.is_submitted():
+        form.populate(shipping_rates.get())
+    return render_template('seeds/edit_rates.html', form=form)
+
+
 # Functions and views for moving objects in ordering_list collections.
 def move_object(cls, obj_id, delta):
     """Move a movable object (in an `ordering_list`) <delta> positions.
@@ -2160,6 +2332,50 @@ def new_seeds():
     return 'Nothing here yet!'
 
 
+@seeds.route('/search')
+def search():
+    """Show catalog search results."""
+    terms = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = 20
+    results, total = search_catalog(terms, page=page, per_page=per_page)
+    crumbs = (
+        cblr.crumble('home', 'Home'),
+        cblr.crumble('search', 'Search')
+    )
+    return render_template('seeds/search.html',
+                           crumbs=crumbs,
+                           page=page,
+                           pages=(total + per_page - 1) // per_page,
+                           results=results,
+                           terms=terms,
+                           total=total)
+
+
+@seeds.route('/search/suggest')
+def search_suggest():
+    """Return names starting with the given text as JSON."""
+    return jsonify(
+        suggestions=suggestions.suggest(request.args.get('q', ''))
+    )
+
+
+@seeds.route('/api/search')
+def search_api():
+    """Return catalog search results as JSON."""
+    terms = request.args.get('q', '')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 20, type=int), 1), 100)
+    results, total = search_catalog(terms, page=page, per_page=per_page)
+    return jsonify(
+        query=terms,
+        page=page,
+        per_page=per_page,
+        total=total,
+        results=results
+    )
+
+
 @seeds.route('/site-map.html')
 def site_map():
     new_for_year = 2017  # TODO
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.server_session
+
+This module contains a session interface which keeps session data in the
+database, so the session cookie only holds a random session id instead of
+the whole (signed) session, including the cart.
+"""
+
+import base64
+import datetime
+import os
+import time
+
+from flask import session as current_session
+from flask.sessions import (
+    SessionInterface,
+    SessionMixin,
+    session_json_serializer
+)
+from sqlalchemy import select
+from werkzeug.datastructures import CallbackDict
+
+from app import db
+
+
+class StoredSession(db.Model):
+    """Table for session data of `ServerSessionInterface`.
+
+    Attributes:
+
+    id - The random session id stored in the session cookie.
+    user_id - The id of the logged in `User` the session belongs to, if any.
+    data - The session data, serialized the same way Flask serializes
+        session cookies.
+    expires - When the session can be swept from the table.
+    """
+    __tablename__ = 'stored_sessions'
+    id = db.Column(db.Unicode(64), primary_key=True)
+    user_id = db.Column(db.Integer, index=True)
+    data = db.Column(db.UnicodeText)
+    expires = db.Column(db.DateTime, index=True)
+
+    def __repr__(self):
+        return '<{0} {1} expires: {2}>'.format(self.__class__.__name__,
+                                               self.id,
+                                               self.expires)
+
+    @classmethod
+    def latest_value(cls, user_id, key, exclude=None):
+        """Get a session value from the user's most recently used session.
+
+        This lets logged in users pick up data such as their cart from
+        sessions started on other devices.
+
+        Args:
+            user_id: The id of the `User` whose sessions to look in.
+            key: The key of the value to get.
+            exclude: Optional id of a session to skip, usually the current
+                one.
+
+        Returns:
+            The value, or None if none of the user's sessions have it.
+        """
+        table = cls.__table__
+        query = select([table.c.data]).where(
+            table.c.user_id == user_id
+        ).where(
+            table.c.expires > datetime.datetime.utcnow()
+        ).order_by(table.c.expires.desc()).limit(5)
+        if exclude:
+            query = query.where(table.c.id != exclude)
+        for data, in db.engine.execute(query):
+            value = session_json_serializer.loads(data).get(key)
+            if value:
+                return value
+        return None
+
+    @classmethod
+    def sweep(cls):
+        """Delete expired sessions.
+
+        Returns:
+            int: The number of sessions deleted.
+        """
+        table = cls.__table__
+        now = datetime.datetime.utcnow()
+        return db.engine.execute(
+            table.delete().where(table.c.expires <= now)
+        ).rowcount
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data loaded from a `StoredSession`.
+
+    Attributes:
+        sid (str): The session id.
+        new (bool): Whether or not the session is not stored yet.
+        modified (bool): Whether or not the data has changed since it was
+            loaded.
+        expires (datetime): When the stored session expires.
+        replaces (str): The id of a stored session to delete when this one is
+            saved, if its id was changed with `regenerate`.
+    """
+    def __init__(self, initial=None, sid=None, new=False, expires=None):
+        def on_update(self):
+            self.modified = True
+        CallbackDict.__init__(self, initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.expires = expires
+        self.replaces = None
+
+    def regenerate(self, sid):
+        """Move the session data to the new session id `sid`.
+
+        The stored session with the old id is deleted when the session is
+        saved, so an id someone else learned before it was changed can't be
+        used afterwards.
+        """
+        if not self.new:
+            self.replaces = self.sid
+        self.sid = sid
+        self.new = True
+        self.modified = True
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keep sessions in the `stored_sessions` table.
+
+    Sessions are stored for `PERMANENT_SESSION_LIFETIME`, which is extended
+    once half of it has passed, so sessions that are only read don't need to
+    be written on every request. Expired sessions are swept at most once
+    every `SESSION_SWEEP_INTERVAL` seconds by each process.
+
+    The database is accessed through `db.engine` rather than `db.session`,
+    so loading and saving the session doesn't affect the transaction of the
+    view handling the request.
+
+    Attributes:
+        last_sweep (float): When this process last swept expired sessions.
+    """
+    session_class = ServerSession
+
+    def __init__(self):
+        self.last_sweep = 0.0
+
+    @staticmethod
+    def generate_sid():
+        return base64.urlsafe_b64encode(
+            os.urandom(32)
+        ).rstrip(b'=').decode('ascii')
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            table = StoredSession.__table__
+            row = db.engine.execute(
+                select([table.c.data, table.c.expires]).where(
+                    table.c.id == sid
+                ).where(
+                    table.c.expires > datetime.datetime.utcnow()
+                )
+            ).first()
+            if row is not None:
+                try:
+                    data = session_json_serializer.loads(row.data)
+                except ValueError:
+                    data = {}
+                return self.session_class(data, sid=sid, expires=row.expires)
+        return self.session_class(sid=self.generate_sid(), new=True)
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        table = StoredSession.__table__
+        if session.replaces:
+            db.engine.execute(
+                table.delete().where(table.c.id == session.replaces)
+            )
+            session.replaces = None
+        if not session:
+            if not session.new:
+                db.engine.execute(
+                    table.delete().where(table.c.id == session.sid)
+                )
+            if session.modified:
+                response.delete_cookie(app.session_cookie_name,
+                                       domain=domain,
+                                       path=path)
+            return
+        lifetime = app.permanent_session_lifetime
+        now = datetime.datetime.utcnow()
+        refresh = session.expires is None or \
+            session.expires - now < lifetime / 2
+        if session.new or session.modified or refresh:
+            values = {'data': session_json_serializer.dumps(dict(session)),
+                      'user_id': self.user_id(session),
+                      'expires': now + lifetime}
+            updated = 0
+            if not session.new:
+                updated = db.engine.execute(
+                    table.update().where(
+                        table.c.id == session.sid
+                    ).values(**values)
+                ).rowcount
+            if not updated:
+                db.engine.execute(table.insert().values(id=session.sid,
+                                                        **values))
+            response.set_cookie(app.session_cookie_name,
+                                session.sid,
+                                expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app),
+                                domain=domain,
+                                path=path,
+                                secure=self.get_cookie_secure(app))
+        self.sweep_if_due(app)
+
+    @staticmethod
+    def user_id(session):
+        """Get the id of the logged in user stored by Flask-Login."""
+        try:
+            return int(session['user_id'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def sweep_if_due(self, app):
+        """Sweep expired sessions if `SESSION_SWEEP_INTERVAL` has passed."""
+        if time.time() - self.last_sweep >= \
+                app.config.get('SESSION_SWEEP_INTERVAL'):
+            self.last_sweep = time.time()
+            StoredSession.sweep()
+
+
+def rotate_session_id():
+    """Give the current session a new id, if sessions are stored here.
+
+    This should be done whenever a user logs in or out, so a session id set
+    or seen by someone else before then can't be used to act as the user.
+    """
+    sess = current_session._get_current_object()
+    if isinstance(sess, ServerSession):
+        sess.regenerate(ServerSessionInterface.generate_sid())
@@ -25,4 +25,4 @@ from flask import Blueprint
 shop = Blueprint('shop', __name__)
 
 
-from . import views
+from . import noship, views
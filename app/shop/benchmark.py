@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.shop.benchmark
+
+This module contains a load test of the checkout flow, which seeds a
+synthetic catalog and drives simulated customers through the shop with the
+Flask test client, so checkout latency can be compared between changes.
+"""
+
+import math
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from flask import url_for
+
+from app import db
+from app.seeds.models import CommonName, Cultivar, Index, Packet
+from app.shop.models import Country, Product, State
+
+
+def percentile(values, pct):
+    """Get the `pct` percentile of `values` by the nearest-rank method."""
+    if not values:
+        return None
+    values = sorted(values)
+    rank = max(int(math.ceil(pct / 100 * len(values))), 1)
+    return values[rank - 1]
+
+
+def seed_catalog(products=200, seed=0):
+    """Add a synthetic catalog of cultivars with one packet each.
+
+    Args:
+        products: The number of products to add.
+        seed: Seed for prices, so catalogs are the same between runs.
+
+    Returns:
+        list: The numbers of the products added.
+    """
+    rng = random.Random(seed)
+    usa = Country(alpha3='USA')
+    usa.states.append(State(abbreviation='CA', name='California'))
+    index = Index(name='Benchmark Flowers')
+    db.session.add_all([usa, index])
+    numbers = []
+    common_names = [CommonName(name='Benchmark {0}'.format(i), index=index)
+                    for i in range(max(products // 20, 1))]
+    for i in range(products):
+        number = 'BM{0:05d}'.format(i)
+        cv = Cultivar(name='Variety {0}'.format(i),
+                      common_name=common_names[i % len(common_names)],
+                      active=True,
+                      in_stock=True)
+        cv.visible = True
+        cv.taxable = bool(i % 2)
+        price = Decimal(rng.randint(199, 999)) / 100
+        cv.packets.append(Packet(sku=number, price=price))
+        product = Product(number=number)
+        product.label = 'Variety {0}'.format(i)
+        product.price = price
+        db.session.add_all([cv, product])
+        numbers.append(number)
+    db.session.commit()
+    return numbers
+
+
+def address_data(customer, prefix='address'):
+    """Get form data for the address of synthetic customer #`customer`."""
+    data = {
+        'first_name': 'Customer',
+        'last_name': str(customer),
+        'address_line1': '{0} Benchmark Way'.format(customer),
+        'city': 'Sacramento',
+        'postalcode': '95814',
+        'country': 'USA',
+        'usa_state': 'CA',
+        'can_state': '0',
+        'aus_state': '0',
+        'email': 'customer{0}@example.com'.format(customer),
+        'phone': '555-0100'
+    }
+    return {'{0}-{1}'.format(prefix, k): v for k, v in data.items()}
+
+
+class EndpointStats(object):
+    """Latencies and query counts of requests to one endpoint.
+
+    Attributes:
+        latencies (list): Seconds each request took.
+        queries (list): Number of SQL queries each request ran.
+        errors (int): Number of responses with an unexpected status.
+    """
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.errors = 0
+
+    def __repr__(self):
+        return '<{0}: {1} requests>'.format(self.__class__.__name__,
+                                            len(self.latencies))
+
+    def summary(self):
+        """dict: Request count, errors, latency percentiles and queries."""
+        ms = [l * 1000 for l in self.latencies]
+        return OrderedDict([
+            ('requests', len(ms)),
+            ('errors', self.errors),
+            ('p50_ms', percentile(ms, 50)),
+            ('p90_ms', percentile(ms, 90)),
+            ('p99_ms', percentile(ms, 99)),
+            ('max_ms', max(ms) if ms else None),
+            ('queries_avg', (sum(self.queries) / len(self.queries)
+                             if self.queries else None))
+        ])
+
+
+class CheckoutBenchmark(object):
+    """Drive simulated customers through checkout and time each request.
+
+    Each customer adds products to their cart, views it, enters a shipping
+    address, enters billing information, reviews the order, and places it,
+    which queues a payment with the configured payment gateway. Use an app
+    with `PAYMENT_GATEWAY` set to 'fake' to keep payments local, and with
+    `QUERY_STATS` set so query counts can be read from responses.
+
+    Attributes:
+        app: The Flask app to send requests to.
+        products (list): Numbers of the products customers can order.
+        customers (int): The number of customers to simulate.
+        concurrency (int): The number of customers checking out at once.
+        lines (int): The number of products each customer adds.
+        stats (OrderedDict): `EndpointStats` by '<method> <endpoint>'.
+    """
+    QUERY_COUNT = re.compile(r'count=(\d+)')
+
+    def __init__(self, app, products, customers=50, concurrency=4, lines=3,
+                 seed=0):
+        self.app = app
+        self.products = products
+        self.customers = customers
+        self.concurrency = concurrency
+        self.lines = lines
+        self.seed = seed
+        self.stats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def request(self, client, method, endpoint, url, expected, data=None):
+        """Send a request and record how long it took.
+
+        Responses with a status other than `expected`, and requests which
+        raise an exception, are counted as errors.
+        """
+        start = time.perf_counter()
+        try:
+            response = client.open(url, method=method, data=data)
+        except Exception:
+            response = None
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            stats = self.stats.setdefault(
+                '{0} {1}'.format(method, endpoint),
+                EndpointStats()
+            )
+            stats.latencies.append(elapsed)
+            if response is None or response.status_code != expected:
+                stats.errors += 1
+            if response is not None:
+                match = self.QUERY_COUNT.search(
+                    response.headers.get('X-Query-Stats', '')
+                )
+                if match:
+                    stats.queries.append(int(match.group(1)))
+        return response
+
+    def checkout(self, customer):
+        """Take synthetic customer #`customer` through checkout."""
+        rng = random.Random(self.seed + customer)
+        numbers = rng.sample(self.products, min(self.lines,
+                                                len(self.products)))
+        with self.app.test_request_context():
+            urls = {
+                'add_to_cart': [url_for('shop.add_to_cart', product_number=n)
+                                for n in numbers],
+                'cart': url_for('shop.cart'),
+                'shipping': url_for('shop.shipping'),
+                'billing': url_for('shop.billing'),
+                'review': url_for('shop.review')
+            }
+        with self.app.test_client() as client:
+            for number, url in zip(numbers, urls['add_to_cart']):
+                quantity = {'{0}-quantity'.format(number): rng.randint(1, 3)}
+                self.request(client, 'POST', 'shop.add_to_cart', url, 302,
+                             quantity)
+            self.request(client, 'GET', 'shop.cart', urls['cart'], 200)
+            self.request(client, 'GET', 'shop.shipping', urls['shipping'], 200)
+            self.request(client, 'POST', 'shop.shipping', urls['shipping'],
+                         302, address_data(customer))
+            self.request(client, 'GET', 'shop.billing', urls['billing'], 200)
+            data = address_data(customer)
+            data['same_as_shipping'] = 'y'
+            data['stripeToken'] = 'tok_visa'
+            self.request(client, 'POST', 'shop.billing', urls['billing'], 302,
+                         data)
+            self.request(client, 'GET', 'shop.review', urls['review'], 200)
+            self.request(client, 'POST', 'shop.review', urls['review'], 302,
+                         {'proceed': 'Place Order'})
+
+    def run(self):
+        """Run every customer through checkout.
+
+        Returns:
+            float: The number of seconds the run took.
+        """
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            # `list` makes errors raised in threads propagate.
+            list(executor.map(self.checkout, range(self.customers)))
+        return time.perf_counter() - start
+
+    def report(self):
+        """str: A table of the stats recorded for each endpoint."""
+        def fmt(value):
+            if value is None:
+                return '-'
+            if isinstance(value, float):
+                return '{0:.1f}'.format(value)
+            return str(value)
+
+        header = ['endpoint', 'requests', 'errors', 'p50_ms', 'p90_ms',
+                  'p99_ms', 'max_ms', 'queries_avg']
+        rows = [header]
+        for endpoint, stats in self.stats.items():
+            rows.append([endpoint] +
+                        [fmt(v) for v in stats.summary().values()])
+        widths = [max(len(r[i]) for r in rows) for i in range(len(header))]
+        return '\n'.join(
+            '  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip()
+            for row in rows
+        )
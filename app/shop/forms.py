@@ -29,8 +29,10 @@ from wtforms import (
 from wtforms.fields.html5 import IntegerField
 from wtforms.validators import InputRequired, Length, NumberRange
 
+from app import db
 from app.form_helpers import Email, StrippedStringField, StrippedTextAreaField
-from app.shop.models import Address, Country
+from app.shop.geography import geography
+from app.shop.models import Address, Country, State
 
 
 class AddProductForm(FlaskForm):
@@ -181,65 +183,45 @@ class AddressForm(FlaskForm):
         address.address_line2 = self.address_line2.data
         address.city = self.city.data
         address.postalcode = self.postalcode.data
-        address.country = Country.get(alpha3=self.country.data)
+        geo = geography.get()
+        country = geo.by_alpha3.get(self.country.data)
+        address.country = Country.query.get(country.id) if country else None
         address.email = self.email.data
         address.phone = self.phone.data
         address.fax = self.fax.data
         if self.country.data == 'USA':
-            address.state = address.country.get_state(
-                abbreviation=self.usa_state.data
-            )
+            state = geo.get_state('USA', self.usa_state.data)
         elif self.country.data == 'CAN':
-            address.state = address.country.get_state(
-                abbreviation=self.can_state.data
-            )
+            state = geo.get_state('CAN', self.can_state.data)
         elif self.country.data == 'AUS':
-            address.state = address.country.get_state(
-                abbreviation=self.aus_state.data
-            )
+            state = geo.get_state('AUS', self.aus_state.data)
         else:
             address.unlisted_state = self.unlisted_state.data
+            return
+        address.state = State.query.get(state.id) if state else None
 
     def get_or_create_address(self):
         """Get an `Address` with corresponding data or create it."""
-        addresses = Address.query.filter(
-            Address.address_line1 == self.address_line1.data
-        ).filter(
-            Address.city == self.city.data
-        ).all()
-        for address in addresses:
-            if self.equals_address(address):
-                return address
-        else:
-            address = Address()
+        address = Address()
+        with db.session.no_autoflush:
             self.populate_address(address)
-            return address
+            existing = Address.with_fingerprint(address.make_fingerprint())
+        return existing if existing is not None else address
 
     def set_selects(self, filter_noship=False):
-        countries = Country.query.all()
+        """Set choices of select fields from the cached `Geography`.
+
+        Args:
+            filter_noship: Leave out countries we can't ship to.
+        """
+        geo = geography.get()
         if filter_noship:
-            self.country.choices = (
-                [(c.alpha3, c.name) for c in countries if not c.noship]
-            )
+            self.country.choices = list(geo.shippable_country_choices)
         else:
-            self.country.choices = (
-                [(c.alpha3, c.name) for c in countries]
-            )
-        usa = Country.get(alpha3='USA')
-        self.usa_state.choices = (
-            [(s.abbreviation, s.name) for s in usa.states]
-        )
-        self.usa_state.choices.insert(0, ('0', 'Select a state:'))
-        can = Country.get(alpha3='CAN')
-        self.can_state.choices = (
-            [(s.abbreviation, s.name) for s in can.states]
-        )
-        self.can_state.choices.insert(0, ('0', 'Select a province:'))
-        aus = Country.get(alpha3='AUS')
-        self.aus_state.choices = (
-            [(s.abbreviation, s.name) for s in aus.states]
-        )
-        self.aus_state.choices.insert(0, ('0', 'Select a state:'))
+            self.country.choices = list(geo.country_choices)
+        self.usa_state.choices = list(geo.state_choices['USA'])
+        self.can_state.choices = list(geo.state_choices['CAN'])
+        self.aus_state.choices = list(geo.state_choices['AUS'])
 
     def validate_usa_state(self, field):
         """Raise ValidationError if country is USA and no state selected."""
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.shop.geography
+
+This module contains a read-only copy of the countries and states in the
+database, loaded once per process so address forms and shipping checks
+don't need to query for them on each request.
+"""
+
+from collections import namedtuple
+
+from sqlalchemy.orm import subqueryload
+
+from app.db_helpers import on_commit, StampedCache
+from app.shop.models import Country, State
+
+
+# Countries with states listed in address forms, and the label for their
+# state select fields.
+STATE_SELECTS = (
+    ('USA', 'Select a state:'),
+    ('CAN', 'Select a province:'),
+    ('AUS', 'Select a state:')
+)
+
+
+CountryData = namedtuple('CountryData', [
+    'id',
+    'alpha2',
+    'alpha3',
+    'name',
+    'noship',
+    'safe_to_ship',
+    'at_own_risk_threshold',
+    'states'
+])
+
+
+StateData = namedtuple('StateData', ['id', 'abbreviation', 'name', 'tax'])
+
+
+class Geography(object):
+    """Countries and states as loaded from the database.
+
+    Attributes:
+        countries (tuple): `CountryData` for each `Country`.
+        by_alpha3 (dict): `CountryData` by alpha3 code.
+        country_choices (tuple): Choices for a country select field.
+        shippable_country_choices (tuple): Choices for a country select
+            field, without countries we can't ship to.
+        state_choices (dict): Choices for each state select field, formatted:
+            {<alpha3>: ((<abbreviation>, <name>), ...), ...}
+    """
+    def __init__(self, countries):
+        self.countries = tuple(
+            CountryData(
+                id=c.id,
+                alpha2=c.alpha2,
+                alpha3=c.alpha3,
+                name=c.name,
+                noship=bool(c.noship),
+                safe_to_ship=bool(c.safe_to_ship),
+                at_own_risk_threshold=c.at_own_risk_threshold,
+                states=tuple(StateData(id=s.id,
+                                       abbreviation=s.abbreviation,
+                                       name=s.name,
+                                       tax=s.tax) for s in c.states)
+            ) for c in countries
+        )
+        self.by_alpha3 = {c.alpha3: c for c in self.countries}
+        self.country_choices = tuple(
+            (c.alpha3, c.name) for c in self.countries
+        )
+        self.shippable_country_choices = tuple(
+            (c.alpha3, c.name) for c in self.countries if not c.noship
+        )
+        self.state_choices = {}
+        for alpha3, label in STATE_SELECTS:
+            states = self.by_alpha3[alpha3].states \
+                if alpha3 in self.by_alpha3 else ()
+            self.state_choices[alpha3] = (('0', label),) + tuple(
+                (s.abbreviation, s.name) for s in states
+            )
+
+    def __repr__(self):
+        return '<{0} with {1} countries>'.format(self.__class__.__name__,
+                                                 len(self.countries))
+
+    def get_state(self, alpha3, abbreviation):
+        """Get `StateData` for a state, or None if it isn't listed."""
+        try:
+            return next(s for s in self.by_alpha3[alpha3].states
+                        if s.abbreviation == abbreviation)
+        except (KeyError, StopIteration):
+            return None
+
+
+def load_geography():
+    """Load a `Geography` of every country and its states."""
+    return Geography(Country.query.options(
+        subqueryload('states')
+    ).order_by(Country.id))
+
+
+# The current `Geography`, reloaded when another process changes countries
+# or states.
+geography = StampedCache('geography.dat', load_geography)
+
+
+def find_geography_changes(changes):
+    """Note whether a commit changes any countries or states."""
+    if any(isinstance(obj, (Country, State)) for obj, op, keys in changes):
+        return True
+    return None
+
+
+on_commit('geography changed',
+          find_geography_changes,
+          lambda found: geography.touch())
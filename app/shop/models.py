@@ -16,19 +16,51 @@
 
 # Copyright Swallowtail Garden Seeds, Inc
 
+import hashlib
 import json
 from decimal import Decimal
-from pathlib import Path
 
 
-from flask import current_app, session
+from flask import session
 from flask_login import current_user
 from pycountry import countries
 from sqlalchemy import event
 from sqlalchemy.exc import InvalidRequestError
 
 from app import db
-from app.db_helpers import FourPlaceDecimal, TimestampMixin, USDollar
+from app.db_helpers import (
+    eager_load,
+    FourPlaceDecimal,
+    TimestampMixin,
+    USDollar
+)
+from app.shop.rates import shipping_rates
+
+
+def cart_summary(session_key='cart'):
+    """Get the summary of the cart saved by `Order.save_summary`.
+
+    This lets pages show what is in the cart without loading the `Order` or
+    its products from the database.
+
+    Args:
+        session_key: The key cart data is stored under in the session.
+
+    Returns:
+        dict: The summary, formatted:
+            {'items': <number of items>,
+             'subtotal': <str of subtotal or None>,
+             'version': <int incremented each time the cart changes>}
+    """
+    summary = session.get('{0} summary'.format(session_key))
+    if summary is None:
+        # Carts saved before summaries were kept only have their lines.
+        try:
+            items = sum(l['quantity'] for l in session.get(session_key, []))
+        except (KeyError, TypeError):
+            items = 0
+        summary = {'items': items, 'subtotal': None, 'version': 0}
+    return summary
 
 
 class OrderExistsError(Exception):
@@ -326,11 +358,85 @@ class Address(db.Model, TimestampMixin):
     email = db.Column(db.UnicodeText)
     phone = db.Column(db.UnicodeText)
     fax = db.Column(db.UnicodeText)
+    fingerprint = db.Column(db.Unicode(64), index=True)
+
+    # Columns that make an address distinct, in the order they are hashed.
+    FINGERPRINT_COLUMNS = (
+        'first_name',
+        'last_name',
+        'business_name',
+        'address_line1',
+        'address_line2',
+        'city',
+        'postalcode',
+        'country_id',
+        'state_id',
+        'unlisted_state',
+        'email',
+        'phone',
+        'fax'
+    )
 
     def __repr__(self):
         return '<{0} for: "{1}">'.format(self.__class__.__name__,
                                          self.fullname)
 
+    def make_fingerprint(self):
+        """Get a hash of the normalized data in `Address`.
+
+        Text is compared without regard to case or extra spaces, so addresses
+        entered slightly differently get the same fingerprint.
+
+        Returns:
+            str: A hex SHA-256 digest.
+        """
+        values = []
+        for column in self.FINGERPRINT_COLUMNS:
+            value = getattr(self, column)
+            if value is None and column in ('country_id', 'state_id'):
+                # Unflushed addresses only have their relationships set.
+                related = getattr(self, column[:-3])
+                value = related.id if related is not None else None
+            values.append(' '.join(str(value).split()).lower()
+                          if value is not None else '')
+        return hashlib.sha256(
+            '\x1f'.join(values).encode('utf-8')
+        ).hexdigest()
+
+    @classmethod
+    def with_fingerprint(cls, fingerprint):
+        """Get the oldest `Address` with `fingerprint`, or None.
+
+        Fingerprints are not unique, as customers with the same name and
+        concurrent checkouts can save identical addresses, so the first one
+        saved is used.
+        """
+        return cls.query.filter(
+            cls.fingerprint == fingerprint
+        ).order_by(cls.id).first()
+
+    @classmethod
+    def backfill_fingerprints(cls, batch_size=500):
+        """Set `fingerprint` for addresses saved before it existed.
+
+        Args:
+            batch_size: The number of addresses to update per commit.
+
+        Returns:
+            int: The number of addresses updated.
+        """
+        ids = [i for i, in db.session.query(cls.id).filter(
+            cls.fingerprint == None  # noqa
+        ).order_by(cls.id)]
+        for start in range(0, len(ids), batch_size):
+            batch = cls.query.filter(
+                cls.id.in_(ids[start:start + batch_size])
+            )
+            for address in batch:
+                address.fingerprint = address.make_fingerprint()
+            db.session.commit()
+        return len(ids)
+
     @property
     def fullname(self):
         """str: The full name of the person the address belongs to."""
@@ -359,6 +465,18 @@ class Address(db.Model, TimestampMixin):
 
 
 
+@event.listens_for(Address, 'before_insert')
+def set_address_fingerprint_before_insert(mapper, connection, target):
+    """Set the fingerprint of a new `Address`."""
+    target.fingerprint = target.make_fingerprint()
+
+
+@event.listens_for(Address, 'before_update')
+def set_address_fingerprint_before_update(mapper, connection, target):
+    """Update the fingerprint of an edited `Address`."""
+    target.fingerprint = target.make_fingerprint()
+
+
 class Customer(db.Model, TimestampMixin):
     """Table for customer data.
 
@@ -553,6 +671,31 @@ class Product(db.Model, TimestampMixin):
             obj = cls()
         return obj
 
+    @classmethod
+    def from_numbers(cls, numbers):
+        """Load every `Product` with a number in `numbers` in one query.
+
+        The packet and cultivar of each `Product`, and the places the cultivar
+        can't be shipped to, are loaded along with it, as they are needed to
+        check whether lines are in stock, taxable, and can be shipped.
+
+        Args:
+            numbers: The ID numbers of the products to load.
+
+        Returns:
+            dict: The products found, formatted: {<number>: <Product>, ...}
+        """
+        numbers = set(n for n in numbers if n is not None)
+        if not numbers:
+            return {}
+        products = cls.query.filter(
+            cls.number.in_(numbers)
+        ).options(
+            eager_load(cls, 'packet.cultivar.noship_states'),
+            eager_load(cls, 'packet.cultivar.noship_countries')
+        )
+        return {p.number: p for p in products}
+
     @property
     def cultivar(self):
         """Cultivar: The `Cultivar` assiociated with `Product` if it exists."""
@@ -604,9 +747,9 @@ class LineItem(db.Model, TimestampMixin):
                 'product_number that corresponds to a different product!'
             )
         if not product and product_number is not None:
-            product = Product.query.filter(
-                Product.number == product_number
-            ).one_or_none()
+            product = Product.from_numbers([product_number]).get(
+                product_number
+            )
             if not product:
                 raise ValueError(
                     'No product exists with number: {}'.format(product_number)
@@ -683,22 +826,22 @@ class LineItem(db.Model, TimestampMixin):
     @property
     def noship_country(self):
         """bool: Whether product can be shipped to country in shipping addr."""
+        from app.shop.noship import noship
         try:
-            if self.shipping_address.country in self.cultivar.noship_countries:
-                return True
+            return self.shipping_address.country_id in \
+                noship.get().countries.get(self.cultivar.id, ())
         except AttributeError:
-            pass
-        return False
+            return False
 
     @property
     def noship_state(self):
         """bool: Whether product can be shipped to state in shipping addr."""
+        from app.shop.noship import noship
         try:
-            if self.shipping_address.state in self.cultivar.noship_states:
-                return True
+            return self.shipping_address.state_id in \
+                noship.get().states.get(self.cultivar.id, ())
         except AttributeError:
-            pass
-        return False
+            return False
 
     @property
     def noship(self):
@@ -732,6 +875,64 @@ def order_line_set_product_event(target, value, oldvalue, initiator):
         target.price = value.price
 
 
+class OrderPricing(object):
+    """The totals of an `Order`, calculated in a single pass over its lines.
+
+    Each line's total, and whether it is taxable, is only worked out once.
+
+    Attributes:
+        version: The `Order.pricing_version` the totals were calculated for.
+        line_totals (dict): The total of each line, formatted:
+            {<LineItem>: <Decimal>, ...}
+        before_tax_total (Decimal): The total of all lines.
+        taxable_total (Decimal): The total of taxable lines.
+        tax (Decimal): The sales tax to add.
+        shipping_cost (Decimal): The cost of shipping.
+        total (Decimal): The grand total, with tax and shipping.
+    """
+    def __init__(self, order):
+        self.version = order.pricing_version
+        self.line_totals = {}
+        self.before_tax_total = Decimal(0)
+        self.taxable_total = Decimal(0)
+        for line in order.lines:
+            total = line.total or Decimal(0)
+            self.line_totals[line] = total
+            self.before_tax_total += total
+            try:
+                if total and line.taxable:
+                    self.taxable_total += total
+            except AttributeError:
+                pass  # Lines without cultivars are not taxable.
+        address = order.shipping_address
+        self.tax = self.calculate_tax(address)
+        self.shipping_cost = self.calculate_shipping_cost(address)
+        self.total = self.before_tax_total + self.tax + self.shipping_cost
+
+    def __repr__(self):
+        return '<{0} total: ${1}>'.format(self.__class__.__name__, self.total)
+
+    def calculate_tax(self, address):
+        """Decimal: Sales tax on `taxable_total` for the state in `address`."""
+        try:
+            tax_rate = address.state.tax
+        except AttributeError:
+            tax_rate = None
+        if tax_rate:
+            return (
+                self.taxable_total * (tax_rate / 100)
+            ).quantize(Decimal('.00'))
+        return Decimal(0)
+
+    def calculate_shipping_cost(self, address):
+        """Decimal: The cost of shipping to the country in `address`."""
+        try:
+            alpha3 = address.country.alpha3
+        except AttributeError:
+            return Decimal(0)
+        return shipping_rates.shipping_cost(alpha3, self.before_tax_total)
+
+
 class Order(db.Model, TimestampMixin):
     """Table for orders.
     
@@ -758,6 +959,8 @@ class Order(db.Model, TimestampMixin):
     PROCESSED = 3
     PAID = 4
 
+    # Set by `pricing`.
+    _pricing = None
 
     id = db.Column(db.Integer, primary_key=True)
     lines = db.relationship(
@@ -800,10 +1003,9 @@ class Order(db.Model, TimestampMixin):
             Order - The created `Order`.
         """
         lines = []
+        products = Product.from_numbers(d['product number'] for d in data)
         for d in data:
-            product = Product.query.filter(
-                Product.number == d['product number']
-            ).one_or_none()
+            product = products.get(d['product number'])
             if product:
                 lines.append(LineItem(
                     product=product,
@@ -819,9 +1021,22 @@ class Order(db.Model, TimestampMixin):
             session_key: A string to use as key in session to load session
                 data from. Defaults to 'cart'.
 
+        If the session is stored on the server and doesn't have a cart yet,
+        a logged in user's cart is taken from their most recently used
+        session, so it follows them between devices.
+
         Returns:
             Order - The `Order` created from data in the session.
         """
+        if session_key not in session:
+            sid = getattr(session, 'sid', None)
+            if sid and not current_user.is_anonymous:
+                from app.server_session import StoredSession
+                data = StoredSession.latest_value(current_user.id,
+                                                  session_key,
+                                                  exclude=sid)
+                if data:
+                    session[session_key] = data
         try:
             order = cls.from_session_data(session[session_key])
             if len(order.lines) != len(session[session_key]):
@@ -830,6 +1045,7 @@ class Order(db.Model, TimestampMixin):
                 for sline in list(session[session_key]):
                     if sline['product number'] not in pnos:
                         session[session_key].remove(sline)
+                order.save_summary(session_key)
             if order.lines:
                 return order
             else:
@@ -849,6 +1065,19 @@ class Order(db.Model, TimestampMixin):
     def session_data(self):
         return [l.session_data for l in self.lines]
 
+    @property
+    def summary(self):
+        """dict: The number of items and subtotal of `Order`.
+
+        The subtotal is the price of every line, before checking whether
+        lines are in stock or can be shipped.
+        """
+        subtotal = sum((l.quantity or 0) * (l.price or 0) for l in self.lines)
+        return {
+            'items': self.number_of_items,
+            'subtotal': str(Decimal(subtotal).quantize(Decimal('.00')))
+        }
+
     @property
     def text(self):
         lines_text = '\n'.join(l.text for l in self.lines)
@@ -861,47 +1090,78 @@ class Order(db.Model, TimestampMixin):
         except AttributeError:
             return None
 
+    def check_shipping(self):
+        """Check every line against the shipping address at once.
+
+        Returns:
+            dict: Lines that can't be shipped, formatted:
+                {<LineItem>: <'state' or 'country'>, ...}
+        """
+        from app.shop.noship import noship
+        address = self.shipping_address
+        if address is None:
+            return {}
+        lines = {}
+        for line in self.lines:
+            try:
+                lines.setdefault(line.cultivar.id, []).append(line)
+            except AttributeError:
+                pass  # Products without cultivars can ship anywhere.
+        blocked = noship.get().check_cart(lines,
+                                          address.country_id,
+                                          address.state_id)
+        return {line: reason
+                for cv_id, reason in blocked.items()
+                for line in lines[cv_id]}
+
+    @property
+    def pricing_version(self):
+        """tuple: The data the totals of `Order` are calculated from.
+
+        If this changes, `pricing` needs to be recalculated.
+        """
+        address = self.shipping_address
+        return (
+            tuple((l.product_number, l.quantity, l.price) for l in self.lines),
+            address.state_id if address else None,
+            address.country_id if address else None
+        )
+
+    @property
+    def pricing(self):
+        """OrderPricing: The totals of `Order`, reused until it changes."""
+        if (self._pricing is None or
+                self._pricing.version != self.pricing_version):
+            self._pricing = OrderPricing(self)
+        return self._pricing
+
+    def line_total(self, line):
+        """Decimal: The total of `line` as calculated by `pricing`."""
+        try:
+            return self.pricing.line_totals[line]
+        except KeyError:
+            return line.total
+
     @property
     def before_tax_total(self):
-        return sum(l.total for l in self.lines)
+        return self.pricing.before_tax_total
 
     @property
     def tax(self):
         """Decimal: The total sales tax to add."""
-        try:
-            tax_rate = self.customer.shipping_address.state.tax
-            if tax_rate:
-                taxable_total = sum(l.total for l in self.lines if l.taxable)
-                return (
-                    taxable_total * (tax_rate / 100)
-                ).quantize(Decimal('.00'))
-        except:
-            pass
-        return Decimal(0)
+        return self.pricing.tax
 
     @property
     def after_tax_total(self):
-        return self.before_tax_total + self.tax
+        return self.pricing.before_tax_total + self.pricing.tax
 
     @property
     def shipping_cost(self):
-        rfile = Path(current_app.config.get('JSON_FOLDER'), 'rates.json')
-        with rfile.open('r', encoding='utf-8') as ifile:
-            rates = json.loads(ifile.read())
-        try:
-            if self.shipping_address.country.alpha3 == 'USA':
-                if self.before_tax_total < rates['free US shipping threshold']:
-                    return Decimal(str(rates['US shipping']))
-            else:
-                # TODO: Handle additional itl shipping charges.
-                return Decimal(str(rates['international shipping']))
-        except AttributeError:
-            pass
-        return Decimal(0)
+        return self.pricing.shipping_cost
 
     @property
     def total(self):
-        return self.after_tax_total + self.shipping_cost
+        return self.pricing.total
 
     @property
     def total_cents(self):
@@ -927,15 +1187,18 @@ class Order(db.Model, TimestampMixin):
             The created `LineItem` instance so its data can be used
             by the caller of `add_line`.
         """
-        line = LineItem(
-            product_number=product_number,
-            quantity=quantity
-        )
+        products = Product.from_numbers([product_number])
+        if product_number not in products:
+            raise ValueError(
+                'No product exists with number: {}'.format(product_number)
+            )
+        line = LineItem(product=products[product_number], quantity=quantity)
         existing = self.get_line(product_number)
         if existing:
             existing.quantity += quantity
         else:
             self.lines.append(line)
+        self.save_summary()
         return line
 
     def get_line(self, product_number):
@@ -961,6 +1224,7 @@ class Order(db.Model, TimestampMixin):
             quantity: The new quantity of `Product` on the line.
         """
         self.get_line(product_number).quantity = quantity
+        self.save_summary()
 
     def delete_line(self, line):
         """Remove a `LineItem` and ensure it's deleted.
@@ -993,6 +1257,20 @@ class Order(db.Model, TimestampMixin):
                 store order data.
         """
         session[session_key] = self.session_data
+        self.save_summary(session_key)
+
+    def save_summary(self, session_key='cart'):
+        """Save `summary` to the session for `cart_summary` to use.
+
+        Args:
+            session_key: The key order data is stored under in the session.
+                The summary is stored under the same key with ' summary'
+                appended.
+        """
+        key = '{0} summary'.format(session_key)
+        summary = self.summary
+        summary['version'] = session.get(key, {}).get('version', 0) + 1
+        session[key] = summary
 
     def save(self, session_key='cart'):
         """Save a `Order` to the session and (if applicable) database.
@@ -1033,10 +1311,149 @@ class Order(db.Model, TimestampMixin):
             if not user.current_order:
                 user.current_order = cls.from_session()
                 db.session.commit()
-            return user.current_order
+            order = user.current_order
         else:
             c = Customer.get_from_session()
             if c and c.current_order:
-                return c.current_order
+                order = c.current_order
             else:
                 return cls.from_session()
+        if order:
+            order.load_products()
+        return order
+
+    def load_products(self):
+        """Load the products of all lines with `Product.from_numbers`.
+
+        The loaded products are kept in the session's identity map, so
+        `LineItem.product` doesn't need to query for each line.
+        """
+        Product.from_numbers(l.product_number for l in self.lines)
+
+
+class PaymentJob(db.Model, TimestampMixin):
+    """Table for payments waiting to be sent to the payment gateway.
+
+    Payments are taken by a worker process (see `app.shop.payments`) so web
+    requests don't wait on the payment gateway.
+
+    Capitalized attributes are integers representing `PaymentJob.status`.
+
+    Attributes:
+
+    QUEUED - Waiting for a worker.
+    PROCESSING - Claimed by a worker.
+    SUCCEEDED - The payment was taken.
+    FAILED - The payment was declined, or the gateway could not be reached
+        after `PAYMENT_MAX_ATTEMPTS` tries.
+
+    order - The `Order` being paid for.
+    customer - The `Customer` paying.
+    token - The payment token from the billing form.
+    amount - The amount to charge, in cents.
+    idempotency_key - A key unique to the order.
+    generation - The number of times the job was queued again after failing.
+    attempts - The number of times a worker has tried the job.
+    next_attempt_at - When a job queued again after a temporary error may be
+        tried next.
+    token_attached - Whether or not `token` has been saved as the payment
+        source of the customer at the gateway.
+    charge_id - The id of the charge made by the gateway.
+    error - A message to show the customer if the job failed.
+    """
+    __tablename__ = 'payment_jobs'
+
+    QUEUED = 1
+    PROCESSING = 2
+    SUCCEEDED = 3
+    FAILED = 4
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'))
+    order = db.relationship('Order')
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
+    customer = db.relationship('Customer')
+    token = db.Column(db.UnicodeText)
+    amount = db.Column(db.Integer)
+    idempotency_key = db.Column(db.Unicode(64), unique=True)
+    generation = db.Column(db.Integer, default=0)
+    status = db.Column(db.Integer, default=QUEUED, index=True)
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, index=True)
+    token_attached = db.Column(db.Boolean, default=False)
+    charge_id = db.Column(db.UnicodeText)
+    error = db.Column(db.UnicodeText)
+
+    def __repr__(self):
+        return '<{0} #{1} for order #{2}: status {3}>'.format(
+            self.__class__.__name__,
+            self.id,
+            self.order_id,
+            self.status
+        )
+
+    @staticmethod
+    def key_for(order):
+        """str: The idempotency key for paying for `order`."""
+        return 'order-{0}'.format(order.number)
+
+    @classmethod
+    def enqueue(cls, order, customer, token):
+        """Queue a payment for `order`, unless one is queued already.
+
+        Args:
+            order: The `Order` to pay for. It must be saved to the database,
+                as its number is used for the idempotency key.
+            customer: The `Customer` paying.
+            token: The payment token from the billing form.
+
+        Returns:
+            PaymentJob: The new or existing job for `order`.
+        """
+        key = cls.key_for(order)
+        job = cls.query.filter(cls.idempotency_key == key).one_or_none()
+        if job is None:
+            job = cls(order=order,
+                      customer=customer,
+                      token=token,
+                      amount=order.total_cents,
+                      idempotency_key=key,
+                      generation=0,
+                      status=cls.QUEUED,
+                      attempts=0,
+                      token_attached=False)
+            db.session.add(job)
+        elif job.status == cls.FAILED:
+            # Let the customer try again, e.g. with a different card.
+            job.token = token
+            job.amount = order.total_cents
+            job.generation += 1
+            job.status = cls.QUEUED
+            job.attempts = 0
+            job.next_attempt_at = None
+            job.token_attached = False
+            job.error = None
+        return job
+
+    @property
+    def charge_key(self):
+        """str: The idempotency key sent to the gateway with the charge.
+
+        It stays the same while a job is retried, so the gateway never
+        charges for it twice, and changes when a failed job is queued again,
+        so the gateway doesn't just repeat its earlier answer.
+        """
+        return '{0}-{1}'.format(self.idempotency_key, self.generation)
+
+    @property
+    def status_name(self):
+        """str: `status` as a lowercase word."""
+        return {self.QUEUED: 'queued',
+                self.PROCESSING: 'processing',
+                self.SUCCEEDED: 'succeeded',
+                self.FAILED: 'failed'}.get(self.status)
+
+    @property
+    def done(self):
+        """bool: Whether or not the job has finished."""
+        return self.status in (self.SUCCEEDED, self.FAILED)
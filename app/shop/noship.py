@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.shop.noship
+
+This module contains a compact table of the states and countries each
+cultivar can't be shipped to, so orders can be checked against a shipping
+address without loading the noship relationships of every cultivar.
+"""
+
+from sqlalchemy import literal, select, union_all
+
+from app import db
+from app.db_helpers import on_commit, StampedCache
+from app.seeds.models import (
+    common_names_to_countries,
+    common_names_to_states,
+    CommonName,
+    Cultivar,
+    cultivars_to_countries,
+    cultivars_to_states
+)
+from app.shop.models import Country, State
+
+
+# Attributes which change where cultivars can be shipped.
+NOSHIP_KEYS = {
+    'common_name',
+    'common_name_id',
+    'noship_common_names',
+    'noship_countries',
+    'noship_cultivars',
+    'noship_states'
+}
+
+
+class NoshipMatrix(object):
+    """The states and countries each cultivar can't be shipped to.
+
+    A cultivar can't be shipped anywhere its own noship lists or those of its
+    common name include.
+
+    Attributes:
+        states (dict): Formatted {<cultivar id>: frozenset(<state ids>)}
+        countries (dict): Formatted {<cultivar id>: frozenset(<country ids>)}
+    """
+    def __init__(self, rows=()):
+        states = {}
+        countries = {}
+        for cultivar_id, kind, place_id in rows:
+            places = states if kind == 'state' else countries
+            places.setdefault(cultivar_id, set()).add(place_id)
+        self.states = {k: frozenset(v) for k, v in states.items()}
+        self.countries = {k: frozenset(v) for k, v in countries.items()}
+
+    def __repr__(self):
+        return '<{0} for {1} cultivars>'.format(
+            self.__class__.__name__,
+            len(set(self.states) | set(self.countries))
+        )
+
+    @classmethod
+    def load(cls):
+        """Load a `NoshipMatrix` from the database in one query."""
+        cvs = Cultivar.__table__
+        # `common_names_to_countries` calls its country column 'state_id'.
+        query = union_all(
+            select([cultivars_to_states.c.cultivar_id,
+                    literal('state'),
+                    cultivars_to_states.c.state_id]),
+            select([cultivars_to_countries.c.cultivar_id,
+                    literal('country'),
+                    cultivars_to_countries.c.country_id]),
+            select([cvs.c.id,
+                    literal('state'),
+                    common_names_to_states.c.state_id]).where(
+                cvs.c.common_name_id == common_names_to_states.c.common_name_id
+            ),
+            select([cvs.c.id,
+                    literal('country'),
+                    common_names_to_countries.c.state_id]).where(
+                cvs.c.common_name_id ==
+                common_names_to_countries.c.common_name_id
+            )
+        )
+        return cls(db.session.execute(query))
+
+    def reason(self, cultivar_id, country_id=None, state_id=None):
+        """Get why a cultivar can't be shipped to a destination.
+
+        Returns:
+            str: 'state' or 'country' if the cultivar can't be shipped to the
+                given state or country, otherwise None.
+        """
+        if state_id is not None and \
+                state_id in self.states.get(cultivar_id, ()):
+            return 'state'
+        if country_id is not None and \
+                country_id in self.countries.get(cultivar_id, ()):
+            return 'country'
+        return None
+
+    def check_cart(self, cultivar_ids, country_id=None, state_id=None):
+        """Check many cultivars against a destination at once.
+
+        Args:
+            cultivar_ids: Ids of the cultivars to check.
+            country_id: The id of the `Country` to ship to.
+            state_id: The id of the `State` to ship to.
+
+        Returns:
+            dict: The cultivars that can't be shipped, formatted:
+                {<cultivar id>: <'state' or 'country'>, ...}
+        """
+        blocked = {}
+        for cultivar_id in cultivar_ids:
+            reason = self.reason(cultivar_id, country_id, state_id)
+            if reason:
+                blocked[cultivar_id] = reason
+        return blocked
+
+    def shippable(self, cultivar_ids, country_id=None, state_id=None):
+        """Get the cultivars in `cultivar_ids` that can be shipped.
+
+        This can be used to hide cultivars a customer can't order.
+
+        Returns:
+            list: The ids from `cultivar_ids` which can be shipped, in order.
+        """
+        blocked = self.check_cart(cultivar_ids, country_id, state_id)
+        return [cv_id for cv_id in cultivar_ids if cv_id not in blocked]
+
+
+# The current `NoshipMatrix`, reloaded when another process changes where
+# cultivars can be shipped.
+noship = StampedCache('noship_matrix.dat', NoshipMatrix.load)
+
+
+def find_noship_changes(changes):
+    """Note whether a commit changes where any cultivar can be shipped."""
+    for obj, operation, keys in changes:
+        if isinstance(obj, (CommonName, Country, Cultivar, State)) and \
+                (operation == 'delete' or keys & NOSHIP_KEYS):
+            return True
+    return None
+
+
+on_commit('noship changed', find_noship_changes, lambda found: noship.touch())
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.shop.payments
+
+This module contains the payment gateways orders can be paid through, and
+the worker which takes queued `PaymentJob` instances and sends them to a
+gateway outside of web requests.
+"""
+
+import datetime
+import sys
+import time
+
+import stripe
+from flask import current_app
+
+from app import db
+from app.shop.models import Order, PaymentJob
+
+
+class PaymentDeclined(Exception):
+    """Error for payments the gateway refused, which should not be retried."""
+    def __init__(self, message):
+        self.message = message
+
+
+class PaymentGateway(object):
+    """Interface for payment gateways.
+
+    Any other exception raised by a gateway is treated as a temporary
+    problem, and the job is tried again.
+    """
+    def create_customer(self, token, description=None):
+        """Save a payment token as a new customer of the gateway.
+
+        Returns:
+            str: The gateway's id for the customer.
+
+        Raises:
+            PaymentDeclined: If the token can't be used.
+        """
+        raise NotImplementedError
+
+    def update_customer(self, customer_id, token):
+        """Make a payment token the payment source of an existing customer.
+
+        Raises:
+            PaymentDeclined: If the token can't be used.
+        """
+        raise NotImplementedError
+
+    def charge(self, customer_id, amount, idempotency_key, metadata=None):
+        """Charge a customer.
+
+        Args:
+            customer_id: The gateway's id for the customer.
+            amount: The amount to charge, in US cents.
+            idempotency_key: A key the gateway uses to recognize repeats of
+                the same charge, so they only charge once.
+            metadata: An optional dict of extra data to store on the charge.
+
+        Returns:
+            str: The gateway's id for the charge.
+
+        Raises:
+            PaymentDeclined: If the charge was declined.
+        """
+        raise NotImplementedError
+
+    def card(self, token):
+        """Get details of the card a payment token is for.
+
+        Returns:
+            dict: With the keys 'brand', 'last4', 'exp_month' and 'exp_year'.
+        """
+        raise NotImplementedError
+
+
+class StripeGateway(PaymentGateway):
+    """Gateway that takes payments with Stripe."""
+    def create_customer(self, token, description=None):
+        try:
+            return stripe.Customer.create(source=token,
+                                          description=description).id
+        except stripe.error.CardError as e:
+            raise PaymentDeclined(str(e))
+
+    def update_customer(self, customer_id, token):
+        try:
+            customer = stripe.Customer.retrieve(customer_id)
+            customer.source = token
+            customer.save()
+        except stripe.error.CardError as e:
+            raise PaymentDeclined(str(e))
+
+    def charge(self, customer_id, amount, idempotency_key, metadata=None):
+        try:
+            return stripe.Charge.create(amount=amount,
+                                        currency='usd',
+                                        customer=customer_id,
+                                        metadata=metadata or {},
+                                        idempotency_key=idempotency_key).id
+        except stripe.error.CardError as e:
+            raise PaymentDeclined(str(e))
+
+    def card(self, token):
+        return stripe.Token.retrieve(token)['card']
+
+
+class FakeGateway(PaymentGateway):
+    """Gateway that takes payments without contacting a payment provider.
+
+    Tokens starting with 'tok_decline' are declined, and tokens starting with
+    'tok_error' raise a temporary error the first time they are charged. All
+    others succeed. Charges are kept in memory, and repeated charges with the
+    same idempotency key return the first charge.
+
+    Attributes:
+        customers (dict): Tokens of created customers by customer id.
+        charges (dict): Charges made, formatted:
+            {<idempotency key>: {'id': <id>, 'amount': <cents>, ...}, ...}
+    """
+    def __init__(self):
+        self.customers = {}
+        self.charges = {}
+        self._failed = set()
+
+    def create_customer(self, token, description=None):
+        if token is None or token.startswith('tok_decline'):
+            raise PaymentDeclined('Your card was declined.')
+        customer_id = 'cus_fake{0}'.format(len(self.customers) + 1)
+        self.customers[customer_id] = token
+        return customer_id
+
+    def update_customer(self, customer_id, token):
+        if token is None or token.startswith('tok_decline'):
+            raise PaymentDeclined('Your card was declined.')
+        self.customers[customer_id] = token
+
+    def charge(self, customer_id, amount, idempotency_key, metadata=None):
+        if idempotency_key in self.charges:
+            return self.charges[idempotency_key]['id']
+        token = self.customers.get(customer_id, '')
+        if token.startswith('tok_error') and \
+                idempotency_key not in self._failed:
+            self._failed.add(idempotency_key)
+            raise ConnectionError('Could not reach the fake gateway.')
+        charge_id = 'ch_fake{0}'.format(len(self.charges) + 1)
+        self.charges[idempotency_key] = {'id': charge_id,
+                                         'customer': customer_id,
+                                         'amount': amount,
+                                         'metadata': metadata or {}}
+        return charge_id
+
+    def card(self, token):
+        return {'brand': 'Visa',
+                'last4': '4242',
+                'exp_month': 12,
+                'exp_year': datetime.date.today().year + 1}
+
+
+GATEWAYS = {
+    'fake': FakeGateway,
+    'stripe': StripeGateway
+}
+
+# Gateways are kept so that `FakeGateway` remembers its charges.
+_gateways = {}
+
+
+def get_gateway(name=None):
+    """Get the gateway named `name`, or `PAYMENT_GATEWAY` from the config."""
+    if name is None:
+        name = current_app.config.get('PAYMENT_GATEWAY')
+    if name not in _gateways:
+        _gateways[name] = GATEWAYS[name]()
+    return _gateways[name]
+
+
+def due_filter():
+    """Get a filter for jobs which are not waiting to be retried.
+
+    Times are compared with the database's clock, which sets `updated_on`,
+    so workers in other time zones agree on which jobs are due.
+    """
+    return db.or_(
+        PaymentJob.next_attempt_at == None,  # noqa
+        PaymentJob.next_attempt_at <= db.func.now()
+    )
+
+
+def retry_delay(attempts):
+    """Get how long to wait before trying a job again.
+
+    The delay set by `PAYMENT_RETRY_DELAY` doubles with each attempt, so a
+    gateway that is down isn't sent a steady stream of retries.
+
+    Returns:
+        datetime.timedelta: The time to wait after attempt `attempts`.
+    """
+    base = current_app.config.get('PAYMENT_RETRY_DELAY') or 0
+    return datetime.timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def claim_job(job_id):
+    """Mark a queued job as being processed by this worker.
+
+    The update only succeeds if the job is still queued and due to be tried,
+    so two workers can never claim the same job.
+
+    Returns:
+        bool: Whether or not the job was claimed.
+    """
+    result = db.session.execute(
+        PaymentJob.__table__.update().where(
+            PaymentJob.id == job_id
+        ).where(
+            PaymentJob.status == PaymentJob.QUEUED
+        ).where(
+            due_filter()
+        ).values(
+            status=PaymentJob.PROCESSING,
+            attempts=PaymentJob.attempts + 1,
+            updated_on=db.func.now()
+        )
+    )
+    db.session.commit()
+    return result.rowcount == 1
+
+
+def process_job(job, gateway):
+    """Send a claimed job to `gateway` and save the result.
+
+    The job's token is saved as the customer's payment source before
+    charging, so returning customers are charged with the card they just
+    entered rather than the one they used last time.
+    """
+    customer = job.customer
+    try:
+        if not job.token_attached:
+            if customer.stripe_id:
+                gateway.update_customer(customer.stripe_id, job.token)
+            else:
+                customer.stripe_id = gateway.create_customer(
+                    job.token,
+                    description=customer.fullname
+                )
+            job.token_attached = True
+            db.session.commit()
+        job.charge_id = gateway.charge(
+            customer.stripe_id,
+            job.amount,
+            job.charge_key,
+            metadata={'order_number': job.order.number}
+        )
+    except PaymentDeclined as e:
+        db.session.rollback()
+        job.status = PaymentJob.FAILED
+        job.error = e.message
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.warning(
+            'Payment job #{0} attempt {1} failed: {2!r}'.format(job.id,
+                                                                job.attempts,
+                                                                e)
+        )
+        if job.attempts >= current_app.config.get('PAYMENT_MAX_ATTEMPTS'):
+            job.status = PaymentJob.FAILED
+            job.error = 'We could not process your payment at this time. ' \
+                'Please try again later.'
+        else:
+            job.status = PaymentJob.QUEUED
+            job.next_attempt_at = db.func.now() + retry_delay(job.attempts)
+    else:
+        job.status = PaymentJob.SUCCEEDED
+        job.order.status = Order.PAID
+    db.session.commit()
+
+
+def requeue_stale_jobs(minutes=10):
+    """Queue jobs again whose worker stopped before finishing them.
+
+    This is safe because charges are sent with the job's idempotency key.
+    The cutoff is worked out by the database, as its clock sets
+    `updated_on`.
+
+    Returns:
+        int: The number of jobs queued again.
+    """
+    cutoff = db.func.now() - datetime.timedelta(minutes=minutes)
+    count = PaymentJob.query.filter(
+        PaymentJob.status == PaymentJob.PROCESSING,
+        PaymentJob.updated_on < cutoff
+    ).update({'status': PaymentJob.QUEUED}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def work(gateway=None,
+         once=False,
+         poll_interval=1.0,
+         requeue_interval=60.0,
+         stream=sys.stdout):
+    """Process queued payment jobs until stopped.
+
+    Args:
+        gateway: Optional `PaymentGateway` to use. Defaults to the one set by
+            `PAYMENT_GATEWAY`.
+        once: Return once the queue is empty instead of waiting for more jobs.
+        poll_interval: Seconds to wait between checks of an empty queue.
+        requeue_interval: Seconds between checks for jobs abandoned by other
+            workers.
+        stream: Optional IO stream to print messages to.
+
+    Returns:
+        int: The number of jobs processed.
+    """
+    if gateway is None:
+        gateway = get_gateway()
+    processed = 0
+    last_requeue = None
+    while True:
+        if last_requeue is None or \
+                time.time() - last_requeue >= requeue_interval:
+            requeue_stale_jobs()
+            last_requeue = time.time()
+        ids = [i for i, in db.session.query(PaymentJob.id).filter(
+            PaymentJob.status == PaymentJob.QUEUED,
+            due_filter()
+        ).order_by(PaymentJob.id).limit(20)]
+        db.session.commit()
+        for job_id in ids:
+            if claim_job(job_id):
+                job = PaymentJob.query.get(job_id)
+                process_job(job, gateway)
+                processed += 1
+                print('Payment job #{0}: {1}'.format(job.id, job.status_name),
+                      file=stream)
+        if not ids:
+            if once:
+                return processed
+            time.sleep(poll_interval)
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.shop.rates
+
+This module contains the shipping rates and sales tax rates used to price
+orders, loaded from `JSON_FOLDER/rates.json`.
+"""
+
+import json
+import os
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+
+from flask import current_app
+
+
+# Dollar amounts every rates file needs.
+REQUIRED_RATES = (
+    'US shipping',
+    'international shipping',
+    'free US shipping threshold'
+)
+
+# Dollar amounts a rates file may have.
+OPTIONAL_RATES = (
+    'international additional charge threshold',
+    'CAN additional charge threshold'
+)
+
+
+class RatesError(ValueError):
+    """Error for rates that don't match the expected format."""
+
+
+def _decimal(name, value, places=Decimal('1.00')):
+    """Convert a rate to a non-negative `Decimal` with `places` digits.
+
+    Raises:
+        RatesError: If `value` is not a non-negative number.
+    """
+    if isinstance(value, bool) or \
+            not isinstance(value, (int, float, str, Decimal)):
+        raise RatesError(
+            'Rate "{0}" should be a number, not {1!r}.'.format(name, value)
+        )
+    try:
+        rv = Decimal(str(value).replace('$', '').strip())
+    except InvalidOperation:
+        raise RatesError(
+            'Rate "{0}" should be a number, not {1!r}.'.format(name, value)
+        )
+    if not rv.is_finite() or rv < 0:
+        raise RatesError(
+            'Rate "{0}" should not be negative.'.format(name)
+        )
+    return rv.quantize(places)
+
+
+def parse_rates(data):
+    """Check rates loaded from JSON and convert their values to `Decimal`.
+
+    Args:
+        data: A dict of rates, formatted:
+            {'US shipping': <dollars>,
+             'international shipping': <dollars>,
+             'free US shipping threshold': <dollars>,
+             'international rates': {<alpha3>: <dollars>, ...},
+             'sales tax': {<alpha3>: {<state abbreviation>: <percent>}}}
+            'international rates' and 'sales tax' are optional, as are the
+            keys in `OPTIONAL_RATES`.
+
+    Returns:
+        dict: `data` with dollar amounts as `Decimal` with two places and tax
+            rates as `Decimal` with four places. 'international rates' and
+            'sales tax' are always present.
+
+    Raises:
+        RatesError: If `data` is missing rates, has unknown keys, or has
+            values which are not non-negative numbers.
+    """
+    if not isinstance(data, dict):
+        raise RatesError('Rates should be a JSON object.')
+    known = REQUIRED_RATES + OPTIONAL_RATES + ('international rates',
+                                               'sales tax')
+    unknown = sorted(set(data) - set(known))
+    if unknown:
+        raise RatesError('Unknown rates: {0}'.format(', '.join(unknown)))
+    rates = {}
+    for key in REQUIRED_RATES + OPTIONAL_RATES:
+        if key in data:
+            rates[key] = _decimal(key, data[key])
+        elif key in REQUIRED_RATES:
+            raise RatesError('Missing rate: "{0}"'.format(key))
+    for key in ('international rates', 'sales tax'):
+        if not isinstance(data.get(key, {}), dict):
+            raise RatesError('"{0}" should be a JSON object.'.format(key))
+    rates['international rates'] = {
+        alpha3.upper(): _decimal(alpha3, rate)
+        for alpha3, rate in data.get('international rates', {}).items()
+    }
+    rates['sales tax'] = {}
+    for alpha3, states in data.get('sales tax', {}).items():
+        if not isinstance(states, dict):
+            raise RatesError(
+                'Sales tax for "{0}" should be a JSON object.'.format(alpha3)
+            )
+        rates['sales tax'][alpha3.upper()] = {
+            abbr.upper(): _decimal(abbr, rate, Decimal('1.0000'))
+            for abbr, rate in states.items()
+        }
+    return rates
+
+
+def _to_json(value):
+    """Convert `Decimal` values in parsed rates back to JSON numbers."""
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+class ShippingRates(object):
+    """Rates from `JSON_FOLDER/rates.json`, parsed once per change.
+
+    The file is parsed and checked with `parse_rates` the first time rates
+    are needed, and again whenever its modification time changes, so edits
+    made by other processes or by hand are picked up. If an edited file can't
+    be parsed, the last good rates are kept and an error is logged.
+
+    Attributes:
+        rates (dict): Rates as returned by `parse_rates`.
+        version: The modification time of the file `rates` were loaded from.
+    """
+    def __init__(self):
+        self.rates = None
+        self.version = None
+
+    def __repr__(self):
+        return '<{0} version: {1}>'.format(self.__class__.__name__,
+                                           self.version)
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    @property
+    def file(self):
+        return Path(current_app.config.get('JSON_FOLDER'), 'rates.json')
+
+    def _stat(self):
+        try:
+            return os.stat(str(self.file)).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self):
+        """Parse the rates file, replacing `rates`.
+
+        Raises:
+            RatesError: If the file's rates are not in the expected format.
+            OSError: If the file can't be read.
+        """
+        version = self._stat()
+        with self.file.open('r', encoding='utf-8') as ifile:
+            data = json.loads(ifile.read(), parse_float=Decimal)
+        self.rates = parse_rates(data)
+        self.version = version
+
+    def get(self):
+        """Get the current rates, loading them again if the file changed.
+
+        Returns:
+            dict: Rates as returned by `parse_rates`.
+        """
+        version = self._stat()
+        if self.rates is None or version != self.version:
+            try:
+                self.load()
+            except (OSError, ValueError) as e:
+                if self.rates is None:
+                    raise
+                current_app.logger.error(
+                    'Could not reload shipping rates from "{0}": {1}'
+                    .format(self.file, e)
+                )
+                self.version = version
+        return self.rates
+
+    def save(self, changes):
+        """Change rates and save them to the rates file.
+
+        Args:
+            changes: A dict of rates to change, in the format used by
+                `parse_rates`.
+
+        Raises:
+            RatesError: If the changed rates are not in the expected format.
+        """
+        data = _to_json(self.get())
+        data.update(_to_json(changes))
+        parse_rates(data)
+        tmp = self.file.with_name('.rates.json.tmp')
+        with tmp.open('w', encoding='utf-8') as ofile:
+            ofile.write(json.dumps(data, indent=4, sort_keys=True))
+        os.replace(str(tmp), str(self.file))
+        self.load()
+
+    def shipping_cost(self, alpha3, subtotal):
+        """Get the cost of shipping an order.
+
+        Args:
+            alpha3: The alpha3 code of the country the order ships to.
+            subtotal: The total of the order before tax.
+
+        Returns:
+            Decimal: The shipping cost.
+        """
+        rates = self.get()
+        if alpha3 == 'USA':
+            if subtotal < rates['free US shipping threshold']:
+                return rates['US shipping']
+            return Decimal('0.00')
+        # TODO: Handle additional itl shipping charges.
+        return rates['international rates'].get(
+            alpha3,
+            rates['international shipping']
+        )
+
+
+shipping_rates = ShippingRates()
@@ -16,9 +16,16 @@
 
 # Copyright Swallowtail Garden Seeds, Inc
 
-import stripe
-
-from flask import flash, redirect, render_template, request, session, url_for
+from flask import (
+    abort,
+    flash,
+    jsonify,
+    redirect,
+    render_template,
+    request,
+    session,
+    url_for
+)
 from flask_login import current_user
 
 from . import shop
@@ -31,7 +38,8 @@ from app.shop.forms import (
     ShoppingCartForm
 )
 from app import db
-from app.shop.models import Customer, Order
+from app.shop.models import Customer, Order, PaymentJob
+from app.shop.payments import get_gateway
 
 
 @shop.route('/add-to-cart/<product_number>', methods=('GET', 'POST'))
@@ -137,12 +145,16 @@ def shipping():
             db.session.add(customer)
         if customer.current_order is not order:
             customer.current_order = order
+        if order.customer is not customer:
+            order.customer = customer
         customer.shipping_address = form.address.get_or_create_address()
         if not form.comments.data:
             form.comments.data = None
         if form.comments.data != order.shipping_comments:
             order.shipping_comments = form.comments.data
         db.session.commit()
+        if current_user.is_anonymous:
+            customer.save_id_to_session()
         return redirect(url_for('shop.billing'))
     try:
         form.address.populate_from_address(customer.shipping_address)
@@ -165,7 +177,7 @@ def billing():
         if form.same_as_shipping.data:
             customer.billing_address = customer.shipping_address
         else:
-            customer.shipping_address = form.address.get_or_create_address()
+            customer.billing_address = form.address.get_or_create_address()
         session['stripe_token'] = form.stripeToken.data
         db.session.commit()
         return redirect(url_for('shop.review'))
@@ -251,51 +263,52 @@ def review():
         customer = current_user.customer_data
     order = customer.current_order
     form = ConfirmOrderForm()
-    if form.validate_on_submit():
-        if not customer.stripe_id:
-            scustomer = stripe.Customer.create(
-                source=session['stripe_token'],
-                description=customer.fullname
-            )
-            customer.stripe_id = scustomer.id
-            db.session.commit()
-        else:
-            scustomer = stripe.Customer.retrieve(customer.stripe_id)
-        
-        # Charge!
-        try:
-            charge = stripe.Charge.create(
-                amount=order.total_cents,
-                currency="usd",
-                customer=customer.stripe_id,
-                metadata={'order_number': order.number }
-            )
-        except stripe.error.CardError:
-            # TODO
-            return 'It done broked!'
-        flash('It worked!')
-        return redirect(url_for('seeds.home'))
-        
-    try:
-        t = session['stripe_token']
-        token = stripe.Token.retrieve(t)
-    except KeyError:
+    token = session.get('stripe_token')
+    if not token:
         # TODO: Edit flash message.
         flash('Could not process credit card information.')
         return redirect(url_for('shop.billing'))
+    if form.validate_on_submit():
+        job = PaymentJob.enqueue(order, customer, token)
+        db.session.commit()
+        session['payment job'] = job.id
+        return redirect(url_for('shop.payment', job_id=job.id))
 
     return render_template(
         'shop/review.html',
         current_order=order,
-        card=token['card'],
+        card=get_gateway().card(token),
         form=form
     )
 
 
+def get_session_payment_job(job_id):
+    """Get the `PaymentJob` with `job_id` if it belongs to this session."""
+    if session.get('payment job') != job_id:
+        abort(404)
+    return PaymentJob.query.get_or_404(job_id)
+
+
+@shop.route('/payment/<int:job_id>')
+def payment(job_id):
+    job = get_session_payment_job(job_id)
+    return render_template('shop/payment.html', job=job)
+
+
+@shop.route('/payment/<int:job_id>/status')
+def payment_status(job_id):
+    job = get_session_payment_job(job_id)
+    return jsonify(status=job.status_name,
+                   done=job.done,
+                   error=job.error,
+                   order_number=job.order.number)
+
+
 # TODO: Remove these views when no longer needed!
 @shop.route('/clear_cart')
 def clear_cart():
     session['cart'] = []
+    session.pop('cart summary', None)
     return redirect(url_for('shop.cart'))
 
 
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# This file is part of SGS-Flask.
+
+# SGS-Flask is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# SGS-Flask is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Copyright Swallowtail Garden Seeds, Inc
+
+
+"""app.static_export
+
+This module contains functions for rendering public pages to a directory of
+static HTML files laid out like the site's URLs, so a web server can serve
+them without going through the app.
+"""
+
+import json
+import os
+import sys
+from multiprocessing import Pool
+from pathlib import Path
+
+from flask import current_app, url_for
+
+from app import create_app, db
+
+
+# Name of the file in the export folder recording what was exported.
+MANIFEST_FILE = '.export.json'
+
+# Set in each worker process by `_init_worker`.
+_client = None
+_out_dir = None
+
+
+def page_file(out_dir, path):
+    """Get the file a page at `path` should be saved as.
+
+    Args:
+        out_dir: The folder pages are being exported to.
+        path: The URL path of the page, e.g. '/annual-flower/zinnia.html'.
+
+    Returns:
+        Path: The file to save the page in. Paths ending with a '/' are saved
+            as 'index.html' in the matching folder.
+    """
+    rel = path.lstrip('/')
+    if not rel or rel.endswith('/'):
+        rel += 'index.html'
+    return Path(out_dir, rel)
+
+
+def site_map_last_modified():
+    """Get last change to data shown on the site map."""
+    from app.db_helpers import last_modified
+    from app.seeds.models import BulkCategory, Index
+    return last_modified(Index.query, BulkCategory.query)
+
+
+def public_pages():
+    """Get every page that can be viewed by the public.
+
+    Returns:
+        list: Tuples formatted (<endpoint>, <view args>, <validator>), where
+            validator is a function as used by `app.decorators.conditional`,
+            or None for pages that don't show data from the database.
+    """
+    from app.seeds import views
+    from app.seeds.models import BulkCategory, CommonName, Cultivar, Index
+    pages = [
+        ('seeds.home', {}, None),
+        ('seeds.site_map', {}, site_map_last_modified),
+        ('seeds.contact', {}, None),
+        ('seeds.how_to_order', {}, None),
+        ('seeds.printable_order_form', {}, None),
+        ('seeds.gift_certificates', {}, None),
+        ('seeds.privacy_policy', {}, None),
+        ('seeds.international_shipping', {}, None),
+        ('seeds.zone_map', {}, None),
+        ('seeds.bulk', {}, views.bulk_last_modified)
+    ]
+    templates = Path(current_app.root_path, 'templates', 'static')
+    for endpoint, folder, arg in (('seeds.about', 'about-us', 'employee'),
+                                  ('seeds.tips_lists', 'tips_lists', 'page')):
+        pages.append((endpoint, {}, None))
+        for template in sorted(Path(templates, folder).glob('*.html')):
+            if template.stem != 'index':
+                pages.append((endpoint, {arg: template.stem}, None))
+    for cat in BulkCategory.query.all():
+        pages.append(('seeds.bulk_category',
+                      {'slug': cat.slug},
+                      views.bulk_category_last_modified))
+    for idx in Index.query.all():
+        pages.append(('seeds.index',
+                      {'idx_slug': idx.slug},
+                      views.index_last_modified))
+    cns = CommonName.query.join(
+        Index, Index.id == CommonName.index_id
+    ).with_entities(Index.slug, CommonName.slug)
+    for idx_slug, cn_slug in cns:
+        pages.append(('seeds.common_name',
+                      {'idx_slug': idx_slug, 'cn_slug': cn_slug},
+                      views.common_name_last_modified))
+    if current_app.config.get('SHOW_CULTIVAR_PAGES'):
+        cvs = Cultivar.query.join(
+            CommonName, CommonName.id == Cultivar.common_name_id
+        ).join(
+            Index, Index.id == CommonName.index_id
+        ).filter(
+            Cultivar.active == True,  # noqa
+            Cultivar.visible == True  # noqa
+        ).with_entities(Index.slug, CommonName.slug, Cultivar.slug)
+        for idx_slug, cn_slug, cv_slug in cvs:
+            pages.append(('seeds.cultivar',
+                          {'idx_slug': idx_slug,
+                           'cn_slug': cn_slug,
+                           'cv_slug': cv_slug},
+                          views.cultivar_last_modified))
+    return pages
+
+
+def site_version():
+    """Get the version of data shown on every page; nav data and ship date."""
+    nav_file = os.path.join(current_app.config.get('DATA_FOLDER'),
+                            'nav_data.json')
+    try:
+        nav_version = os.stat(nav_file).st_mtime_ns
+    except OSError:
+        nav_version = None
+    return [nav_version, current_app.jinja_env.globals.get('ship_date')]
+
+
+def _init_worker(config_name, out_dir):
+    """Set up an app and test client in a worker process."""
+    global _client, _out_dir
+    app = create_app(config_name)
+    app.config['CACHE_PAGES'] = False
+    app.app_context().push()
+    _client = app.test_client()
+    _out_dir = out_dir
+
+
+def _render_page(path):
+    """Render the page at `path` and save it in the export folder.
+
+    Returns:
+        tuple: The path and the status code of the response.
+    """
+    rv = _client.get(path)
+    if rv.status_code == 200:
+        dest = page_file(_out_dir, path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name('.{0}.tmp'.format(dest.name))
+        with tmp.open('wb') as ofile:
+            ofile.write(rv.data)
+        os.replace(str(tmp), str(dest))
+    return path, rv.status_code
+
+
+def export_pages(out_dir,
+                 config_name,
+                 processes=None,
+                 incremental=False,
+                 stream=sys.stdout):
+    """Render all public pages to static files in `out_dir`.
+
+    Pages are rendered by a pool of worker processes, each with its own app
+    and database connection.
+
+    Args:
+        out_dir: The folder to save pages in.
+        config_name: The config mode the worker processes should run in.
+        processes: Optional number of worker processes. Defaults to the
+            number of CPUs.
+        incremental: Only render pages which were not exported before, or
+            whose data changed since the last export. If the nav data or
+            ship date changed, all pages are rendered.
+        stream: Optional IO stream to print messages to.
+
+    Returns:
+        int: The number of pages that could not be rendered.
+    """
+    out_dir = Path(out_dir)
+    manifest_file = Path(out_dir, MANIFEST_FILE)
+    old = {}
+    if incremental and manifest_file.exists():
+        with manifest_file.open('r', encoding='utf-8') as ifile:
+            old = json.loads(ifile.read())
+    site = site_version()
+    if old.get('site') != site:
+        old = {}
+    old_pages = old.get('pages', {})
+    pages = {}
+    todo = []
+    with current_app.test_request_context():
+        for endpoint, kwargs, validator in public_pages():
+            path = url_for(endpoint, **kwargs)
+            version = None
+            if validator is not None:
+                changed, rows = validator(**kwargs)
+                version = [changed.isoformat() if changed else None, rows]
+            pages[path] = version
+            if path not in old_pages or old_pages[path] != version:
+                todo.append(path)
+    for path in set(old_pages) - set(pages):
+        try:
+            page_file(out_dir, path).unlink()
+            print('Removed "{0}".'.format(path), file=stream)
+        except FileNotFoundError:
+            pass
+    print('Rendering {0} of {1} pages...'.format(len(todo), len(pages)),
+          file=stream)
+    # Connections can't be shared with forked processes.
+    db.session.remove()
+    db.engine.dispose()
+    failed = 0
+    with Pool(processes, _init_worker, (config_name, str(out_dir))) as pool:
+        for path, status in pool.imap_unordered(_render_page, todo):
+            if status != 200:
+                failed += 1
+                del pages[path]
+                print('Could not render "{0}": status {1}.'
+                      .format(path, status), file=stream)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with manifest_file.open('w', encoding='utf-8') as ofile:
+        ofile.write(json.dumps({'site': site, 'pages': pages}, indent=4))
+    print('Exported {0} pages to "{1}".'.format(len(todo) - failed, out_dir),
+          file=stream)
+    return failed
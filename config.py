@@ -34,6 +34,8 @@ class Config(object):
         ADMINISTRATORS (list): A list of email addresses of site admins.
         ALLOW_CRAWLING: Whether or not to allow pages to be crawled. This
             should be false outside of production mode.
+        CACHE_PAGES (bool): Whether or not to keep rendered catalog pages in
+            memory instead of rendering them on every request.
         EMAIL_SUBJECT_PREFIX (str): A prefix to use in generated email
                                     subjects.
         ERFP_DAYS_TO_TRACK (int): How many days to keep track of email
@@ -45,9 +47,27 @@ class Config(object):
                                              already been made.
         INDEXES_JSON_FILE (str): Name of file to save/load indexes to.
         INFO_EMAIL (str): Email address to send information with.
+        PAGE_MAX_AGE (int): Number of seconds browsers and caches may use a
+            catalog page before checking whether it has changed.
+        PAYMENT_GATEWAY (str): Name of the gateway payment jobs are sent to;
+            'stripe', or 'fake' to take payments without a payment provider.
+        PAYMENT_MAX_ATTEMPTS (int): Number of times a payment job is tried
+            before it fails, if the gateway can't be reached.
+        PAYMENT_RETRY_DELAY (int): Number of seconds to wait before trying
+            a payment job again; doubled after each failed attempt.
         PENDING_FILE (str): Location of file listing changes pending restart.
+        QUERY_STATS (bool): Whether or not to log the number of SQL queries
+            run by each request and add them to an `X-Query-Stats` header.
+        QUERY_STATS_REPEAT_THRESHOLD (int): Number of times the same
+            statement can run in one request before it is reported as a
+            likely N+1 query.
         REDIRECTS_FILE (str): Location of JSON file containing redirects.
         SECRET_KEY (str): Key used by Flask and extensions for encryption.
+        SERVER_SESSIONS (bool): Whether or not to keep session data in the
+            database, so the session cookie only holds a session id. Off in
+            production unless `SGS_SERVER_SESSIONS` is set.
+        SESSION_SWEEP_INTERVAL (int): Minimum number of seconds between
+            deletions of expired sessions stored in the database.
         SQLALCHEMY_COMMIT_ON_TEARDOWN (bool): Whether or not to commit
                                               changes to database on
                                               teardown.
@@ -80,12 +100,33 @@ class Config(object):
     PLANT_IMAGES_FOLDER = os.path.join(IMAGES_FOLDER, 'plants')
     INFO_EMAIL = os.environ.get('SGS_INFO_EMAIL') or \
         'info@swallowtailgardenseeds.com'
+    PAGE_MAX_AGE = os.environ.get('SGS_PAGE_MAX_AGE') or 60
+    PAGE_MAX_AGE = int(PAGE_MAX_AGE)
+    PAYMENT_GATEWAY = os.environ.get('SGS_PAYMENT_GATEWAY') or 'stripe'
+    PAYMENT_MAX_ATTEMPTS = os.environ.get('SGS_PAYMENT_MAX_ATTEMPTS') or 5
+    PAYMENT_MAX_ATTEMPTS = int(PAYMENT_MAX_ATTEMPTS)
+    PAYMENT_RETRY_DELAY = os.environ.get('SGS_PAYMENT_RETRY_DELAY') or 30
+    PAYMENT_RETRY_DELAY = int(PAYMENT_RETRY_DELAY)
     PENDING_FILE = os.environ.get('SGS_PENDING_FILE') or \
         os.path.join(BASEDIR, 'pending.txt')
     REDIRECTS_FILE = os.environ.get('SGS_REDIRECTS_FILE') or \
         os.path.join(BASEDIR, 'redirects.json')
+    if os.environ.get('SGS_QUERY_STATS'):
+        QUERY_STATS = True
+    else:
+        QUERY_STATS = False
+    QUERY_STATS_REPEAT_THRESHOLD = os.environ.get(
+        'SGS_QUERY_STATS_REPEAT_THRESHOLD') or 5
+    QUERY_STATS_REPEAT_THRESHOLD = int(QUERY_STATS_REPEAT_THRESHOLD)
     SECRET_KEY = os.environ.get('SGS_SECRET_KEY') or \
         '\xbdc@:b\xac\xfa\xfa\xd1z[\xa3=\xd1\x9a\x0b&\xe3\x1d5\xe9\x84(\xda'
+    if os.environ.get('SGS_COOKIE_SESSIONS'):
+        SERVER_SESSIONS = False
+    else:
+        SERVER_SESSIONS = True
+    SESSION_SWEEP_INTERVAL = os.environ.get('SGS_SESSION_SWEEP_INTERVAL') or \
+        3600
+    SESSION_SWEEP_INTERVAL = int(SESSION_SWEEP_INTERVAL)
     SUPPORT_EMAIL = os.environ.get('SGS_SUPPORT_EMAIL') or \
         'support@swallowtailgardenseeds.com'
     # Snipcart stuff
@@ -105,6 +146,10 @@ class Config(object):
         SQLALCHEMY_ECHO = True
     else:
         SQLALCHEMY_ECHO = False
+    if os.environ.get('SGS_CACHE_PAGES'):
+        CACHE_PAGES = True
+    else:
+        CACHE_PAGES = False
     if os.environ.get('SGS_SHOW_CULTIVAR_PAGES'):
         SHOW_CULTIVAR_PAGES = True
     else:
@@ -127,6 +172,7 @@ class DevelopmentConfig(Config):
     Running the server or shell from ``manage.py`` uses this mode.
     """
     DEBUG = True
+    QUERY_STATS = True
     SQLALCHEMY_DATABASE_URI = os.environ.get('SGS_DEV_DATABASE_URI')
 
 
@@ -139,6 +185,9 @@ class TestingConfig(Config):
     LOGIN_DISABLED = True
     TESTING = True
     WTF_CSRF_ENABLED = False
+    PAYMENT_GATEWAY = 'fake'
+    PAYMENT_RETRY_DELAY = 0
+    SERVER_SESSIONS = False
     JSON_FOLDER = os.path.join(TEMPDIR, 'json')
     PENDING_FILE = os.path.join(TEMPDIR, 'pending.txt')
     REDIRECTS_FILE = os.path.join(TEMPDIR, 'redirects.json')
@@ -154,6 +203,8 @@ class ProductionConfig(Config):
     """
     SQLALCHEMY_DATABASE_URI = os.environ.get('SGS_DATABASE_URI')
     ALLOW_CRAWLING = os.environ.get('SGS_ALLOW_CRAWLING') or True
+    CACHE_PAGES = True
+    SERVER_SESSIONS = bool(os.environ.get('SGS_SERVER_SESSIONS'))
     #Do not use test keys for Stripe in production!
     STRIPE_SECRET_KEY = os.environ.get('SGS_STRIPE_SECRET_KEY')
     STRIPE_PUB_KEY = os.environ.get('SGS_STRIPE_PUB_KEY')
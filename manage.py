@@ -33,8 +33,14 @@ from sqlalchemy_searchable import make_searchable
 
 from app import create_app, db, mail, Permission
 from app.auth.models import User
-from app.seeds.excel import SeedsWorkbook
+from app.seeds.benchmark import time_export
+from app.seeds.excel import ImportCheckpoint, SeedsWorkbook
 from app.seeds.models import Cultivar
+from app.server_session import StoredSession
+from app.shop.benchmark import CheckoutBenchmark, seed_catalog
+from app.shop.models import Address
+from app.shop.payments import work
+from app.static_export import export_pages
 from sgsscrape import (
     add_bulk_to_database,
     add_index_to_database,
@@ -234,6 +240,31 @@ def set_grows_with():
     save_grows_with()
 
 
+@manager.command
+def backfill_address_fingerprints():
+    """Set fingerprints of addresses saved before they were added."""
+    updated = Address.backfill_fingerprints()
+    print('Set fingerprints of {0} addresses.'.format(updated))
+
+
+@manager.command
+def sweep_sessions():
+    """Delete expired sessions stored in the database."""
+    print('Deleted {0} expired sessions.'.format(StoredSession.sweep()))
+
+
+@manager.option(
+    '-o',
+    '--once',
+    action='store_true',
+    help='Stop once there are no more queued payments.'
+)
+def payment_worker(once=False):
+    """Take payments queued by the review step of checkout."""
+    processed = work(once=once)
+    print('Processed {0} payment jobs.'.format(processed))
+
+
 @manager.option(
     '-g',
     '--goodbye',
@@ -259,8 +290,55 @@ def hello(goodbye=False):
     '-f',
     '--logfile',
     help='Output messages to given logfile instead of stdout.')
-def excel(load=None, save=None, logfile=None):
-    """Interact with the excel module to utilize spreadsheets."""
+@manager.option(
+    '-w',
+    '--write-only',
+    dest='write_only',
+    action='store_true',
+    help='Stream rows to the spreadsheet when saving to use less memory. '
+         'Only column widths are formatted.')
+@manager.option(
+    '-c',
+    '--chunk-size',
+    dest='chunk_size',
+    type=int,
+    help='Load in chunks, committing this many rows at a time. Rows that '
+         'can\'t be saved are reported instead of stopping the load, and a '
+         'stopped load can be resumed. By default each worksheet is saved '
+         'all at once.')
+@manager.option(
+    '-r',
+    '--restart',
+    action='store_true',
+    help='Load the whole spreadsheet even if a previous load of it was '
+         'stopped partway through.')
+@manager.option(
+    '-n',
+    '--dry-run',
+    dest='dry_run',
+    action='store_true',
+    help='Show what loading the spreadsheet would change in the database '
+         'without changing it.')
+@manager.option(
+    '-d',
+    '--diff',
+    action='store_true',
+    help='Load by comparing the spreadsheet to the database first, and only '
+         'saving the rows that differ.')
+def excel(load=None,
+          save=None,
+          logfile=None,
+          write_only=False,
+          chunk_size=None,
+          restart=False,
+          dry_run=False,
+          diff=False):
+    """Interact with the excel module to utilize spreadsheets.
+
+    Loads done in chunks keep a checkpoint file next to the spreadsheet, so
+    running the same load again after it was stopped resumes from the last
+    committed row.
+    """
     if logfile:
         if os.path.exists(logfile):
             print('WARNING: The file specified by logfile \'{0}\' already '
@@ -286,11 +364,30 @@ def excel(load=None, save=None, logfile=None):
     if load:
         if os.path.exists(load):
             swb = SeedsWorkbook()
-            swb.load(load)
+            swb.load(load, read_only=True)
         else:
             raise FileNotFoundError('The file \'{0}\' does not exist!'
                                     .format(load))
-        swb.save_all_sheets_to_db(stream=stream)
+        if dry_run or diff:
+            changes = swb.diff_with_db()
+            print(changes.summary(fields=dry_run), file=stream)
+            if not dry_run:
+                changes.apply(stream=stream)
+        elif chunk_size:
+            checkpoint = ImportCheckpoint.for_workbook(load)
+            if restart:
+                checkpoint.remove()
+            elif checkpoint.resuming:
+                print('Resuming the previous load of \'{0}\'. Use --restart '
+                      'to load the whole spreadsheet again.'.format(load),
+                      file=stream)
+            report = swb.save_all_sheets_to_db(stream=stream,
+                                               chunk_size=chunk_size,
+                                               checkpoint=checkpoint)
+            checkpoint.remove()
+            print(report.summary(), file=stream)
+        else:
+            swb.save_all_sheets_to_db(stream=stream)
     if save:
         if os.path.exists(save):
             print('WARNING: The file {0} exists. Would you like to overwrite '
@@ -307,7 +404,7 @@ def excel(load=None, save=None, logfile=None):
                           'overwrite the file, or \'N\' if you do not. Would'
                           'you like to overwite the file \'{0}\'?'
                           .format(save))
-        swb = SeedsWorkbook()
+        swb = SeedsWorkbook(write_only=write_only)
         print('*** BEGIN saving all data to worksheet \'{0}\'. ***'
               .format(save), file=stream)
         swb.add_all_data_to_sheets(stream=stream)
@@ -318,6 +415,109 @@ def excel(load=None, save=None, logfile=None):
     if stream is not sys.stdout:
         stream.close()
 
+
+@manager.option(
+    '-s',
+    '--sizes',
+    default='1000,2000,4000,8000',
+    help='Comma separated numbers of rows to time exporting.'
+)
+@manager.option(
+    '-w',
+    '--write-only',
+    dest='write_only',
+    action='store_true',
+    help='Export to a write-only workbook.'
+)
+def benchmark_excel_export(sizes='1000,2000,4000,8000', write_only=False):
+    """Time exporting rows to a spreadsheet as the number of rows grows."""
+    sizes = [int(s) for s in sizes.split(',')]
+    for rows, seconds, per_row in time_export(sizes, write_only=write_only):
+        print('{0:>8} rows: {1:8.3f}s ({2:.1f}us per row)'.format(
+            rows, seconds, per_row
+        ))
+
+
+@manager.option(
+    '-o',
+    '--output',
+    default='static_export',
+    help='Folder to save rendered pages in.')
+@manager.option(
+    '-p',
+    '--processes',
+    type=int,
+    help='Number of processes to render pages with. Defaults to CPU count.')
+@manager.option(
+    '-i',
+    '--incremental',
+    action='store_true',
+    help='Only render pages whose data changed since the last export.')
+def export_static(output='static_export', processes=None, incremental=False):
+    """Render all public pages to static HTML files."""
+    failed = export_pages(output,
+                          os.getenv('SGS_MODE') or 'default',
+                          processes=processes,
+                          incremental=incremental)
+    if failed:
+        sys.exit(1)
+
+
+@manager.option(
+    '-c',
+    '--customers',
+    type=int,
+    default=50,
+    help='Number of customers to take through checkout.'
+)
+@manager.option(
+    '-n',
+    '--concurrency',
+    type=int,
+    default=4,
+    help='Number of customers checking out at the same time.'
+)
+@manager.option(
+    '-p',
+    '--products',
+    type=int,
+    default=200,
+    help='Number of products in the synthetic catalog.'
+)
+@manager.option(
+    '-l',
+    '--lines',
+    type=int,
+    default=3,
+    help='Number of products each customer orders.'
+)
+def benchmark_checkout(customers=50, concurrency=4, products=200, lines=3):
+    """Time the checkout flow against a synthetic catalog.
+
+    This uses the testing config, so SGS_TEST_DATABASE_URI must be set. The
+    test database is emptied afterwards.
+    """
+    bench_app = create_app('testing')
+    bench_app.config['QUERY_STATS'] = True
+    with bench_app.app_context():
+        db.create_all()
+        try:
+            numbers = seed_catalog(products)
+            benchmark = CheckoutBenchmark(bench_app,
+                                          numbers,
+                                          customers=customers,
+                                          concurrency=concurrency,
+                                          lines=lines)
+            elapsed = benchmark.run()
+            print(benchmark.report())
+            print('{0} checkouts in {1:.1f}s with concurrency {2}.'.format(
+                customers, elapsed, concurrency
+            ))
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
 @manager.option(
     '-f',
     '--fast',
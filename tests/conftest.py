@@ -1,4 +1,6 @@
 import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
 from app import create_app
 from app import db as _db
 
@@ -33,3 +35,22 @@ def db(app, request):
 
     request.addfinalizer(teardown)
     return _db
+
+
+@contextmanager
+def count_queries(db):
+    """Collect the statements sent to the database while in the block.
+
+    Yields:
+        list: The statements sent so far, added to as they are sent.
+    """
+    statements = []
+
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
@@ -8,8 +8,11 @@ from app.seeds.excel import (
     SectionsWorksheet,
     CommonNamesWorksheet,
     CultivarsWorksheet,
+    ImportCheckpoint,
+    ImportContext,
     IndexesWorksheet,
     PacketsWorksheet,
+    SeedsWorkbook,
     SeedsWorksheet
 )
 from app.seeds.models import (
@@ -22,6 +25,7 @@ from app.seeds.models import (
     Packet,
     Quantity
 )
+from tests.conftest import count_queries
 
 
 class TestExcelWithDB:
@@ -174,6 +178,71 @@ class TestExcelWithDB:
 #        assert 'The Cultivar \'Polkadot Petra Foxglove\' has been loa' in msgs
 
 
+class TestImportContextWithDB:
+    """Test ImportContext with the database."""
+    def test_loaded_context_finds_objects_without_queries(self, db):
+        """Look up loaded objects by natural key without querying."""
+        messages = StringIO()
+        idx = Index(name='Perennial')
+        cn = CommonName(name='Foxglove', index=idx)
+        sec = Section(name='Polkadot', common_name=cn)
+        cv = Cultivar(name='Foxy', common_name=cn)
+        pkt = Packet(sku='8675309', cultivar=cv)
+        img = Image(filename='foxy.jpg')
+        db.session.add_all([idx, cn, sec, cv, pkt, img])
+        db.session.commit()
+        context = ImportContext()
+        context.load()
+        with count_queries(db) as statements:
+            assert context.index('Perennial', stream=messages) is idx
+            assert context.common_name('Perennial',
+                                       'Foxglove',
+                                       stream=messages) is cn
+            assert context.section('Perennial',
+                                   'Foxglove',
+                                   'Polkadot',
+                                   stream=messages) is sec
+            assert context.cultivar('Perennial',
+                                    'Foxglove',
+                                    'Foxy',
+                                    stream=messages) is cv
+            assert context.packet('8675309', stream=messages) is pkt
+            assert context.image('foxy.jpg', stream=messages) is img
+        assert not statements
+        assert not any(o.created for o in (idx, cn, sec, cv, pkt, img))
+
+    def test_registers_created_objects(self, db):
+        """Create missing objects once, and find them on later lookups."""
+        messages = StringIO()
+        context = ImportContext()
+        context.load()
+        cv = context.cultivar('Perennial', 'Foxglove', 'Foxy', stream=messages)
+        assert cv.created
+        assert cv.common_name.index.name == 'Perennial'
+        assert context.cultivar('Perennial',
+                                'Foxglove',
+                                'Foxy',
+                                stream=messages) is cv
+        assert not cv.created
+        assert context.common_name('Perennial',
+                                   'Foxglove',
+                                   stream=messages) is cv.common_name
+        messages.seek(0)
+        msgs = messages.read()
+        assert 'The Cultivar \'Foxy\' does not yet exist' in msgs
+
+    def test_unloaded_context_queries_once_per_key(self, db):
+        """Query for objects not in an unloaded context, then remember them."""
+        messages = StringIO()
+        idx = Index(name='Perennial')
+        db.session.add(idx)
+        db.session.commit()
+        context = ImportContext()
+        assert context.index('Perennial', stream=messages) is idx
+        assert context.indexes == {'Perennial': idx}
+        assert not idx.created
+
+
 class TestSeedsWorksheetWithDB:
     """Test methods of SeedsWorksheet that (normally) need to use the db."""
     @mock.patch('app.seeds.excel.db.session.rollback')
@@ -219,6 +288,50 @@ class TestSeedsWorksheetWithDB:
         msgs = messages.read()
         assert 'All changes have been committed' in msgs
 
+    @mock.patch('app.seeds.excel.SeedsWorksheet.save_row_to_db')
+    def test_save_to_db_in_chunks(self, m_srtdb, db, tmpdir):
+        """Report rows that raise exceptions, and resume after a checkpoint."""
+        def save_row(row, stream):
+            if row == 3:
+                raise ValueError('Bad row.')
+            return True
+
+        m_srtdb.side_effect = save_row
+        source = tmpdir.join('seeds.xlsx')
+        source.write('data')
+        messages = StringIO()
+        wb = Workbook()
+        sws = SeedsWorksheet(wb.active)
+        sws.title = 'Things'
+        for r in range(1, 7):
+            sws.cell(r, 1).value = 'Row {0}'.format(r)
+        checkpoint = ImportCheckpoint.for_workbook(str(source))
+        checkpoint.save('Things', 3)
+        report = sws.save_to_db_in_chunks(chunk_size=2,
+                                          checkpoint=checkpoint,
+                                          stream=messages)
+        assert [c[1]['row'] for c in m_srtdb.call_args_list] == [4, 5, 6]
+        assert report.saved == 3
+        assert report.skipped == 2
+        assert not report.errors
+        assert 'Things' in checkpoint.done
+        checkpoint.remove()
+        m_srtdb.reset_mock()
+        report = sws.save_to_db_in_chunks(chunk_size=2,
+                                          checkpoint=checkpoint,
+                                          stream=messages)
+        assert m_srtdb.call_count == 5
+        assert report.saved == 4
+        assert report.errors == [('Things', 3, 'ValueError: Bad row.')]
+        assert checkpoint.last_row('Things') == 6
+        m_srtdb.reset_mock()
+        resumed = ImportCheckpoint.for_workbook(str(source))
+        report = sws.save_to_db_in_chunks(chunk_size=2,
+                                          checkpoint=resumed,
+                                          stream=messages)
+        assert not m_srtdb.called
+        assert report.errors == [('Things', 3, 'ValueError: Bad row.')]
+
 
 class TestIndexesWorksheetWithDB:
     """Test methods of the IndexesWorksheet that need to use the database."""
@@ -240,7 +353,7 @@ class TestIndexesWorksheetWithDB:
         msgs = messages.read()
         assert 'No changes were made' in msgs
 
-    @mock.patch('app.seeds.models.Index.get_or_create')
+    @mock.patch('app.seeds.excel.ImportContext.index')
     def test_save_row_to_db_new_no_opts(self, m_goci, db):
         """Create an Index with no optional data and flush it to the db."""
         messages = StringIO()
@@ -253,7 +366,7 @@ class TestIndexesWorksheetWithDB:
         m_goci.return_value = idx
         iws.add_one(idx)
         assert iws.save_row_to_db(row=2, stream=messages)
-        m_goci.assert_called_with(name='Perennial', stream=messages)
+        m_goci.assert_called_with('Perennial', stream=messages)
         assert Index.query.filter(Index.name == 'Perennial').one_or_none()
         messages.seek(0)
         msgs = messages.read()
@@ -336,7 +449,7 @@ class TestCommonNamesWorksheet:
         assert not edited
         assert 'No changes were made to the CommonName \'Foxglove\'' in msgs
 
-    @mock.patch('app.seeds.models.CommonName.get_or_create')
+    @mock.patch('app.seeds.excel.ImportContext.common_name')
     def test_save_row_to_db_new_no_optionals(self, m_goccn, db):
         """Create a new CommonName and flush to db."""
         messages = StringIO()
@@ -353,9 +466,7 @@ class TestCommonNamesWorksheet:
         assert CommonName.query\
             .filter(CommonName.name == 'Foxglove')\
             .one_or_none()
-        m_goccn.assert_called_with(name='Foxglove',
-                                   index='Perennial',
-                                   stream=messages)
+        m_goccn.assert_called_with('Perennial', 'Foxglove', stream=messages)
         messages.seek(0)
         msgs = messages.read()
         assert 'Changes to the CommonName \'Foxglove\' have been flush' in msgs
@@ -1922,3 +2033,34 @@ class TestPacketsWorksheetWithDB:
         assert pkt.quantity.units == 'cubits'
         assert ('The quantity for the Packet SKU \'8675309\' has been set to: '
                 '100 cubits') in msgs
+
+
+class TestSeedsWorkbookWithDB:
+    """Test methods of SeedsWorkbook which use the database."""
+    def test_diff_with_db_then_apply(self, db):
+        """Compare rows without saving them, then save only changed rows."""
+        perennial = Index(name='Perennial', description='Built to last.')
+        annual = Index(name='Annual', description='Not built to last.')
+        db.session.add_all([perennial, annual])
+        db.session.commit()
+        swb = SeedsWorkbook()
+        rows = (('Perennial', 'Built to last.'),
+                ('Annual', 'Live fast.'),
+                ('Biennial', None))
+        for r, (name, description) in enumerate(rows, start=2):
+            swb.indexes.cell(r, 1).value = name
+            swb.indexes.cell(r, 2).value = description
+        changes = swb.diff_with_db()
+        assert changes.counts()['Indexes'] == {'created': 1,
+                                               'updated': 1,
+                                               'unchanged': 1}
+        assert changes.changed[0].changes == {
+            'description': ('Not built to last.', 'Live fast.')
+        }
+        assert 'Live fast.' in changes.summary()
+        assert annual.description == 'Not built to last.'
+        assert not Index.query.filter(Index.name == 'Biennial').all()
+        messages = StringIO()
+        assert changes.apply(stream=messages) == 2
+        assert annual.description == 'Live fast.'
+        assert Index.query.filter(Index.name == 'Biennial').one_or_none()
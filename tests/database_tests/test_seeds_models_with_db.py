@@ -1,14 +1,19 @@
 from unittest import mock
 import pytest
+from app import load_nav_data
 from app.seeds.models import (
     BotanicalName,
     CommonName,
     Cultivar,
     Index,
+    index_nav_data,
     Packet,
     Quantity,
-    row_exists
+    row_exists,
+    save_nav_data,
+    Section
 )
+from tests.conftest import count_queries
 
 
 class TestModuleLevelFunctionsWithDB:
@@ -21,6 +26,22 @@ class TestModuleLevelFunctionsWithDB:
         assert row_exists(Index.name, 'Finger')
         assert not row_exists(Index.name, 'Toe')
 
+    def test_save_nav_data_only_changed_indexes(self, db, tmpdir):
+        """Copy entries of indexes that haven't changed from the old file."""
+        annual = Index(name='Annual Flower')
+        perennial = Index(name='Perennial Flower')
+        db.session.add_all([annual, perennial])
+        db.session.commit()
+        nav_file = str(tmpdir.join('nav_data.json'))
+        save_nav_data(nav_file)
+        with mock.patch('app.seeds.models.index_nav_data',
+                        wraps=index_nav_data) as m_ind:
+            save_nav_data(nav_file, indexes={perennial.id}, bulk=False)
+        m_ind.assert_called_once_with(perennial)
+        assert [d['Name'] for d in load_nav_data(nav_file)] == [
+            'Annual Flower', 'Perennial Flower', 'Bulk'
+        ]
+
 
 class TestIndexRelatedEventHandlers:
     """Test event listener functions that involve Index instances."""
@@ -35,6 +56,20 @@ class TestIndexRelatedEventHandlers:
         assert m_gs.called
         assert idx.slug == 'new-index'
 
+    @mock.patch('app.seeds.models.save_nav_data')
+    def test_save_nav_data_before_commit_nav_changes_only(self, m_snd, db):
+        """Only save nav data when attributes shown in the nav change."""
+        idx = Index(name='Annual Flower')
+        db.session.add(idx)
+        db.session.commit()
+        m_snd.reset_mock()
+        idx.description = 'Flowers that live for one season.'
+        db.session.commit()
+        assert not m_snd.called
+        idx.name = 'Annual'
+        db.session.commit()
+        m_snd.assert_called_once_with(indexes={idx.id}, bulk=False)
+
 
 class TestPositionableMixinWithDB:
     """Test methods of `PositionableMixin` that use the db.
@@ -149,6 +184,110 @@ class TestCommonNameWithDB:
         assert cn.created
         assert cn.index.created
 
+    def test_from_slugs(self, db):
+        """Get a common name by its slug and the slug of its index."""
+        cn = CommonName(name='Foxglove', index=Index(name='Perennial'))
+        db.session.add(cn)
+        db.session.commit()
+        assert CommonName.from_slugs(cn.index.slug, cn.slug) is cn
+        assert CommonName.from_slugs('annual', cn.slug) is None
+
+    def test_for_page_query_count(self, db):
+        """Load a common name page in the same few queries for any size."""
+        idx = Index(name='Annual Flower')
+        for cn_name, num_cvs in (('Zinnia', 2), ('Cosmos', 20)):
+            cn = CommonName(name=cn_name, index=idx)
+            sec = Section(name='Giant', common_name=cn)
+            cn.child_sections.append(sec)
+            prev = None
+            for i in range(num_cvs):
+                cv = Cultivar(name='Red {0}'.format(i), common_name=cn)
+                cv.packets.append(Packet(sku='{0}{1}'.format(cn_name, i),
+                                         price='2.99',
+                                         amount='100 seeds'))
+                if i % 2:
+                    sec.child_cultivars.append(cv)
+                else:
+                    cn.child_cultivars.append(cv)
+                if prev:
+                    cv.gw_cultivars.append(prev)
+                prev = cv
+            db.session.add(cn)
+        db.session.commit()
+
+        def touch_cultivar(cv):
+            cv.thumbnail
+            cv.url
+            cv.noship_states
+            for pkt in cv.packets:
+                pkt.cultivar.url
+            for gw in cv.grows_with:
+                gw.link_html
+
+        def touch_section(sec):
+            sec.thumbnail
+            sec.has_public_cultivars
+            for cv in sec.child_cultivars:
+                touch_cultivar(cv)
+            for child in sec.children:
+                touch_section(child)
+
+        def page_queries(cn_slug):
+            db.session.expunge_all()
+            with count_queries(db) as statements:
+                cn = CommonName.for_page('annual-flower', cn_slug)
+                cn.index.header
+                cn.has_navigable_sections
+                cn.public_cultivar_count
+                for cv in cn.cultivars:
+                    cv.public
+                    cv.featured
+                for cv in cn.child_cultivars:
+                    touch_cultivar(cv)
+                for sec in cn.child_sections:
+                    touch_section(sec)
+                for gw in cn.grows_with:
+                    gw.url
+            return len(statements)
+
+        small = page_queries('zinnia')
+        large = page_queries('cosmos')
+        assert large <= 30
+        assert large == small
+
+    def test_for_page_counts_public_cultivars(self, db):
+        """Count public cultivars and set which sections have any."""
+        idx = Index(name='Annual Flower')
+        cn = CommonName(name='Zinnia', index=idx)
+        shown = Section(name='Giant', common_name=cn)
+        hidden = Section(name='Dwarf', common_name=cn)
+        featured = Section(name='Cut Flower', common_name=cn)
+        parent = Section(name='Mixed', common_name=cn)
+        parent.children.append(shown)
+        cn.child_sections = [parent, hidden, featured]
+        cv1 = Cultivar(name='Red', common_name=cn, active=True)
+        cv1.visible = True
+        cv2 = Cultivar(name='Blue', common_name=cn, active=True)
+        cv2.visible = False
+        cv3 = Cultivar(name='Gold', common_name=cn, active=True)
+        cv3.visible = True
+        cv3.featured = True
+        shown.cultivars.append(cv1)
+        hidden.cultivars.append(cv2)
+        featured.cultivars.append(cv3)
+        db.session.add(cn)
+        db.session.commit()
+        db.session.expunge_all()
+        cn = CommonName.for_page('annual-flower', 'zinnia')
+        assert cn.public_cultivar_count == 2
+        assert cn.has_public_cultivars
+        flags = {s.name: s.__dict__.get('_has_public_cultivars')
+                 for s in cn.sections}
+        assert flags == {'Giant': True,
+                         'Dwarf': False,
+                         'Cut Flower': False,
+                         'Mixed': True}
+
 
 class TestCommonNameRelatedEventHandlers:
     """Test event listener functions that involve CommonName instances."""
@@ -1,4 +1,5 @@
 import io
+import json
 from decimal import Decimal
 from flask import url_for
 from unittest import mock
@@ -254,6 +255,27 @@ class TestIndexRouteWithDB:
                         follow_redirects=True)
         assert 'Annual Flower' in str(rv.data)
 
+    def test_index_not_modified(self, app, db):
+        """Return 304 if the client has the current version of the page."""
+        idx = Index(name='Annual Flower')
+        db.session.add(idx)
+        db.session.commit()
+        with app.test_client() as tc:
+            rv = tc.get(url_for('seeds.index', idx_slug=idx.slug))
+            assert rv.status_code == 200
+            etag = rv.headers['ETag']
+            rv = tc.get(url_for('seeds.index', idx_slug=idx.slug),
+                        headers={'If-None-Match': etag})
+            assert rv.status_code == 304
+            assert rv.cache_control.private
+            assert 'Cookie' in rv.headers['Vary']
+            idx.description = 'Not really built to last.'
+            db.session.commit()
+            rv = tc.get(url_for('seeds.index', idx_slug=idx.slug),
+                        headers={'If-None-Match': etag})
+            assert rv.status_code == 200
+            assert rv.headers['ETag'] != etag
+
 
 class TestCommonNameRouteWithDB:
     """Test seeds.common_name."""
@@ -315,6 +337,20 @@ class TestCommonNameRouteWithDB:
                                 cn_slug=cn.slug))
         assert 'Do foxes really wear these?' in str(rv.data)
 
+    def test_common_name_modified_by_links(self, app, db):
+        """Change the ETag when a common name is linked to another."""
+        idx = Index(name='Perennial Flower')
+        cn = CommonName(name='Foxglove', index=idx)
+        gw = CommonName(name='Butterfly Weed', index=idx)
+        db.session.add_all([cn, gw])
+        db.session.commit()
+        url = url_for('seeds.common_name', idx_slug=idx.slug, cn_slug=cn.slug)
+        with app.test_client() as tc:
+            etag = tc.get(url).headers['ETag']
+            cn.gw_common_names.append(gw)
+            db.session.commit()
+            assert tc.get(url).headers['ETag'] != etag
+
 
 class TestCultivarRouteWithDB:
     """Test seeds.cultivar."""
@@ -1143,3 +1179,35 @@ class TestSelectPacketRouteWithDB:
         assert rv.location == url_for('seeds.edit_packet',
                                       pkt_id=packet.id,
                                       _external=True)
+
+
+class TestSearchRouteWithDB:
+    """Test seeds.search and seeds.search_api."""
+    def test_search_api_ranks_results(self, app, db):
+        """Return public matches from several models, best match first."""
+        idx = Index(name='Annual Flower')
+        cn = CommonName(name='Zinnia', index=idx, visible=True)
+        cn.description = 'Easy to grow, with flowers in every color.'
+        cv = Cultivar(name='Red Spider Zinnia', common_name=cn)
+        cv.description = 'Spidery red flowers.'
+        cv.active = True
+        cv.visible = True
+        hidden = Cultivar(name='Hidden Zinnia', common_name=cn)
+        db.session.add_all([idx, cn, cv, hidden])
+        db.session.commit()
+        with app.test_client() as tc:
+            rv = tc.get(url_for('seeds.search_api', q='zinnia'))
+        data = json.loads(rv.data.decode('utf-8'))
+        assert data['total'] == 2
+        assert sorted(r['name'] for r in data['results']) == [
+            'Red Spider Zinnia', 'Zinnia'
+        ]
+        ranks = [r['rank'] for r in data['results']]
+        assert ranks == sorted(ranks, reverse=True)
+
+    def test_search_no_terms(self, app, db):
+        """Show the search form with no results if no terms are given."""
+        with app.test_client() as tc:
+            rv = tc.get(url_for('seeds.search'))
+        assert rv.status_code == 200
+        assert 'search-results' not in str(rv.data)
@@ -0,0 +1,94 @@
+import datetime
+
+import pytest
+from flask.sessions import session_json_serializer
+
+from app.server_session import ServerSessionInterface, StoredSession
+from tests.conftest import app, db  # noqa
+
+
+@pytest.fixture
+def server_sessions(app, db, request):
+    default = app.session_interface
+    app.session_interface = ServerSessionInterface()
+
+    def teardown():
+        app.session_interface = default
+
+    request.addfinalizer(teardown)
+    return app.session_interface
+
+
+class TestServerSessionInterfaceWithDB:
+    """Test ServerSessionInterface with the database."""
+    def test_cookie_only_holds_session_id(self, app, db, server_sessions):
+        """Store session data in the database instead of the cookie."""
+        cart = [{'product number': 'Z{0}'.format(i), 'quantity': 1}
+                for i in range(20)]
+        with app.test_client() as tc:
+            with tc.session_transaction() as sess:
+                sess['cart'] = cart
+                sid = sess.sid
+            cookie = next(c for c in tc.cookie_jar
+                          if c.name == app.session_cookie_name)
+            assert cookie.value == sid
+            with tc.session_transaction() as sess:
+                assert sess['cart'] == cart
+        stored = StoredSession.query.get(sid)
+        assert session_json_serializer.loads(stored.data)['cart'] == cart
+
+    def test_regenerate_replaces_stored_session(self,
+                                                app,
+                                                db,
+                                                server_sessions):
+        """Move data to a new session id and delete the old one."""
+        with app.test_client() as tc:
+            with tc.session_transaction() as sess:
+                sess['cart'] = ['Z1']
+                old_sid = sess.sid
+            with tc.session_transaction() as sess:
+                sess.regenerate(server_sessions.generate_sid())
+                new_sid = sess.sid
+            cookie = next(c for c in tc.cookie_jar
+                          if c.name == app.session_cookie_name)
+            assert cookie.value == new_sid
+            with tc.session_transaction() as sess:
+                assert sess['cart'] == ['Z1']
+        assert new_sid != old_sid
+        assert StoredSession.query.get(old_sid) is None
+        assert StoredSession.query.get(new_sid) is not None
+
+    def test_sweep(self, db):
+        """Delete only expired sessions."""
+        now = datetime.datetime.utcnow()
+        db.session.add_all([
+            StoredSession(id='old', data='{}',
+                          expires=now - datetime.timedelta(days=1)),
+            StoredSession(id='new', data='{}',
+                          expires=now + datetime.timedelta(days=1))
+        ])
+        db.session.commit()
+        assert StoredSession.sweep() == 1
+        db.session.expire_all()
+        assert [s.id for s in StoredSession.query.all()] == ['new']
+
+    def test_latest_value(self, db):
+        """Get a value from the user's most recently extended session."""
+        now = datetime.datetime.utcnow()
+
+        def stored(sid, user_id, data, days):
+            return StoredSession(id=sid,
+                                 user_id=user_id,
+                                 data=session_json_serializer.dumps(data),
+                                 expires=now + datetime.timedelta(days=days))
+
+        db.session.add_all([
+            stored('phone', 1, {'cart': ['phone']}, 20),
+            stored('laptop', 1, {'cart': ['laptop']}, 30),
+            stored('current', 1, {}, 31),
+            stored('other', 2, {'cart': ['other']}, 31)
+        ])
+        db.session.commit()
+        assert StoredSession.latest_value(1, 'cart', exclude='current') == \
+            ['laptop']
+        assert StoredSession.latest_value(3, 'cart') is None
@@ -0,0 +1,188 @@
+from decimal import Decimal
+from unittest import mock
+
+
+from app.seeds.models import CommonName, Cultivar, Packet
+from app.shop.models import (
+    Address,
+    Country,
+    Customer,
+    Order,
+    PaymentJob,
+    Product
+)
+from app.shop.payments import FakeGateway, process_job, work
+from tests.conftest import app, count_queries, db  # noqa
+
+
+def make_address(**kwargs):
+    address = Address()
+    address.first_name = 'Bilbo'
+    address.last_name = 'Baggins'
+    address.address_line1 = '1 Bagshot Row'
+    address.city = 'Hobbiton'
+    for key, value in kwargs.items():
+        setattr(address, key, value)
+    return address
+
+
+class TestAddressWithDB:
+    """Test Address model methods that need to access the database."""
+    def test_fingerprint_set_on_insert(self, db):
+        """Find an address by the fingerprint of equivalent data."""
+        country = Country(alpha3='USA')
+        address = make_address(country=country)
+        db.session.add(address)
+        db.session.commit()
+        assert address.fingerprint
+        other = make_address(country=country,
+                             first_name='  bilbo ',
+                             address_line1='1  BAGSHOT ROW')
+        assert Address.with_fingerprint(other.make_fingerprint()) is address
+        assert Address.with_fingerprint(
+            make_address(city='Bree').make_fingerprint()
+        ) is None
+
+    def test_with_fingerprint_duplicates(self, db):
+        """Get the oldest of several identical addresses."""
+        first = make_address()
+        db.session.add_all([first, make_address()])
+        db.session.commit()
+        assert Address.with_fingerprint(first.make_fingerprint()) is first
+
+    def test_customers_with_same_name(self, db):
+        """Save customers whose billing addresses only have the same name."""
+        customers = [Customer(), Customer()]
+        for customer in customers:
+            customer.first_name = 'Bilbo'
+            customer.last_name = 'Baggins'
+        db.session.add_all(customers)
+        db.session.commit()
+        assert (customers[0].billing_address.fingerprint ==
+                customers[1].billing_address.fingerprint)
+
+    def test_backfill_fingerprints(self, db):
+        """Fingerprint old addresses, including duplicates."""
+        addresses = [make_address(),
+                     make_address(city='Bywater'),
+                     make_address(city='Bree')]
+        db.session.add_all(addresses)
+        db.session.commit()
+        db.session.query(Address).update({Address.fingerprint: None})
+        db.session.commit()
+        addresses[1].city = 'Hobbiton'
+        db.session.commit()
+        assert addresses[1].fingerprint == addresses[0].make_fingerprint()
+        assert Address.backfill_fingerprints(batch_size=2) == 2
+        assert addresses[0].fingerprint == addresses[1].fingerprint
+        assert addresses[2].fingerprint
+
+
+class TestOrderWithDB:
+    """Test Order model methods that need to access the database."""
+    def test_from_session_data_loads_products_in_one_query(self, db):
+        """Load all products of a cart and their cultivars together."""
+        cn = CommonName(name='Zinnia')
+        data = []
+        for i in range(10):
+            cv = Cultivar(name='Red {0}'.format(i), common_name=cn)
+            cv.in_stock = True
+            cv.taxable = bool(i % 2)
+            cv.packets.append(Packet(sku='Z{0}'.format(i), price='2.99'))
+            product = Product(number='Z{0}'.format(i))
+            product.price = Decimal('2.99')
+            db.session.add_all([cv, product])
+            data.append({'product number': 'Z{0}'.format(i), 'quantity': 1})
+        data.append({'product number': 'GONE', 'quantity': 1})
+        db.session.commit()
+        db.session.expunge_all()
+        with count_queries(db) as statements:
+            order = Order.from_session_data(data)
+            for line in order.lines:
+                line.in_stock
+                line.taxable
+                line.noship
+        assert len(order.lines) == 10
+        assert all(line.in_stock for line in order.lines)
+        assert len(statements) <= 3
+
+
+class TestPaymentJobWithDB:
+    """Test PaymentJob and the payment worker with the database."""
+    def test_enqueue_once_per_order(self, db):
+        """Return the queued job for an order instead of adding another."""
+        order = Order()
+        customer = Customer()
+        db.session.add_all([order, customer])
+        db.session.commit()
+        job = PaymentJob.enqueue(order, customer, 'tok_visa')
+        db.session.commit()
+        assert PaymentJob.enqueue(order, customer, 'tok_visa') is job
+        assert job.idempotency_key == 'order-{0}'.format(order.number)
+
+    def test_work_takes_payments(self, app, db):
+        """Charge queued jobs, retrying temporary errors."""
+        gateway = FakeGateway()
+        jobs = []
+        for token in ('tok_visa', 'tok_error', 'tok_declined'):
+            order = Order()
+            customer = Customer()
+            db.session.add_all([order, customer])
+            db.session.commit()
+            jobs.append(PaymentJob.enqueue(order, customer, token))
+        db.session.commit()
+        assert work(gateway=gateway, once=True) == 4
+        assert [j.status for j in jobs] == [PaymentJob.SUCCEEDED,
+                                            PaymentJob.SUCCEEDED,
+                                            PaymentJob.FAILED]
+        assert jobs[0].order.status == Order.PAID
+        assert jobs[1].attempts == 2
+        assert jobs[2].error
+        assert len(gateway.charges) == 2
+
+    def test_process_job_repeated_charges_once(self, db):
+        """Don't charge twice if a job is processed again."""
+        gateway = FakeGateway()
+        order = Order()
+        customer = Customer()
+        db.session.add_all([order, customer])
+        db.session.commit()
+        job = PaymentJob.enqueue(order, customer, 'tok_visa')
+        db.session.commit()
+        process_job(job, gateway)
+        process_job(job, gateway)
+        assert len(gateway.charges) == 1
+
+    def test_process_job_charges_new_token(self, db):
+        """Charge a returning customer with the card from the new job."""
+        gateway = FakeGateway()
+        customer = Customer()
+        jobs = []
+        for token in ('tok_visa', 'tok_mastercard'):
+            order = Order()
+            db.session.add_all([order, customer])
+            db.session.commit()
+            jobs.append(PaymentJob.enqueue(order, customer, token))
+            db.session.commit()
+            process_job(jobs[-1], gateway)
+        assert len(gateway.customers) == 1
+        assert gateway.customers[customer.stripe_id] == 'tok_mastercard'
+        assert all(j.token_attached for j in jobs)
+
+    def test_work_waits_to_retry(self, app, db):
+        """Don't try a job again until its retry delay has passed."""
+        gateway = FakeGateway()
+        order = Order()
+        customer = Customer()
+        db.session.add_all([order, customer])
+        db.session.commit()
+        job = PaymentJob.enqueue(order, customer, 'tok_error')
+        db.session.commit()
+        with mock.patch.dict(app.config, {'PAYMENT_RETRY_DELAY': 60}):
+            assert work(gateway=gateway, once=True) == 1
+            assert job.status == PaymentJob.QUEUED
+            assert job.next_attempt_at > job.updated_on
+            job.next_attempt_at = None
+            db.session.commit()
+            assert work(gateway=gateway, once=True) == 1
+        assert job.status == PaymentJob.SUCCEEDED
@@ -24,6 +24,27 @@ class TestApp:
         load_nav_data()
         m_get.assert_called_with('JSON_FOLDER')
 
+    def test_load_nav_data_cached(self, tmpdir):
+        """Only parse the file again if it has changed."""
+        nav_file = tmpdir.join('nav_data.json')
+        nav_file.write('[{"Name": "Annual"}]')
+        first = load_nav_data(str(nav_file))
+        assert first == [{'Name': 'Annual'}]
+        with mock.patch('app.json.loads') as m_loads:
+            assert load_nav_data(str(nav_file)) is first
+            assert not m_loads.called
+
+    def test_load_nav_data_reloads_changed_file(self, tmpdir):
+        """Load the new data if the file is replaced."""
+        nav_file = tmpdir.join('nav_data.json')
+        nav_file.write('[{"Name": "Annual"}]')
+        load_nav_data(str(nav_file))
+        new_file = tmpdir.join('new.json')
+        new_file.write('[{"Name": "Perennial"}, {"Name": "Vine"}]')
+        new_file.move(nav_file)
+        assert load_nav_data(str(nav_file)) == [{'Name': 'Perennial'},
+                                                {'Name': 'Vine'}]
+
 
 @pytest.mark.usefixtures('app')
 class TestAnonymous:
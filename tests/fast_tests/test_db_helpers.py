@@ -1,7 +1,8 @@
 from decimal import Decimal
 from unittest import mock
 
-from app.db_helpers import dbify, OrderingListMixin, USDollar
+from app.db_helpers import dbify, OrderingListMixin, StampedCache, USDollar
+from tests.conftest import app  # noqa
 
 
 class TestDbify:
@@ -211,3 +212,18 @@ class TestUSDollar:
         assert USDollar.usd_to_cents('4') == 400
         assert USDollar.usd_to_cents('5.3') == 530
         assert USDollar.usd_to_cents('3.9999') == 399
+
+
+class TestStampedCache:
+    """Test methods of StampedCache."""
+    def test_get_reloads_after_touch(self, app, tmpdir):
+        """Load data once, and again after the stamp file is touched."""
+        load = mock.Mock(side_effect=[1, 2])
+        cache = StampedCache('test.dat', load)
+        with mock.patch.dict(app.config, {'DATA_FOLDER': str(tmpdir)}):
+            assert cache.get() == 1
+            assert cache.get() == 1
+            cache.touch()
+            assert tmpdir.join('test.dat').exists()
+            assert cache.get() == 2
+        assert load.call_count == 2
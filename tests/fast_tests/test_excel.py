@@ -3,11 +3,13 @@ import json
 import pytest
 from io import StringIO
 from unittest import mock
-from openpyxl import Workbook
+from openpyxl import load_workbook, Workbook
 from app.seeds.excel import (
     BotanicalNamesWorksheet,
     CommonNamesWorksheet,
     CultivarsWorksheet,
+    ImportCheckpoint,
+    ImportReport,
     IndexesWorksheet,
     queryable_dicts_to_json,
     PacketsWorksheet,
@@ -67,6 +69,42 @@ class TestExcelFunctions:
             queryable_dicts_to_json((cn1, cn2, idx))
 
 
+class TestImportCheckpoint:
+    """Test methods of ImportCheckpoint and ImportReport."""
+    def test_resume_from_saved_checkpoint(self, tmpdir):
+        """Load the rows saved for an unchanged workbook."""
+        source = tmpdir.join('seeds.xlsx')
+        source.write('data')
+        checkpoint = ImportCheckpoint.for_workbook(str(source))
+        assert not checkpoint.resuming
+        checkpoint.save('Indexes', 42, done=True)
+        checkpoint.save('Common Names', 500)
+        loaded = ImportCheckpoint.for_workbook(str(source))
+        assert loaded.resuming
+        assert loaded.done == {'Indexes'}
+        assert loaded.last_row('Common Names') == 500
+        assert loaded.last_row('Cultivars') == 1
+        loaded.remove()
+        assert not tmpdir.join('seeds.xlsx.checkpoint').exists()
+
+    def test_ignore_checkpoint_of_changed_workbook(self, tmpdir):
+        """Start over if the workbook changed since the checkpoint."""
+        source = tmpdir.join('seeds.xlsx')
+        source.write('data')
+        ImportCheckpoint.for_workbook(str(source)).save('Indexes', 42)
+        source.write('different data')
+        assert not ImportCheckpoint.for_workbook(str(source)).resuming
+
+    def test_report_summary(self):
+        """List each row that could not be saved."""
+        report = ImportReport()
+        report.saved = 3
+        report.add_error('Cultivars', 4, ValueError('Bad date.'))
+        summary = report.summary()
+        assert '3 rows saved' in summary
+        assert 'Cultivars row #4: ValueError: Bad date.' in summary
+
+
 class TestSeedsWorksheet:
     """Test methods of the SeedsWorksheet container class.
 
@@ -323,6 +361,22 @@ class TestSeedsWorksheet:
         assert sws._ws.column_dimensions['C'].width == 42
         assert sws._ws.row_dimensions[2].height == 21
 
+    def test_add_does_not_rescan_rows(self):
+        """Keep the row cache up to date as rows are added."""
+        wb = Workbook()
+        iws = IndexesWorksheet(wb.active)
+        iws.setup()
+        with mock.patch.object(wb.active, 'iter_rows',
+                               wraps=wb.active.iter_rows) as m_ir:
+            iws.add([Index(name='Index {0}'.format(i)) for i in range(50)],
+                    stream=StringIO())
+        assert m_ir.call_count <= 1
+        assert iws.active_row == 52
+        assert len(iws.data_rows) == 50
+        assert iws.cell(51, 1).value == 'Index 49'
+        iws._ws['A52'].value = 'Added elsewhere'
+        assert iws.active_row == 53
+
 
 class TestIndexesWorksheet:
     """Test methods of the IndexesWorksheet container class."""
@@ -1019,3 +1073,34 @@ class TestSeedsWorkbook:
         swb = SeedsWorkbook()
         swb.save('file.xlsx')
         m_s.assert_called_with('file.xlsx')
+
+    def test_write_only_and_read_only_round_trip(self, tmpdir):
+        """Stream rows to a file, then read them back one row at a time."""
+        filename = str(tmpdir.join('streamed.xlsx'))
+        swb = SeedsWorkbook(write_only=True)
+        swb.indexes.add([Index(name='Annual', description='Not perennial.'),
+                         Index(name='Perennial')],
+                        stream=StringIO())
+        assert swb.indexes.active_row == 4
+        with pytest.raises(ValueError):
+            swb.indexes.cell(2, 1)
+        swb.save(filename)
+        swb = SeedsWorkbook()
+        swb.load(filename, read_only=True)
+        idx = swb.indexes
+        assert idx.cols == {'Index': 1, 'Description': 2}
+        rows = [(idx.cell(r, idx.cols['Index']).value,
+                 idx.cell(r, idx.cols['Description']).value)
+                for r in idx.data_row_numbers()]
+        assert rows == [('Annual', 'Not perennial.'), ('Perennial', None)]
+
+    def test_write_only_column_widths(self, tmpdir):
+        """Save column widths of write-only sheets to the file."""
+        filename = str(tmpdir.join('streamed.xlsx'))
+        swb = SeedsWorkbook(write_only=True)
+        swb.indexes.add([Index(name='Annual')], stream=StringIO())
+        swb.beautify_all_sheets()
+        swb.save(filename)
+        wb = load_workbook(filename)
+        assert wb['Indexes'].column_dimensions['B'].width == \
+            SeedsWorksheet.COLUMN_WIDTH
@@ -0,0 +1,129 @@
+import pytest
+from unittest import mock
+from app.page_cache import page_key, PageCache
+from tests.conftest import app  # noqa
+
+
+@pytest.fixture(scope='function')
+def caching(app, request):
+    app.config['CACHE_PAGES'] = True
+
+    def teardown():
+        app.config['CACHE_PAGES'] = False
+
+    request.addfinalizer(teardown)
+    return app
+
+
+class TestPageKey:
+    """Test page_key from the page_cache module."""
+    def test_page_key_sorts_kwargs(self):
+        """Return the same key regardless of keyword order."""
+        assert page_key('seeds.common_name', idx_slug='a', cn_slug='b') ==\
+            page_key('seeds.common_name', cn_slug='b', idx_slug='a')
+
+
+class TestPageCache:
+    """Test methods of PageCache from the page_cache module."""
+    def test_get_and_set(self, caching, tmpdir):
+        """Return html set for a key, or None if no html is set."""
+        pc = PageCache()
+        pc.log_file = str(tmpdir.join('page_cache.log'))
+        key = page_key('seeds.index', idx_slug='annual-flower')
+        with caching.test_request_context():
+            assert pc.get(key) is None
+            pc.set(key, '<p>Annual Flowers</p>')
+            assert pc.get(key) == '<p>Annual Flowers</p>'
+
+    def test_validators_stored_with_page(self, caching, tmpdir):
+        """Keep validators only while the page they belong to is cached."""
+        pc = PageCache()
+        pc.log_file = str(tmpdir.join('page_cache.log'))
+        key = page_key('seeds.index', idx_slug='annual-flower')
+        with caching.test_request_context():
+            pc.set_validators(key, ('changed', 'rows'))
+            assert pc.get_validators(key) is None
+            pc.set(key, '<p>Annual Flowers</p>')
+            pc.set_validators(key, ('changed', 'rows'))
+            assert pc.get_validators(key) == ('changed', 'rows')
+            generation = pc.generation
+            pc.invalidate([key])
+            assert pc.get_validators(key) is None
+            assert pc.generation > generation
+
+    def test_invalidate_partial_key(self, caching, tmpdir):
+        """Drop all pages matching the given arguments, and no others."""
+        pc = PageCache()
+        pc.log_file = str(tmpdir.join('page_cache.log'))
+        cv1 = page_key('seeds.cultivar',
+                       idx_slug='annual-flower',
+                       cn_slug='zinnia',
+                       cv_slug='red')
+        cv2 = page_key('seeds.cultivar',
+                       idx_slug='annual-flower',
+                       cn_slug='zinnia',
+                       cv_slug='blue')
+        cv3 = page_key('seeds.cultivar',
+                       idx_slug='annual-flower',
+                       cn_slug='cosmos',
+                       cv_slug='red')
+        with caching.test_request_context():
+            for key in (cv1, cv2, cv3):
+                pc.set(key, 'html')
+            pc.invalidate([page_key('seeds.cultivar',
+                                    idx_slug='annual-flower',
+                                    cn_slug='zinnia')])
+            assert pc.get(cv1) is None
+            assert pc.get(cv2) is None
+            assert pc.get(cv3) == 'html'
+
+    def test_sync_applies_other_process_invalidations(self, caching, tmpdir):
+        """Drop pages invalidated by another PageCache sharing the log."""
+        log_file = str(tmpdir.join('page_cache.log'))
+        pc1 = PageCache()
+        pc1.log_file = log_file
+        pc2 = PageCache()
+        pc2.log_file = log_file
+        idx = page_key('seeds.index', idx_slug='annual-flower')
+        bulk = page_key('seeds.bulk')
+        with caching.test_request_context():
+            pc2.set(idx, 'html')
+            pc2.set(bulk, 'html')
+            pc1.invalidate([idx])
+            pc2.sync()
+            assert pc2.get(idx) is None
+            assert pc2.get(bulk) == 'html'
+            pc1.clear()
+            pc2.sync()
+            assert pc2.get(bulk) is None
+
+    def test_disabled(self, app, tmpdir):
+        """Don't write to the log if CACHE_PAGES is not set."""
+        pc = PageCache()
+        pc.log_file = str(tmpdir.join('page_cache.log'))
+        pc.clear()
+        assert not tmpdir.join('page_cache.log').exists()
+
+    @mock.patch('app.page_cache.current_user')
+    def test_cached_skips_logged_in_users(self, m_cu, caching, tmpdir):
+        """Render pages for logged in users every time without caching."""
+        pc = PageCache()
+        pc.log_file = str(tmpdir.join('page_cache.log'))
+        calls = []
+
+        def view(**kwargs):
+            calls.append(kwargs)
+            return '<p>Hello, Bilbo</p>'
+
+        cached_view = pc.cached(view)
+        m_cu.is_authenticated = True
+        with caching.test_request_context('/annual-flower'):
+            cached_view(idx_slug='annual-flower')
+            cached_view(idx_slug='annual-flower')
+        assert len(calls) == 2
+        assert not pc.pages
+        m_cu.is_authenticated = False
+        with caching.test_request_context('/annual-flower'):
+            cached_view(idx_slug='annual-flower')
+            cached_view(idx_slug='annual-flower')
+        assert len(calls) == 3
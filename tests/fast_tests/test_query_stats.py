@@ -0,0 +1,34 @@
+from app.query_stats import RequestQueries, statement_shape
+
+
+class TestStatementShape:
+    """Test statement_shape from the query_stats module."""
+    def test_statement_shape_ignores_whitespace_and_literals(self):
+        """Give statements differing only in spacing and values one shape."""
+        a = 'SELECT * FROM packets\n  WHERE packets.cultivar_id = 12'
+        b = "SELECT * FROM packets WHERE packets.cultivar_id = 7"
+        c = "SELECT * FROM packets WHERE packets.sku = 'ABC'"
+        assert statement_shape(a) == statement_shape(b)
+        assert statement_shape(c) == \
+            'SELECT * FROM packets WHERE packets.sku = ?'
+
+
+class TestRequestQueries:
+    """Test methods of RequestQueries from the query_stats module."""
+    def test_add(self):
+        """Count queries and add up their durations."""
+        rq = RequestQueries()
+        rq.add('SELECT 1', 0.25)
+        rq.add('SELECT 2', 0.5)
+        assert rq.count == 2
+        assert rq.duration == 0.75
+
+    def test_repeated(self):
+        """Return shapes run at least as many times as threshold."""
+        rq = RequestQueries()
+        lazy = 'SELECT * FROM images WHERE images.id = %(param_1)s'
+        for i in range(6):
+            rq.add(lazy, 0.01)
+        rq.add('SELECT * FROM common_names', 0.01)
+        assert rq.repeated(5) == [(lazy, 6)]
+        assert rq.repeated(7) == []
@@ -0,0 +1,57 @@
+from unittest import mock
+from app.seeds.suggest import normalize, SuggestIndex, word_starts
+from tests.conftest import app  # noqa
+
+
+class TestModuleLevelFunctions:
+    """Test module-level functions in app.seeds.suggest."""
+    def test_normalize(self):
+        """Lowercase text and remove tags and punctuation."""
+        assert normalize('<i>Zinnia  elegans</i>, ') == 'zinnia elegans'
+
+    def test_word_starts(self):
+        """Return text starting at each word."""
+        assert word_starts('Red Spider Zinnia') == [
+            'red spider zinnia', 'spider zinnia', 'zinnia'
+        ]
+
+
+class TestSuggestIndex:
+    """Test methods of SuggestIndex."""
+    def make_index(self):
+        si = SuggestIndex()
+        si.entries = []
+        si._add(('cultivar', 1),
+                ({'type': 'cultivar', 'name': 'Red Spider Zinnia'},
+                 ['Red Spider Zinnia', 'Zinnia elegans']))
+        si._add(('common name', 2),
+                ({'type': 'common name', 'name': 'Zinnia'}, ['Zinnia']))
+        si._add(('common name', 3),
+                ({'type': 'common name', 'name': 'Cosmos'}, ['Cosmos']))
+        si.entries.sort()
+        return si
+
+    @mock.patch('app.seeds.suggest.StampFile.version', return_value=None)
+    def test_suggest_prefix_of_any_word(self, m_stamp, app):
+        """Suggest items with any word starting with the prefix, once each."""
+        si = self.make_index()
+        names = [s['name'] for s in si.suggest('zin')]
+        assert names == ['Zinnia', 'Red Spider Zinnia']
+        assert [s['name'] for s in si.suggest('spi')] == ['Red Spider Zinnia']
+        assert si.suggest('tomato') == []
+
+    @mock.patch('app.seeds.suggest.StampFile.version', return_value=None)
+    def test_suggest_limit(self, m_stamp, app):
+        """Return no more than limit suggestions."""
+        si = self.make_index()
+        assert len(si.suggest('z', limit=1)) == 1
+
+    def test_remove(self):
+        """Remove all entries for an item."""
+        si = self.make_index()
+        si._remove(('cultivar', 1))
+        assert not [e for e in si.entries if e[1:] == ('cultivar', 1)]
+        assert ('cultivar', 1) not in si.items
+        assert ('cultivar', 1) not in si.keys
+        assert si.entries == [('cosmos', 'common name', 3),
+                              ('zinnia', 'common name', 2)]
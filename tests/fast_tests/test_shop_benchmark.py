@@ -0,0 +1,42 @@
+from app.shop.benchmark import (
+    address_data,
+    CheckoutBenchmark,
+    EndpointStats,
+    percentile
+)
+
+
+class TestPercentile:
+    """Test the percentile function from the benchmark module."""
+    def test_nearest_rank(self):
+        """Return the value at the nearest rank."""
+        values = list(range(1, 101))
+        assert percentile(values, 50) == 50
+        assert percentile(values, 99) == 99
+        assert percentile(values, 100) == 100
+        assert percentile([3, 1, 2], 0) == 1
+        assert percentile([], 50) is None
+
+
+class TestCheckoutBenchmark:
+    """Test methods of CheckoutBenchmark from the benchmark module."""
+    def test_report(self):
+        """List stats of each endpoint in a table."""
+        benchmark = CheckoutBenchmark(None, [])
+        stats = benchmark.stats.setdefault('GET shop.cart', EndpointStats())
+        stats.latencies.extend([0.01, 0.02, 0.03])
+        stats.queries.extend([4, 5, 6])
+        stats.errors = 1
+        summary = stats.summary()
+        assert summary['requests'] == 3
+        assert summary['queries_avg'] == 5
+        lines = benchmark.report().splitlines()
+        assert lines[0].split()[0] == 'endpoint'
+        assert lines[1].split() == ['GET', 'shop.cart', '3', '1', '20.0',
+                                    '30.0', '30.0', '30.0', '5.0']
+
+    def test_address_data(self):
+        """Prefix address fields for use in FormFields."""
+        data = address_data(7)
+        assert data['address-last_name'] == '7'
+        assert data['address-country'] == 'USA'
@@ -0,0 +1,53 @@
+from unittest import mock
+
+from app.shop.geography import Geography
+
+
+def make_country(id, alpha3, name, noship=False, states=()):
+    country = mock.MagicMock()
+    country.id = id
+    country.alpha2 = alpha3[:2]
+    country.alpha3 = alpha3
+    country.name = name
+    country.noship = noship
+    country.safe_to_ship = True
+    country.at_own_risk_threshold = None
+    country.states = []
+    for i, (abbr, state_name) in enumerate(states):
+        state = mock.MagicMock()
+        state.id = id * 100 + i
+        state.abbreviation = abbr
+        state.name = state_name
+        state.tax = None
+        country.states.append(state)
+    return country
+
+
+class TestGeography:
+    """Test methods of Geography from the geography module."""
+    def test_choices(self):
+        """Prebuild choices for country and state select fields."""
+        geo = Geography([
+            make_country(1, 'USA', 'United States',
+                         states=[('CA', 'California'), ('OR', 'Oregon')]),
+            make_country(2, 'CAN', 'Canada', states=[('BC', 'British '
+                                                            'Columbia')]),
+            make_country(3, 'PRK', 'North Korea', noship=True)
+        ])
+        assert geo.country_choices == (('USA', 'United States'),
+                                       ('CAN', 'Canada'),
+                                       ('PRK', 'North Korea'))
+        assert geo.shippable_country_choices == (('USA', 'United States'),
+                                                 ('CAN', 'Canada'))
+        assert geo.state_choices['USA'] == (('0', 'Select a state:'),
+                                            ('CA', 'California'),
+                                            ('OR', 'Oregon'))
+        assert geo.state_choices['AUS'] == (('0', 'Select a state:'),)
+
+    def test_get_state(self):
+        """Return StateData for a listed state, or None."""
+        geo = Geography([make_country(1, 'USA', 'United States',
+                                      states=[('CA', 'California')])])
+        assert geo.get_state('USA', 'CA').name == 'California'
+        assert geo.get_state('USA', 'ZZ') is None
+        assert geo.get_state('CAN', 'BC') is None
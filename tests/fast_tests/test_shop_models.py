@@ -0,0 +1,63 @@
+from decimal import Decimal
+from unittest import mock
+
+from flask import session
+
+from app.shop.models import cart_summary, LineItem, Order, Product
+from tests.conftest import app  # noqa
+
+
+def make_product(number, price):
+    product = Product(number=number)
+    product.label = 'Product {0}'.format(number)
+    product.price = Decimal(price)
+    return product
+
+
+class TestCartSummary:
+    """Test cart_summary and the methods of Order that save it."""
+    def test_save_to_session_saves_summary(self, app):
+        """Save the item count and subtotal along with the cart lines."""
+        order = Order(lines=[
+            LineItem(product=make_product('A1', '2.50'), quantity=2),
+            LineItem(product=make_product('B2', '1.99'), quantity=1)
+        ])
+        with app.test_request_context():
+            order.save_to_session()
+            assert cart_summary() == {'items': 3,
+                                      'subtotal': '6.99',
+                                      'version': 1}
+            order.save_summary()
+            assert cart_summary()['version'] == 2
+
+    def test_cart_summary_without_saved_summary(self, app):
+        """Count items in the session cart if no summary was saved."""
+        with app.test_request_context():
+            assert cart_summary()['items'] == 0
+            session['cart'] = [{'product number': 'A1', 'quantity': 4},
+                               {'product number': 'B2', 'quantity': 1}]
+            assert cart_summary()['items'] == 5
+
+
+class TestOrderPricing:
+    """Test OrderPricing and the Order properties that use it."""
+    @mock.patch('app.shop.models.LineItem.taxable',
+                new_callable=mock.PropertyMock)
+    @mock.patch('app.shop.models.LineItem.total',
+                new_callable=mock.PropertyMock)
+    def test_pricing_reused_until_lines_change(self, m_total, m_taxable):
+        """Only total lines again if the order has changed."""
+        m_total.return_value = Decimal('5.00')
+        m_taxable.return_value = False
+        order = Order(lines=[
+            LineItem(product=make_product('A1', '2.50'), quantity=2)
+        ])
+        assert order.total == Decimal('5.00')
+        assert order.before_tax_total == Decimal('5.00')
+        assert order.tax == Decimal(0)
+        assert order.shipping_cost == Decimal(0)
+        assert order.line_total(order.lines[0]) == Decimal('5.00')
+        assert m_total.call_count == 1
+        order.lines[0].quantity = 3
+        order.total
+        assert m_total.call_count == 2
@@ -0,0 +1,27 @@
+from app.shop.noship import NoshipMatrix
+
+
+class TestNoshipMatrix:
+    """Test methods of NoshipMatrix from the noship module."""
+    def test_init_groups_rows(self):
+        """Group states and countries by cultivar."""
+        matrix = NoshipMatrix([(1, 'state', 5),
+                               (1, 'state', 6),
+                               (1, 'country', 2),
+                               (3, 'state', 5)])
+        assert matrix.states == {1: frozenset([5, 6]), 3: frozenset([5])}
+        assert matrix.countries == {1: frozenset([2])}
+
+    def test_check_cart(self):
+        """Return cultivars which can't ship, and why."""
+        matrix = NoshipMatrix([(1, 'state', 5),
+                               (2, 'country', 9),
+                               (3, 'state', 6)])
+        assert matrix.check_cart([1, 2, 3, 4], country_id=9, state_id=5) == \
+            {1: 'state', 2: 'country'}
+        assert matrix.check_cart([1, 2, 3, 4], country_id=1, state_id=7) == {}
+
+    def test_shippable(self):
+        """Return cultivars which can ship, keeping their order."""
+        matrix = NoshipMatrix([(2, 'state', 5)])
+        assert matrix.shippable([3, 2, 1], state_id=5) == [3, 1]
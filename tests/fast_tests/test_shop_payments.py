@@ -0,0 +1,28 @@
+import pytest
+
+from app.shop.payments import FakeGateway, PaymentDeclined
+
+
+class TestFakeGateway:
+    """Test methods of FakeGateway from the payments module."""
+    def test_charge_is_idempotent(self):
+        """Return the first charge when a charge is repeated."""
+        gateway = FakeGateway()
+        customer_id = gateway.create_customer('tok_visa')
+        first = gateway.charge(customer_id, 1000, 'order-1-0')
+        assert gateway.charge(customer_id, 1000, 'order-1-0') == first
+        assert gateway.charge(customer_id, 1000, 'order-1-1') != first
+        assert len(gateway.charges) == 2
+
+    def test_decline(self):
+        """Raise PaymentDeclined for declined tokens."""
+        with pytest.raises(PaymentDeclined):
+            FakeGateway().create_customer('tok_declined')
+
+    def test_temporary_error(self):
+        """Fail once for 'tok_error' tokens, then succeed."""
+        gateway = FakeGateway()
+        customer_id = gateway.create_customer('tok_error')
+        with pytest.raises(ConnectionError):
+            gateway.charge(customer_id, 1000, 'order-1-0')
+        assert gateway.charge(customer_id, 1000, 'order-1-0')
@@ -0,0 +1,88 @@
+import json
+import os
+from decimal import Decimal
+
+import pytest
+
+from app.shop.rates import parse_rates, RatesError, ShippingRates
+from tests.conftest import app  # noqa
+
+
+RATES = {
+    'US shipping': 4.95,
+    'international shipping': 6.95,
+    'free US shipping threshold': 40,
+    'sales tax': {'USA': {'CA': 8.75}}
+}
+
+
+@pytest.fixture(scope='function')
+def rates_folder(app, tmpdir, request):
+    old = app.config['JSON_FOLDER']
+    app.config['JSON_FOLDER'] = str(tmpdir)
+    tmpdir.join('rates.json').write(json.dumps(RATES))
+
+    def teardown():
+        app.config['JSON_FOLDER'] = old
+
+    request.addfinalizer(teardown)
+    return tmpdir
+
+
+class TestParseRates:
+    """Test parse_rates from the rates module."""
+    def test_parse_rates_converts_to_decimal(self):
+        """Return dollars and tax rates as Decimal."""
+        rates = parse_rates(RATES)
+        assert rates['US shipping'] == Decimal('4.95')
+        assert rates['free US shipping threshold'] == Decimal('40.00')
+        assert rates['sales tax'] == {'USA': {'CA': Decimal('8.7500')}}
+        assert rates['international rates'] == {}
+
+    def test_parse_rates_bad_data(self):
+        """Raise RatesError given missing, unknown, or invalid rates."""
+        with pytest.raises(RatesError):
+            parse_rates({'US shipping': 4.95})
+        with pytest.raises(RatesError):
+            parse_rates(dict(RATES, **{'US shiping': 4.95}))
+        with pytest.raises(RatesError):
+            parse_rates(dict(RATES, **{'US shipping': 'free'}))
+        with pytest.raises(RatesError):
+            parse_rates(dict(RATES, **{'international shipping': -1}))
+
+
+class TestShippingRates:
+    """Test methods of ShippingRates from the rates module."""
+    def test_get_reloads_changed_file(self, rates_folder):
+        """Load rates again only when the file changes."""
+        sr = ShippingRates()
+        assert sr['US shipping'] == Decimal('4.95')
+        rates_file = rates_folder.join('rates.json')
+        rates_file.write(json.dumps(dict(RATES, **{'US shipping': 5.95})))
+        os.utime(str(rates_file), ns=(0, sr.version + 1))
+        assert sr['US shipping'] == Decimal('5.95')
+
+    def test_get_keeps_last_good_rates(self, rates_folder):
+        """Keep using loaded rates if the file is changed to bad rates."""
+        sr = ShippingRates()
+        sr.get()
+        rates_file = rates_folder.join('rates.json')
+        rates_file.write('{"US shipping": 4.95')
+        os.utime(str(rates_file), ns=(0, sr.version + 1))
+        assert sr['US shipping'] == Decimal('4.95')
+
+    def test_save(self, rates_folder):
+        """Save changed rates to the file and use them."""
+        sr = ShippingRates()
+        sr.save({'US shipping': Decimal('3.50')})
+        assert sr['US shipping'] == Decimal('3.50')
+        assert ShippingRates()['sales tax'] == {
+            'USA': {'CA': Decimal('8.7500')}
+        }
+
+    def test_shipping_cost(self, rates_folder):
+        """Charge for US orders under the threshold and all others."""
+        sr = ShippingRates()
+        assert sr.shipping_cost('USA', Decimal('10.00')) == Decimal('4.95')
+        assert sr.shipping_cost('USA', Decimal('40.00')) == Decimal('0.00')
+        assert sr.shipping_cost('CAN', Decimal('10.00')) == Decimal('6.95')
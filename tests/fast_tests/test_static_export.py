@@ -0,0 +1,16 @@
+from pathlib import Path
+from app.static_export import page_file
+
+
+class TestPageFile:
+    """Test page_file from the static_export module."""
+    def test_page_file_html(self):
+        """Save pages ending in .html under the same name."""
+        assert page_file('/srv/site', '/annual-flower/zinnia.html') == \
+            Path('/srv/site/annual-flower/zinnia.html')
+
+    def test_page_file_folder(self):
+        """Save pages ending in / as index.html in that folder."""
+        assert page_file('/srv/site', '/annual-flower/') == \
+            Path('/srv/site/annual-flower/index.html')
+        assert page_file('/srv/site', '/') == Path('/srv/site/index.html')